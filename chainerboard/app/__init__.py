@@ -2,11 +2,12 @@
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
-__all__ = ["app", "timeline_handler"]
+__all__ = ["app", "timeline_handler", "runs", "get_timeline_handler"]
 
-from flask import Flask
+from flask import Flask, abort
 
 import chainerboard as _chainerboard
+from chainerboard.runs import RunRegistry
 
 
 app = Flask(
@@ -20,7 +21,34 @@ app.debug = True
 
 timeline_handler = _chainerboard.TimelineHandler()
 
+# Runs of the multi-run mode
+runs = RunRegistry()
+
+
+def get_timeline_handler(run_id=None, subscribe=False):
+    """
+    Get the handler of a run, aborting with 404 if it does not exist.
+
+    Args:
+        run_id (str): Run ID or None (or empty) for the handler of the
+            single-run mode.
+        subscribe (bool): Whether to keep the run loaded until
+            ``runs.unsubscribe`` is called with the handler.
+
+    Returns:
+        chainerboard.TimelineHandler
+
+    """
+    if not run_id:
+        return timeline_handler
+    try:
+        return runs.get(run_id, subscribe)
+    except KeyError:
+        abort(404)
+
 # imports on bottom to avoid import loops
 import chainerboard.app.root
 import chainerboard.app.events
 import chainerboard.app.histograms
+import chainerboard.app.listing
+import chainerboard.app.stream
@@ -2,77 +2,406 @@
 from __future__ import absolute_import, division, print_function
 
 import logging
-from collections import defaultdict
+import threading
 import warnings
 
-from flask import jsonify, request
+from flask import abort, jsonify, request
 import numpy as np
 import six
 
-from chainerboard import util
-from chainerboard.app import app, timeline_handler
+from chainerboard import series, util
+from chainerboard.app import app, get_timeline_handler
+from chainerboard.app.listing import list_graphs
+from chainerboard.app.serialize import array_encoding, cached_dumps, \
+    conditional_response, encoded_cache, jsonify as jsonify_columns
 
 
 logger = logging.getLogger(__name__)
 
+# Downsampled series keyed by (session id, graph id, state hash, max points)
+_downsampled = util.LRUCache(256)
+# Pairs of generation and smoother keyed by (session id, graph id, spec)
+_smoothers = util.LRUCache(256)
+# Smoothers are shared among requests and extended in place
+_smoothers_lock = threading.Lock()
+# Serialized responses keyed by (session id, graph id, state hash, query)
+_encoded = encoded_cache(1024, 64 * 1024 * 1024)
+
 
 def _cleanse_plots(x, y):
     """
-    Replace NaN, inf or large number that cause harm to 'nan' (str)
+    Replace NaN, inf or large number that cause harm to NaN, which is
+    serialized as ``null``.
 
     Accoding to ecma-262, largest possible value is 1.7976931348623157e308.
     Let's make anything above 1.0e308 infinity.
 
-    Plotly can properly handle 'nan'.
+    Plotly can properly handle ``null`` as a gap.
 
     Args:
-        x (list): index value of the timeline. We do not check for
+        x (numpy.ndarray): index value of the timeline. We do not check for
             invalid value within x.
-        y (list of float): Metric value to visualive.
+        y (numpy.ndarray): Metric value to visualive.
 
     Returns:
-        list: cleaned y
+        numpy.ndarray: cleaned y (float), which is always a new array
 
     """
-    _FLOAT_CUTOFF_MAX = np.float(1.7976931348623157e308)
-    _FLOAT_CUTOFF_MIN = np.float(-1.7976931348623159e308)
+    _FLOAT_CUTOFF_MAX = float(1.7976931348623157e308)
+    _FLOAT_CUTOFF_MIN = float(-1.7976931348623159e308)
     x = np.asarray(x)
-    y = np.asarray(y)
+    y = np.asarray(y, dtype=np.float64)
     assert len(x) == len(y)
     mask = np.isfinite(y)
     with warnings.catch_warnings():
         warnings.simplefilter("ignore", category=RuntimeWarning)
         if np.isfinite(_FLOAT_CUTOFF_MAX):
-            mask = np.logical_and(mask, y <= _FLOAT_CUTOFF_MAX)
+            mask &= y <= _FLOAT_CUTOFF_MAX
         if np.isfinite(_FLOAT_CUTOFF_MIN):
-            mask = np.logical_and(mask, y >= _FLOAT_CUTOFF_MIN)
-    return [y[i] if mask[i] else 'nan'
-            for i in six.moves.xrange(len(y))]
+            mask &= y >= _FLOAT_CUTOFF_MIN
+    return np.where(mask, y, np.nan)
+
+
+def _smooth(snapshot, timeline, graph_id, spec, idx=None):
+    """
+    Smooth values of ``timeline``, extending the cached smoothed values
+    if only points were appended since the last request.
+
+    Args:
+        idx: Indices or slice of the smoothed values to return.
+
+    Returns:
+        tuple: Copy of the smoothed values (numpy.ndarray) and the number
+        of the last values that may change as points are appended (int).
+
+    """
+    key = (snapshot.session_id, graph_id, spec)
+    with _smoothers_lock:
+        cached = _smoothers.get(key)
+        if cached is None or cached[0] != timeline.generation:
+            cached = (timeline.generation, series.Smoother.from_spec(spec))
+            _smoothers.put(key, cached)
+        smoother = cached[1]
+        smoothed = smoother.update(timeline.value)
+        if idx is not None:
+            smoothed = smoothed[idx]
+        # Other requests may extend it in place afterwards
+        return np.array(smoothed), smoother.lookback
+
+
+def _query_points(snapshot, timeline, graph_id, cursor, max_points,
+                  smoothing):
+    """
+    Get points of ``timeline`` appended since ``cursor``, downsampling them
+    if there are more than ``max_points``.
+
+    Returns:
+        dict: Response of ``/events/data``.
+
+    """
+    if max_points is not None and len(timeline) > max_points:
+        key = (snapshot.session_id, graph_id, timeline.state_hash,
+               max_points)
+        cached = _downsampled.get(key)
+        if cached is None:
+            idx = series.minmax_indices(timeline.value, max_points)
+            if idx is None:
+                idx = np.arange(len(timeline))
+            x = timeline.iteration[idx]
+            cached = (idx, x, _cleanse_plots(x, timeline.value[idx]))
+            _downsampled.put(key, cached)
+        idx, x, y = cached
+        offset = 0
+        cursor = None
+    else:
+        idx = None
+        offset = timeline.offset_of(cursor)
+        x = timeline.iteration[offset:]
+        y = _cleanse_plots(x, timeline.value[offset:])
+        cursor = timeline.cursor
+    data = {
+        'exists': True,
+        'x': x,
+        'y': y,
+        'offset': offset,
+        'full': offset == 0,
+        'downsampled': cursor is None,
+        'cursor': cursor,
+        'stateHash': timeline.state_hash,
+        'range': False
+    }
+    if smoothing is not None:
+        if idx is None:
+            lookback = series.Smoother.from_spec(smoothing).lookback
+            # Smoothed values of the last points may have been changed
+            smoothed_offset = max(offset - lookback, 0)
+            smoothed, _ = _smooth(snapshot, timeline, graph_id, smoothing,
+                                  slice(smoothed_offset, None))
+        else:
+            smoothed_offset = 0
+            smoothed, _ = _smooth(snapshot, timeline, graph_id, smoothing,
+                                  idx)
+        # Serialization writes non-finite as null
+        data['smoothed'] = smoothed
+        data['smoothedOffset'] = smoothed_offset
+    return data
+
+
+def _query_range(snapshot, timeline, graph_id, xmin, xmax, width,
+                 smoothing):
+    """
+    Aggregate points of ``timeline`` within a range of iterations with its
+    pyramid.
+
+    Args:
+        timeline (chainerboard.timeline.ScalarTimeline): Timeline to query.
+        xmin (float): Minimum iteration or None for the first point.
+        xmax (float): Maximum iteration or None for the last point.
+        width (int): Maximum number of buckets.
+        smoothing (str): Smoothing spec or None.
+
+    Returns:
+        dict: Response of a range query of ``/events/data``.
+
+    """
+    iteration = timeline.iteration
+    start = 0
+    stop = len(iteration)
+    # Include one more point at each end so that lines reach the edges
+    if xmin is not None:
+        start = max(np.searchsorted(iteration, xmin, side='left') - 1, 0)
+    if xmax is not None:
+        stop = min(np.searchsorted(iteration, xmax, side='right') + 1, stop)
+    level, idx, mins, maxs, means = timeline.pyramid.query(
+        int(start), int(stop), max(width, 1), timeline.value)
+    x = iteration[idx]
+    data = {
+        'exists': True,
+        'x': x,
+        'y': _cleanse_plots(x, means),
+        'yMin': _cleanse_plots(x, mins),
+        'yMax': _cleanse_plots(x, maxs),
+        'level': level,
+        'offset': 0,
+        'full': True,
+        'downsampled': level > 0,
+        'cursor': None,
+        'stateHash': timeline.state_hash,
+        'range': True
+    }
+    if smoothing is not None:
+        # Smoothed values at the first point of each bucket
+        smoothed = _smooth(snapshot, timeline, graph_id, smoothing, idx)[0]
+        data['smoothed'] = smoothed
+        data['smoothedOffset'] = 0
+    return data
+
+
+_QUERY_KEYS = ('cursor', 'maxPoints', 'xmin', 'xmax', 'width', 'smoothing')
+
+
+def _validate_query(query):
+    """ Abort with 400 if parameters of ``/events/data`` are invalid. """
+    try:
+        for k in ('maxPoints', 'width'):
+            if query[k] is not None:
+                query[k] = int(query[k])
+                if query[k] < 1:
+                    raise ValueError("%s must be positive: %d" %
+                                     (k, query[k]))
+        for k in ('xmin', 'xmax'):
+            if query[k] is not None:
+                query[k] = float(query[k])
+        if query['smoothing'] is not None:
+            series.Smoother.from_spec(query['smoothing'])
+    except (TypeError, ValueError) as e:
+        logger.debug(str(e))
+        abort(400)
+
+
+def _response_key(snapshot, graph_id, query):
+    """
+    Key of the response of a graph to ``query``, which changes whenever the
+    graph does.
+    """
+    timeline = snapshot.events[graph_id]
+    return (snapshot.session_id, graph_id, timeline.state_hash) + tuple(
+        query[k] for k in _QUERY_KEYS)
+
+
+def _query(snapshot, graph_id, query):
+    """
+    Get points of a graph as requested by parameters of ``/events/data``.
+
+    Args:
+        snapshot (chainerboard.timeline_handler.Snapshot): Snapshot of the
+            timelines to read.
+
+    Returns:
+        dict: Response of ``/events/data``.
+
+    """
+    timeline = snapshot.events[graph_id]
+    if query['xmin'] is not None or query['xmax'] is not None:
+        width = query['width'] or query['maxPoints'] or 1000
+        return _query_range(snapshot, timeline, graph_id, query['xmin'],
+                            query['xmax'], width, query['smoothing'])
+    return _query_points(snapshot, timeline, graph_id, query['cursor'],
+                         query['maxPoints'], query['smoothing'])
 
 
 @app.route('/events/data', methods=['GET'])
 def get_events_data():
+    """
+    Get points of a graph.
+
+    Parameters
+        graphId (str): Graph ID.
+        sessionId (str): Session ID.
+        runId (str): Optional run ID in the multi-run mode.
+        cursor (str): Optional cursor given by the previous response. Only
+            the points appended since then are returned if it is given.
+        maxPoints (int): Optional maximum number of points to return. Longer
+            series are downsampled by keeping minimum and maximum of each
+            bucket. Downsampled series are always returned in full.
+        xmin, xmax (float): Optional range of iterations to return, e.g. a
+            zoomed range. Points in the range (and one point outside of
+            each end) are aggregated into at most ``width`` buckets.
+        width (int): Maximum number of buckets of a range query. Defaults
+            to ``maxPoints`` or 1000.
+        smoothing (str): Optional smoothing spec; ``ma:<window>`` for a
+            centered moving average or ``ema:<alpha>`` for an exponential
+            moving average. Smoothing restarts after invalid values.
+        arrays (str): Optional encoding of arrays in the response; ``json``
+            (default) for json arrays, or ``f64`` or ``f32`` for
+            ``{"dtype": arrays, "base64": ...}`` objects holding
+            little-endian float64 or float32 buffers in base64, in which
+            invalid values are NaN.
+
+    Large responses are gzip compressed if the client accepts it.
+    Responses have an ETag, which changes whenever the graph changes, and
+    304 is returned for a request with ``If-None-Match`` of the current one.
+    Serialized responses are cached, so clients requesting the same graph
+    with the same parameters cost one serialization.
+
+    Returns:
+        exists (bool): False if session ID does not match.
+        x (list of float): Iterations.
+        y (list of float): Values, ``null`` being invalid values.
+        offset (int): Index of the first point in ``x`` and ``y``. Clients
+            should drop their points from ``offset`` and append the new ones.
+        full (bool): True if all the points were returned, either because
+            no cursor was given or the points were rewritten since then.
+        downsampled (bool): True if the points were downsampled.
+        cursor (str): Cursor to give in the next request. It is ``null``
+            for downsampled series.
+        stateHash (str): State hash of the graph.
+        range (bool): True if it is a response to a range query. In that
+            case ``y`` is the mean of each bucket, ``yMin`` and ``yMax``
+            are the minimum and maximum of each bucket and ``level`` is the
+            log2 of the bucket size.
+        smoothed (list of float): Smoothed values if ``smoothing`` was
+            given. They are of the points in ``x`` if the points were
+            downsampled, and of the points from ``smoothedOffset``
+            otherwise, which may precede ``offset`` since the last smoothed
+            values change as points are appended.
+        smoothedOffset (int): Index of the first value in ``smoothed``.
+
+    """
     g = request.args.get('graphId')
+    arrays = array_encoding(request.args.get('arrays'))
     session_id = request.args.get('sessionId')
+    snapshot = get_timeline_handler(request.args.get('runId')).snapshot
+    query = {
+        'cursor': request.args.get('cursor'),
+        'maxPoints': request.args.get('maxPoints', type=int),
+        'xmin': request.args.get('xmin', type=float),
+        'xmax': request.args.get('xmax', type=float),
+        'width': request.args.get('width', type=int),
+        'smoothing': request.args.get('smoothing')
+    }
     logger.debug(g)
-    with timeline_handler.lock:
-        if session_id != timeline_handler.session_id:
-            logger.debug(
-                "Session mismatch (it is %s, but request was %s)" %
-                (timeline_handler.session_id, session_id)
-            )
-            return jsonify({'exists': False})
-
-        y = _cleanse_plots(timeline_handler.events[g].iteration,
-                           timeline_handler.events[g].value)
-        data = {
-            'exists': True,
-            'x': timeline_handler.events[g].iteration,
-            'y': y,
-            'stateHash': timeline_handler.events[g].state_hash
-        }
-
-    return jsonify(data)
+    _validate_query(query)
+    if session_id != snapshot.session_id:
+        logger.debug(
+            "Session mismatch (it is %s, but request was %s)" %
+            (snapshot.session_id, session_id)
+        )
+        return jsonify({'exists': False})
+    return conditional_response(_encoded, _response_key(snapshot, g, query),
+                                lambda: _query(snapshot, g, query), arrays)
+
+
+@app.route('/events/batch', methods=['POST'])
+def get_events_batch():
+    """
+    Get points of graphs at once. Unlike requesting ``/events/data`` for
+    each graph, all the graphs are read from the same snapshot.
+
+    Parameters
+        sessionId (str): Session ID.
+        runId (str): Optional run ID in the multi-run mode.
+        graphs (list of dict): Graphs to get. Each has ``graphId`` and may
+            have any parameters of ``/events/data`` such as ``cursor``.
+        cursor, maxPoints, xmin, xmax, width, smoothing: Optional defaults
+            of parameters of the graphs. See ``/events/data``.
+        arrays (str): Optional encoding of arrays. See ``/events/data``.
+
+    Returns:
+        exists (bool): False if session ID does not match.
+        data (dict): Maps graph IDs to responses as of ``/events/data``.
+
+    """
+    session_id = request.json['sessionId']
+    snapshot = get_timeline_handler(request.json.get('runId')).snapshot
+    arrays = array_encoding(request.json.get('arrays'))
+    defaults = {k: request.json.get(k) for k in _QUERY_KEYS}
+    queries = []
+    for graph in request.json['graphs']:
+        query = dict(defaults)
+        query.update((k, graph[k]) for k in _QUERY_KEYS if k in graph)
+        _validate_query(query)
+        queries.append((graph['graphId'], query))
+    logger.debug("Batch of %d graphs" % len(queries))
+    if session_id != snapshot.session_id:
+        logger.debug(
+            "Session mismatch (it is %s, but request was %s)" %
+            (snapshot.session_id, session_id)
+        )
+        return jsonify({'exists': False})
+    data = {g: cached_dumps(_encoded, _response_key(snapshot, g, query),
+                            lambda: _query(snapshot, g, query), arrays)
+            for g, query in queries}
+
+    return jsonify_columns({'exists': True, 'data': data})
+
+
+@app.route('/events/list', methods=['GET'])
+def get_events_list():
+    """
+    List graphs of events page by page so that clients with hundreds of
+    graphs only handle the ones they show.
+
+    Parameters
+        runId (str): Optional run ID in the multi-run mode.
+        offset (int): Optional index of the first graph to return among
+            matched ones. Defaults to 0.
+        limit (int): Optional maximum number of graphs to return. All the
+            matched graphs are returned by default.
+        prefix (str): Optional prefix of graph IDs to match.
+        regex (str): Optional regular expression that matches a part of
+            graph IDs.
+
+    Returns:
+        sessionId (str): Session ID.
+        version (int): Version of the timelines that were listed.
+        total (int): Number of matched graphs.
+        offset (int): ``offset`` of the request.
+        graphIds (list of str): Matched graphs from ``offset`` in order of
+            creation.
+
+    """
+    return list_graphs('events')
 
 
 def _recursive_find_parent(graph, graph_to_group):
@@ -88,7 +417,7 @@ def _recursive_find_parent(graph, graph_to_group):
 @app.route('/events/updates', methods=['POST'])
 def get_events_updates():
     """
-    Given current state, return updates.
+    Given the version that the client knows, return updates.
     The `Parameters` show the content of payload, and `Returns` show the content
     of return body.
 
@@ -97,15 +426,16 @@ def get_events_updates():
     group ids to collide.
 
     Parameters
-        active (dict): Current active graphs' states as a group id-graph ids
-            pairs ``{"0d9asjan2ija": [id1, id2, ..], ... }``
-        states (dict): Mapping from graph id to state hash
+        version (int): ``version`` of the last response that the client has
+            applied. 0 if nothing has been applied.
         sessionId (str): Session ID that was originally given by this API.
             Should give empty string if no session ID is associated.
+        runId (str): Optional run ID in the multi-run mode.
 
     Returns:
         updateType (str): 'new' or 'update'
         sessionId (str): Session ID of 12 ascii characters
+        version (int): Current version to give in the next request.
         newPlots (list of dict): Newly detected plots. ``"type"`` field (str)
             tells client of action to take; ``"new"`` if the new graph does not
             belong to any group, ``"hidden"`` if it should not be shown and
@@ -113,52 +443,39 @@ def get_events_updates():
             ``"groupId"`` field (str) show group id to add the graph.
             ``"graphId"`` is the graph id that client can use to get the data
             for the graph.
-        updates (dict): Notifies graphs to update. Maps group id (str)
-            to IDs of graphs to update (list of str).
+        updates (list of str): IDs of graphs that changed since ``version``.
             The list does includes graphs in newPlots.
 
     """
-    with timeline_handler.lock:
-        session_id = request.json['sessionId']
-        if session_id  == '' or session_id != timeline_handler.session_id:
-            # no session id associated
-            logger.debug("creating new session %s" % timeline_handler.session_id)
-            states = {}
-            active = {}
-            update_type = "new"
-        else:
-            assert (
-                isinstance(session_id, six.string_types) and
-                len(session_id) == 12)
-            states = request.json['states']
-            active = request.json['active']
-            update_type = "update"
-        graph_to_group = {g: group for group, graphs in six.iteritems(active)
-                          for g in graphs}
-
-        # First determine graphs to add/update
-        new_plots = []
-        for g in timeline_handler.get_events_ids():
-            if g not in states:
-                # Currently does not implent type=append or hidden
-                group_id = util.random_hash(12)
-                new_plots.append({
-                    'type': 'new',
-                    'groupId': group_id,  # create new group id
-                    'name': g,
-                    'graphId': g
-                })
-                active[group_id] = [g]
-
-        updates = defaultdict(list)
-        for group_id, graphs in six.iteritems(active):
-            for g in graphs:
-                if timeline_handler.events[g].state_hash != states.get(g, ''):
-                    updates[group_id].append(g)
+    session_id = request.json['sessionId']
+    snapshot = get_timeline_handler(request.json.get('runId')).snapshot
+    if session_id == '' or session_id != snapshot.session_id:
+        # no session id associated
+        logger.debug("creating new session %s" % snapshot.session_id)
+        version = 0
+        update_type = "new"
+    else:
+        assert (
+            isinstance(session_id, six.string_types) and
+            len(session_id) == 12)
+        version = int(request.json['version'])
+        update_type = "update"
+
+    updates, created = snapshot.changes_since(version, 'events')
+    new_plots = []
+    for g in created:
+        # Currently does not implent type=append or hidden
+        new_plots.append({
+            'type': 'new',
+            'groupId': util.random_hash(12),  # create new group id
+            'name': g,
+            'graphId': g
+        })
 
     return jsonify({
         'updateType': update_type,
-        'sessionId': timeline_handler.session_id,
+        'sessionId': snapshot.session_id,
+        'version': snapshot.version,
         'newPlots': new_plots,
-        'updates': dict(updates)
+        'updates': updates
     })
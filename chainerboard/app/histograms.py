@@ -4,42 +4,290 @@ from __future__ import absolute_import, division, print_function, \
 
 import logging
 
-from flask import jsonify, request
+from flask import abort, jsonify, request
+import numpy as np
 import six
 
-from chainerboard.app import app, timeline_handler
-from chainerboard import util
+from chainerboard.app import app, get_timeline_handler
+from chainerboard.app.listing import list_graphs
+from chainerboard.app.serialize import array_encoding, cached_dumps, \
+    conditional_response, encoded_cache, jsonify as jsonify_columns
+from chainerboard import series, util
 
 
 logger = logging.getLogger(__name__)
 
+# Default and maximum size of each axis of density grids
+DENSITY_WIDTH = 200
+DENSITY_BINS = 64
+_MAX_GRID_SIZE = 1000
+
+# Downsampled bands keyed by (session id, graph id, state hash, max points)
+_downsampled = util.LRUCache(256)
+# Serialized responses keyed by (session id, graph id, state hash) and the
+# query
+_encoded = encoded_cache(256, 32 * 1024 * 1024)
+
+
+def _response_key(snapshot, graph_id, *query):
+    return (snapshot.session_id, graph_id,
+            snapshot.tensors[graph_id].state_hash) + query
+
+
+def _int_param(value, default=None):
+    """ Abort with 400 unless ``value`` is a positive integer or None. """
+    if value is None:
+        return default
+    try:
+        value = int(value)
+        if value < 1:
+            raise ValueError("Must be positive: %d" % value)
+        return value
+    except (TypeError, ValueError) as e:
+        logger.debug(str(e))
+        abort(400)
+
+
+def _percentile_levels(percentiles):
+    """
+    Levels in [0, 1] of percentiles labeled as of
+    :meth:`~chainerboard.timeline.TensorTimeline.get_percentiles`. They are
+    evenly spaced if any label is not a percentage.
+    """
+    levels = []
+    for p in percentiles:
+        if p['label'] == 'min':
+            levels.append(0.)
+        elif p['label'] == 'max':
+            levels.append(1.)
+        elif p['label'].endswith('%'):
+            levels.append(float(p['label'][:-1]) / 100.)
+        else:
+            return np.linspace(0., 1., len(percentiles))
+    return np.array(levels)
+
+
+def _query(snapshot, graph_id, cursor, max_points=None):
+    """
+    Get percentiles of a tensor appended since ``cursor``, downsampling
+    them if there are more than ``max_points``.
+
+    Args:
+        snapshot (chainerboard.timeline_handler.Snapshot): Snapshot of the
+            timelines to read.
+
+    Returns:
+        dict: Response of ``/histograms/data``.
+
+    """
+    tensor = snapshot.tensors[graph_id]
+    percentiles = tensor.get_percentiles()
+    if max_points is not None and len(tensor) > max_points:
+        key = (snapshot.session_id, graph_id, tensor.state_hash, max_points)
+        cached = _downsampled.get(key)
+        if cached is None:
+            bands = np.stack([p['data'] for p in percentiles], axis=1)
+            cached = series.band_downsample(
+                tensor.iteration, bands, max_points)
+            _downsampled.put(key, cached)
+        x, bands = cached
+        y = [bands[:, j] for j in range(len(percentiles))]
+        offset = 0
+        cursor = None
+    else:
+        offset = tensor.offset_of(cursor)
+        x = tensor.iteration[offset:]
+        y = [np.asarray(p['data'][offset:], dtype=np.float64)
+             for p in percentiles]
+        cursor = tensor.cursor
+    return {
+        'exists': True,
+        'x': x,
+        'y': [{'label': p['label'], 'data': data}
+              for p, data in zip(percentiles, y)],
+        'offset': offset,
+        'full': offset == 0,
+        'downsampled': cursor is None,
+        'cursor': cursor,
+        'stateHash': tensor.state_hash
+    }
+
+
+def _query_density(snapshot, graph_id, width, bins):
+    """
+    Get the density of values of a tensor on a grid by
+    :func:`chainerboard.series.band_density`.
+
+    Returns:
+        dict: Response of ``/histograms/density``.
+
+    """
+    tensor = snapshot.tensors[graph_id]
+    percentiles = tensor.get_percentiles()
+    x, y, z = series.band_density(
+        tensor.iteration, np.stack([p['data'] for p in percentiles], axis=1),
+        _percentile_levels(percentiles), width, bins)
+    return {
+        'exists': True,
+        'x': x,
+        'y': y,
+        'z': list(z),
+        'full': True,
+        'stateHash': tensor.state_hash
+    }
+
 
 @app.route('/histograms/data', methods=['GET'])
 def get_histograms_data():
+    """
+    Get percentiles of a tensor. Parameters and returns are the same as
+    ``/events/data`` except that ``y`` is a list of percentiles, each of
+    which has ``label`` (str) and ``data`` (list of float). Responses have
+    an ETag as of ``/events/data``.
+
+    With ``maxPoints``, longer tensors are downsampled to buckets of equal
+    size, whose ``x`` is that of their first point. Bands below the median
+    are the minimum in each bucket and bands above it are the maximum, so
+    that the envelope of the percentiles is kept, while the median is the
+    mean in each bucket.
+    """
+    g = request.args.get('graphId')
+    arrays = array_encoding(request.args.get('arrays'))
+    session_id = request.args.get('sessionId')
+    snapshot = get_timeline_handler(request.args.get('runId')).snapshot
+    if session_id != snapshot.session_id:
+        logger.debug(
+            "Session mismatch (it is %s, but request was %s)" %
+            (snapshot.session_id, session_id)
+        )
+        return jsonify({'exists': False})
+    cursor = request.args.get('cursor')
+    max_points = _int_param(request.args.get('maxPoints'))
+    return conditional_response(
+        _encoded, _response_key(snapshot, g, cursor, max_points),
+        lambda: _query(snapshot, g, cursor, max_points), arrays)
+
+
+@app.route('/histograms/density', methods=['GET'])
+def get_histograms_density():
+    """
+    Get the density of values of a tensor on a grid of iteration buckets
+    and value bins, which is drawn as a heatmap at a cost that does not
+    grow with the number of iterations. The mass between adjacent
+    percentiles is spread uniformly between their values, and each bucket
+    is the mean density of the points in it.
+
+    Parameters
+        graphId (str): Graph ID of the tensor.
+        sessionId (str): Session ID.
+        runId (str): Optional run ID in the multi-run mode.
+        width (int): Optional maximum number of iteration buckets. Defaults
+            to 200.
+        bins (int): Optional number of value bins. Defaults to 64.
+        arrays (str): Optional encoding of arrays. See ``/events/data``.
+
+    Returns:
+        exists (bool): False if session ID does not match.
+        x (list of int): Iteration of the first point of each bucket.
+        y (list of float): Center value of each bin.
+        z (list of list of float): Density of each bin (row) in each
+            bucket (column), summing up to 1 in a bucket. ``null`` for a
+            bucket without valid points.
+        full (bool): Always True since the grid is not appended to.
+        stateHash (str): Hash of the tensor as of ``/events/data``.
+
+    """
     g = request.args.get('graphId')
+    arrays = array_encoding(request.args.get('arrays'))
     session_id = request.args.get('sessionId')
-    with timeline_handler.lock:
-        if session_id != timeline_handler.session_id:
-            logger.debug(
-                "Session mismatch (it is %s, but request was %s)" %
-                (timeline_handler.session_id, session_id)
-            )
-            return jsonify({'exists': False})
+    snapshot = get_timeline_handler(request.args.get('runId')).snapshot
+    width = min(_int_param(request.args.get('width'), DENSITY_WIDTH),
+                _MAX_GRID_SIZE)
+    bins = min(_int_param(request.args.get('bins'), DENSITY_BINS),
+               _MAX_GRID_SIZE)
+    if session_id != snapshot.session_id:
+        logger.debug(
+            "Session mismatch (it is %s, but request was %s)" %
+            (snapshot.session_id, session_id)
+        )
+        return jsonify({'exists': False})
+    return conditional_response(
+        _encoded, _response_key(snapshot, g, 'density', width, bins),
+        lambda: _query_density(snapshot, g, width, bins), arrays)
 
-        data = {
-            'exists': True,
-            'x': timeline_handler.tensors[g].iteration,
-            'y': timeline_handler.tensors[g].get_percentiles(),
-            'stateHash': timeline_handler.tensors[g].state_hash
-        }
 
-    return jsonify(data)
+@app.route('/histograms/batch', methods=['POST'])
+def get_histograms_batch():
+    """
+    Get percentiles of tensors at once from the same snapshot.
+
+    Parameters
+        sessionId (str): Session ID.
+        runId (str): Optional run ID in the multi-run mode.
+        graphs (list of dict): Graphs to get. Each has ``graphId`` and
+            optional ``cursor`` and ``maxPoints``.
+        maxPoints (int): Optional default of ``maxPoints`` of the graphs.
+        mode (str): ``'bands'`` (default) for percentiles as of
+            ``/histograms/data`` or ``'density'`` for grids as of
+            ``/histograms/density``.
+        width, bins (int): Optional sizes of grids in the density mode.
+        arrays (str): Optional encoding of arrays. See ``/events/data``.
+
+    Returns:
+        exists (bool): False if session ID does not match.
+        data (dict): Maps graph IDs to responses as of ``/histograms/data``
+            or ``/histograms/density``.
+
+    """
+    session_id = request.json['sessionId']
+    snapshot = get_timeline_handler(request.json.get('runId')).snapshot
+    graphs = request.json['graphs']
+    arrays = array_encoding(request.json.get('arrays'))
+    mode = request.json.get('mode', 'bands')
+    if mode not in ('bands', 'density'):
+        abort(400)
+    default_max_points = _int_param(request.json.get('maxPoints'))
+    queries = [(graph['graphId'], graph.get('cursor'),
+                _int_param(graph.get('maxPoints', default_max_points)))
+               for graph in graphs]
+    width = min(_int_param(request.json.get('width'), DENSITY_WIDTH),
+                _MAX_GRID_SIZE)
+    bins = min(_int_param(request.json.get('bins'), DENSITY_BINS),
+               _MAX_GRID_SIZE)
+    logger.debug("Batch of %d graphs" % len(graphs))
+    if session_id != snapshot.session_id:
+        logger.debug(
+            "Session mismatch (it is %s, but request was %s)" %
+            (snapshot.session_id, session_id)
+        )
+        return jsonify({'exists': False})
+    data = {}
+    for g, cursor, max_points in queries:
+        if mode == 'density':
+            data[g] = cached_dumps(
+                _encoded, _response_key(snapshot, g, 'density', width, bins),
+                lambda: _query_density(snapshot, g, width, bins), arrays)
+            continue
+        data[g] = cached_dumps(
+            _encoded, _response_key(snapshot, g, cursor, max_points),
+            lambda: _query(snapshot, g, cursor, max_points), arrays)
+
+    return jsonify_columns({'exists': True, 'data': data})
+
+
+@app.route('/histograms/list', methods=['GET'])
+def get_histograms_list():
+    """
+    List graphs of tensors page by page. Parameters and returns are the
+    same as ``/events/list``.
+    """
+    return list_graphs('tensors')
 
 
 @app.route('/histograms/updates', methods=['POST'])
 def get_histograms_updates():
     """
-    Given current state, return updates.
+    Given the version that the client knows, return updates.
     The `Parameters` show the content of payload, and `Returns` show the content
     of return body.
 
@@ -48,59 +296,51 @@ def get_histograms_updates():
     group ids to collide.
 
     Parameters
-        active (dict): Current active graphs' states as a group id-graph ids
-            pairs ``{"0d9asjan2ija": id1, ... }``
-        states (dict): Mapping from graph id to state hash
+        version (int): ``version`` of the last response that the client has
+            applied. 0 if nothing has been applied.
         sessionId (str): Session ID that was originally given by this API.
             Should give empty string if no session ID is associated.
+        runId (str): Optional run ID in the multi-run mode.
 
     Returns:
         updateType (str): 'new' or 'update'
         sessionId (str): Session ID of 12 ascii characters
+        version (int): Current version to give in the next request.
         newPlots (list of dict): Newly detected plots. ``"type"`` field (str)
             tells client of action to take; ``"new"`` if the new graph does not
             belong to any group and ``"hidden"`` if it should not be shown.
             ``"graphId"`` is the graph id that client can use to get the data
             for the graph.
-        updates (list of str): IDs of graphs to update (list of str).
+        updates (list of str): IDs of graphs that changed since ``version``.
             The list does includes graphs in newPlots.
 
     """
     session_id = request.json['sessionId']
-    with timeline_handler.lock:
-        if session_id  == '' or session_id != timeline_handler.session_id:
-            # no session id associated
-            logger.debug("creating new session %s" % timeline_handler.session_id)
-            states = {}
-            active = {}
-            update_type = "new"
-        else:
-            assert isinstance(session_id, six.string_types) and len(session_id) == 12
-            states = request.json['states']
-            active = request.json['active']
-            update_type = "update"
-
-        # First determine graphs to add/update
-        new_plots = []
-        for g in timeline_handler.get_tensors_ids():
-            if g not in states:
-                # Currently does not implent type=append or hidden
-                graph_div = util.random_hash(12)
-                new_plots.append({
-                    'type': 'new',
-                    'graphDiv': graph_div,
-                    'graphId': g
-                })
-                active[graph_div] = g
-
-        updates = []
-        for group_id, g in six.iteritems(active):
-            if timeline_handler.tensors[g].state_hash != states.get(g, ''):
-                updates.append(group_id)
+    snapshot = get_timeline_handler(request.json.get('runId')).snapshot
+    if session_id  == '' or session_id != snapshot.session_id:
+        # no session id associated
+        logger.debug("creating new session %s" % snapshot.session_id)
+        version = 0
+        update_type = "new"
+    else:
+        assert isinstance(session_id, six.string_types) and len(session_id) == 12
+        version = int(request.json['version'])
+        update_type = "update"
+
+    updates, created = snapshot.changes_since(version, 'tensors')
+    new_plots = []
+    for g in created:
+        # Currently does not implent type=append or hidden
+        new_plots.append({
+            'type': 'new',
+            'graphDiv': util.random_hash(12),
+            'graphId': g
+        })
 
     return jsonify({
         'updateType': update_type,
-        'sessionId': timeline_handler.session_id,
+        'sessionId': snapshot.session_id,
+        'version': snapshot.version,
         'newPlots': new_plots,
         'updates': updates
     })
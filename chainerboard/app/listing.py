@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Paginated listing of graphs and search of metric names
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import logging
+import re
+
+from flask import abort, jsonify, request
+
+from chainerboard.app import app, get_timeline_handler
+
+
+logger = logging.getLogger(__name__)
+
+
+def _int_arg(name, default):
+    """ Abort with 400 unless the argument is a non-negative integer. """
+    value = request.args.get(name, type=int)
+    if value is None:
+        if name in request.args:
+            abort(400)
+        return default
+    if value < 0:
+        abort(400)
+    return value
+
+
+def filter_graphs(graph_ids, prefix=None, regex=None):
+    """
+    Filter graph IDs by name.
+
+    Args:
+        graph_ids (list of str): Graph IDs to filter.
+        prefix (str): Prefix that graph IDs must start with, or None.
+        regex (str): Regular expression that must match a part of graph
+            IDs, or None.
+
+    Returns:
+        list of str: Matched graph IDs in the given order.
+
+    Raises:
+        re.error: If ``regex`` is malformed.
+
+    """
+    if prefix:
+        graph_ids = [g for g in graph_ids if g.startswith(prefix)]
+    if regex:
+        pattern = re.compile(regex)
+        graph_ids = [g for g in graph_ids if pattern.search(g)]
+    return graph_ids
+
+
+def list_graphs(kind):
+    """
+    Respond a page of graphs of ``kind`` (``'events'`` or ``'tensors'``) for
+    the listing endpoints. See ``/events/list``.
+    """
+    snapshot = get_timeline_handler(request.args.get('runId')).snapshot
+    offset = _int_arg('offset', 0)
+    limit = _int_arg('limit', None)
+    try:
+        matched = filter_graphs(snapshot.graph_ids(kind),
+                                request.args.get('prefix'),
+                                request.args.get('regex'))
+    except re.error as e:
+        logger.debug(str(e))
+        abort(400)
+    stop = None if limit is None else offset + limit
+    return jsonify({
+        'sessionId': snapshot.session_id,
+        'version': snapshot.version,
+        'total': len(matched),
+        'offset': offset,
+        'graphIds': matched[offset:stop]
+    })
+
+
+@app.route('/metrics/search', methods=['GET'])
+def search_metrics():
+    """
+    Search keys of metrics in the records. Keys are indexed by a trie over
+    their ``/``-separated components as they appear, so a prefix only
+    visits the keys under it and the total number of keys with a prefix is
+    known without visiting them.
+
+    Parameters
+        runId (str): Optional run ID in the multi-run mode.
+        prefix (str): Optional prefix of keys to match.
+        regex (str): Optional regular expression that matches a part of
+            keys, which is tested only on the keys with ``prefix``.
+        offset (int): Optional index of the first key to return among
+            matched ones. Defaults to 0.
+        limit (int): Optional maximum number of keys to return. All the
+            matched keys are returned by default.
+
+    Returns:
+        sessionId (str): Session ID.
+        version (int): Version of the timelines that were searched.
+        total (int): Number of matched keys.
+        offset (int): ``offset`` of the request.
+        names (list of str): Matched keys from ``offset`` in order of their
+            components.
+
+    """
+    snapshot = get_timeline_handler(request.args.get('runId')).snapshot
+    offset = _int_arg('offset', 0)
+    try:
+        names, total = snapshot.names.search(
+            request.args.get('prefix'), request.args.get('regex'),
+            offset, _int_arg('limit', None))
+    except re.error as e:
+        logger.debug(str(e))
+        abort(400)
+    return jsonify({
+        'sessionId': snapshot.session_id,
+        'version': snapshot.version,
+        'total': total,
+        'offset': offset,
+        'names': names
+    })
@@ -6,7 +6,7 @@ import logging
 
 from flask import render_template, redirect, url_for
 
-from chainerboard.app import app
+from chainerboard.app import app, runs
 
 
 logger = logging.getLogger(__name__)
@@ -14,9 +14,19 @@ logger = logging.getLogger(__name__)
 
 @app.route('/')
 def index():
+    if len(runs) > 0:
+        return redirect(url_for('runs_list'))
     return redirect(url_for('events'))
 
 
+@app.route('/runs')
+def runs_list():
+    return render_template(
+        'layouts/runs.html',
+        runs=[{'id': r, 'path': runs.path(r), 'loaded': runs.is_loaded(r)}
+              for r in runs.run_ids()])
+
+
 @app.route('/events')
 def events():
     return render_template('layouts/events.html')
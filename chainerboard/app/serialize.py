@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Serialization of responses that contain columns of timelines
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import base64
+import hashlib
+import json
+import zlib
+
+from flask import abort, request
+import numpy as np
+import six
+
+from chainerboard import util
+from chainerboard.app import app
+
+# Encodings of arrays that clients can request and their dtypes. Arrays are
+# json arrays in 'json' and base64 of little-endian buffers otherwise.
+ARRAY_ENCODINGS = {'json': None, 'f64': '<f8', 'f32': '<f4'}
+
+# Responses smaller than this are not worth compressing
+_MIN_COMPRESSED_SIZE = 1024
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Encoded(object):
+    """
+    Json text that has already been encoded, which :func:`dumps` embeds as
+    is. Its gzip compressed body is kept once it is made.
+
+    Args:
+        text (str): Json formatted text.
+
+    """
+    __slots__ = ('text', '_gzipped')
+
+    def __init__(self, text):
+        self.text = text
+        self._gzipped = None
+
+    def gzipped(self):
+        """ Gzip compressed text encoded in utf-8 (bytes) """
+        if self._gzipped is None:
+            self._gzipped = _gzip(self.text.encode('utf-8'))
+        return self._gzipped
+
+    @property
+    def nbytes(self):
+        """
+        Bytes that the text and its compressed body may take (int). The
+        compressed body, which may be made after caching, is counted as
+        large as the text.
+        """
+        return 2 * len(self.text)
+
+
+def encoded_cache(maxsize, maxbytes):
+    """
+    Cache of :class:`Encoded` for :func:`cached_dumps` bounded both by the
+    number of items and by their total size, since one body of a long
+    series can take tens of megabytes. Larger bodies are not cached.
+
+    Args:
+        maxsize (int): Maximum number of items.
+        maxbytes (int): Maximum total size in bytes.
+
+    Returns:
+        chainerboard.util.LRUCache
+
+    """
+    return util.LRUCache(maxsize, maxbytes, lambda encoded: encoded.nbytes)
+
+
+def array_encoding(value):
+    """
+    Validate an encoding of arrays requested by a client, aborting with 400
+    if it is unknown.
+
+    Args:
+        value (str): Encoding or ``None`` for the default.
+
+    Returns:
+        str: One of :data:`ARRAY_ENCODINGS`.
+
+    """
+    if value is None:
+        return 'json'
+    if value not in ARRAY_ENCODINGS:
+        abort(400)
+    return value
+
+
+# Widths of the decimal text of a number, which hold the longest ones such
+# as -1.7976931348623157e+308 and -9223372036854775808
+_TEXT_WIDTHS = {'f': 32, 'i': 21, 'u': 21}
+
+
+def _json_array(arr):
+    """
+    Encode a numeric array as a json array without making a Python object
+    per element. Numbers are formatted by casting the array to fixed-width
+    bytes, whose zero padding is dropped after commas are put in place.
+    Non-finite floats, which are invalid json tokens, become ``null``.
+    """
+    if arr.ndim > 1:
+        return '[%s]' % ','.join(_json_array(row) for row in arr)
+    if len(arr) == 0:
+        return '[]'
+    if arr.dtype.kind == 'f':
+        # Shortest text that round-trips float64, as json.dumps writes
+        arr = arr.astype(np.float64, copy=False)
+    width = _TEXT_WIDTHS[arr.dtype.kind]
+    text = np.empty((len(arr), width + 1), dtype=np.uint8)
+    text[:, :width] = arr.astype('S%d' % width).view(np.uint8).reshape(
+        len(arr), width)
+    if arr.dtype.kind == 'f':
+        invalid = ~np.isfinite(arr)
+        if invalid.any():
+            text[invalid, :width] = np.frombuffer(
+                b'null'.ljust(width, b'\0'), dtype=np.uint8)
+    text[:, width] = ord(',')
+    text = text.ravel()
+    text = text[text != 0]
+    return '[%s]' % text[:-1].tobytes().decode('ascii')
+
+
+def _dumps_array(arr, arrays):
+    """
+    Encode an array. Numeric arrays are json arrays formatted by
+    :func:`_json_array` if ``arrays`` is ``'json'`` and ``{"dtype":
+    arrays, "base64": ...}`` of their buffers otherwise, which is the fast
+    path that needs no formatting. Non-finite floats are ``null`` in json
+    arrays and kept as they are in buffers.
+    """
+    dtype = ARRAY_ENCODINGS[arrays]
+    if dtype is not None and arr.dtype.kind in 'biuf':
+        # No copy if the array is already of the dtype, e.g. a column
+        buf = np.ascontiguousarray(arr, dtype=dtype)
+        return '{"dtype":"%s","base64":"%s"}' % (
+            arrays, base64.b64encode(buf).decode('ascii'))
+    if arr.dtype.kind in _TEXT_WIDTHS:
+        return _json_array(arr)
+    # e.g. booleans or strings, which are not columns of timelines
+    return json.dumps(arr.tolist())
+
+
+def dumps(obj, arrays='json'):
+    """
+    Serialize ``obj`` to a json formatted str. Unlike :func:`json.dumps`,
+    :class:`numpy.ndarray` (e.g. views of columns) is accepted and encoded
+    as a json array.
+
+    Args:
+        obj: Json serializable object, which may contain
+            :class:`numpy.ndarray`.
+        arrays (str): Encoding of arrays in :data:`ARRAY_ENCODINGS`.
+
+    Returns:
+        str
+
+    """
+    if isinstance(obj, Encoded):
+        return obj.text
+    if isinstance(obj, np.ndarray):
+        return _dumps_array(obj, arrays)
+    if isinstance(obj, dict):
+        return '{%s}' % ','.join(
+            '%s:%s' % (json.dumps(k), dumps(v, arrays))
+            for k, v in six.iteritems(obj))
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ','.join(dumps(v, arrays) for v in obj)
+    return json.dumps(obj)
+
+
+def _respond(encoded, etag=None):
+    """ Respond with ``encoded``, compressed if the client accepts it. """
+    if len(encoded.text) >= _MIN_COMPRESSED_SIZE and \
+            'gzip' in request.accept_encodings:
+        response = app.response_class(encoded.gzipped(),
+                                      mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        if etag is not None:
+            etag += '-gzip'
+    else:
+        response = app.response_class(encoded.text,
+                                      mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def jsonify(obj, arrays='json'):
+    """
+    Same as :func:`flask.jsonify` but accepts :class:`numpy.ndarray` and
+    compresses large responses for clients that accept gzip.
+
+    Args:
+        obj: Json serializable object, which may contain
+            :class:`numpy.ndarray`.
+        arrays (str): Encoding of arrays in :data:`ARRAY_ENCODINGS`.
+
+    """
+    return _respond(Encoded(dumps(obj, arrays)))
+
+
+def cached_dumps(cache, key, build, arrays='json'):
+    """
+    Serialize ``build()`` unless it is cached, so that clients that request
+    the same data cost one serialization (and one compression).
+
+    Args:
+        cache (chainerboard.util.LRUCache): Cache of serialized data.
+        key: Hashable key that identifies the data, e.g. a tuple that
+            contains the state hash of a timeline and query parameters.
+        build (callable): Function that returns the data to serialize.
+        arrays (str): Encoding of arrays in :data:`ARRAY_ENCODINGS`.
+
+    Returns:
+        Encoded: Serialized data.
+
+    """
+    key = (key, arrays)
+    encoded = cache.get(key)
+    if encoded is None:
+        encoded = Encoded(dumps(build(), arrays))
+        cache.put(key, encoded)
+    return encoded
+
+
+def conditional_response(cache, key, build, arrays='json'):
+    """
+    Respond with :func:`cached_dumps` and an ETag derived from ``key``.
+    If the client already has the data of the ETag, 304 is returned
+    without building the data.
+
+    Args:
+        cache (chainerboard.util.LRUCache): Cache of serialized data.
+        key: Hashable key that identifies the data.
+        build (callable): Function that returns the data to serialize.
+        arrays (str): Encoding of arrays in :data:`ARRAY_ENCODINGS`.
+
+    Returns:
+        flask.Response
+
+    """
+    etag = hashlib.md5(repr((key, arrays)).encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag) or \
+            request.if_none_match.contains(etag + '-gzip'):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+    else:
+        response = _respond(cached_dumps(cache, key, build, arrays), etag)
+    # Browsers revalidate with If-None-Match instead of using stale data
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -14,52 +14,70 @@ function($q, $timeout) {
 
 var self = this;
 
-self.argDefault = function (arg, defaultValue) {
-    return arg = typeof arg !== 'undefined' ? arg : defaultValue;
+// Run ID given by ?run= in the multi-run mode; empty in the single-run mode
+self.runId = (function () {
+    var match = /[?&]run=([^&]*)/.exec(window.location.search);
+    return match === null ? '' : decodeURIComponent(match[1].replace(/\+/g, ' '));
+}());
+
+// Encoding of arrays to request; base64 of float64 buffers is smaller and
+// faster to decode than json arrays of decimal numbers
+self.arrayEncoding = 'f64';
+
+var TYPED_ARRAYS = {'f64': Float64Array, 'f32': Float32Array};
+
+/**
+ * Decode an array encoded by the server into a typed array.
+ * @param {object} encoded - Object with dtype and base64 of a little-endian
+ *      buffer.
+ * @returns {Float64Array|Float32Array}
+ */
+self.decodeArray = function (encoded) {
+    var binary = window.atob(encoded.base64);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return new TYPED_ARRAYS[encoded.dtype](bytes.buffer);
 };
 
-self.movingAverage = function(x, y, window){
-    if(x.length <= window){
-        // Let's return nothing even for x.length == window because it's useless
-        return [[], []];
+/**
+ * Decode all the encoded arrays in a response in place.
+ * @param {object} obj - Parsed response.
+ * @returns {object}: obj whose encoded arrays are replaced with typed arrays.
+ */
+self.decodeArrays = function (obj) {
+    if (obj === null || typeof obj !== 'object') {
+        return obj;
     }
-    var j = 0;
-    // Let's just interpolate y but not x
-    var interpolatedY = [];
-    var interpolatedX = [];
-    var mid = (window + 1) / 2;
-    while (j < x.length) {
-        var total = 0.0;
-        for(var i = 0; i < window; j++){
-            if (y[j] == 'nan') {
-                // just reset i and total
-                i = 0;
-                total = 0.0;
-            } else {
-                i = i + 1;
-                total += y[j];
-                if (j > mid) {
-                    interpolatedY.push('nan');
-                    interpolatedX.push(x[j - mid + 1]);
-                }
-            }
-        }
-        interpolatedY.push(total / window);
-        interpolatedX.push(x[j - mid]);
-        for (; j < x.length; j++){
-            if (y[j] == 'nan') {
-                break;
-            }
-            var i = j - mid + 1;
-            total = total + y[j] - y[j - window];
-            interpolatedY.push(total / window);
-            interpolatedX.push(x[i]);
-        }
+    if (typeof obj.base64 === 'string' && obj.dtype in TYPED_ARRAYS) {
+        return self.decodeArray(obj);
+    }
+    $.each(obj, function (k, v) {
+        obj[k] = self.decodeArrays(v);
+    });
+    return obj;
+};
 
+/**
+ * Replace the points of a series from offset with new ones.
+ * @param {Array} series - Points held by the client.
+ * @param {number} offset - Index of the first point to replace.
+ * @param {Array|Float64Array|Float32Array} points - New points.
+ * @returns {Array}: New series as a plain array, which plotly accepts.
+ */
+self.spliceSeries = function (series, offset, points) {
+    var ret = series.slice(0, offset);
+    for (var i = 0; i < points.length; i++) {
+        // NaN of typed arrays is a gap like null
+        ret.push(isNaN(points[i]) ? null : points[i]);
     }
-    return {'x': interpolatedX, 'y': interpolatedY};
+    return ret;
 };
 
+self.argDefault = function (arg, defaultValue) {
+    return arg = typeof arg !== 'undefined' ? arg : defaultValue;
+};
 
 self.createLayout = function (isLogarithmatic) {
     var yaxisType = isLogarithmatic ? 'log' : 'linear';
@@ -83,6 +101,32 @@ self.createLayout = function (isLogarithmatic) {
     };
 };
 
+/**
+ * Listen to the change notifications of the server.
+ * @param {function} onChange - Called whenever timelines change.
+ * @returns {object}: State of the stream. Its streaming property is true
+ *      while the stream is connected; clients should poll otherwise.
+ */
+self.listenChanges = function (onChange) {
+    var state = {'streaming': false};
+    if (typeof EventSource === 'undefined') {
+        return state;
+    }
+    var source = new EventSource(
+        $SCRIPT_ROOT + '/updates/stream?runId=' + encodeURIComponent(self.runId));
+    source.onopen = function () {
+        $timeout(function () { state.streaming = true; });
+    };
+    source.onerror = function () {
+        // EventSource reconnects by itself
+        $timeout(function () { state.streaming = false; });
+    };
+    source.addEventListener('change', function () {
+        $timeout(onChange);
+    });
+    return state;
+};
+
 self.pollWithTimeout = function(fn, timeout, interval, initialDelay) {
     interval = self.argDefault(interval, 10);
     initialDelay = self.argDefault(initialDelay, 0);
@@ -107,6 +151,38 @@ self.pollWithTimeout = function(fn, timeout, interval, initialDelay) {
     });
 };
 
+}])
+/**
+ * Evaluate an expression with ``visible`` (bool) whenever the element
+ * becomes visible or hidden, that is, when it enters or leaves the viewport
+ * or its panel is expanded or collapsed. It is hidden when it is removed.
+ */
+.directive('cbVisible', ['$timeout', function ($timeout) {
+    return {
+        'restrict': 'A',
+        'link': function (scope, element, attrs) {
+            var notify = function (visible) {
+                $timeout(function () {
+                    scope.$eval(attrs.cbVisible, {'visible': visible});
+                });
+            };
+            if (typeof IntersectionObserver === 'undefined') {
+                // Everything is visible in old browsers
+                notify(true);
+                scope.$on('$destroy', function () { notify(false); });
+                return;
+            }
+            var observer = new IntersectionObserver(function (entries) {
+                var entry = entries[entries.length - 1];
+                notify(entry.isIntersecting);
+            }, {'rootMargin': '200px'});  // Load panels a bit before they appear
+            observer.observe(element[0]);
+            scope.$on('$destroy', function () {
+                observer.disconnect();
+                notify(false);
+            });
+        }
+    };
 }]);
 
 }());
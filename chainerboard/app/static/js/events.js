@@ -14,15 +14,28 @@ self.init = function (sessionId) {
     self.groups = {}; // list of dict (groupId (str) -> list of graph ids (str))
     self.hiddenGraphs = []; // list of graph ids (str)
     self.graphData = {};  // map graph id (str) -> graph obj (object)
-    self.graphStates = {}; // map graph id (str) -> graph status hash (str)
+    self.graphGroups = {}; // map graph id (str) -> group id (str)
+    self.version = 0; // version of the server that graphs are up to date with (int)
+    self.graphCursors = {}; // map graph id (str) -> cursor of fetched points (str)
     self.movingAverageWindow = {}; // map group id (str) -> window size (int)
     self.isLogarithmatic = {}; // map group id (str) -> if logarithmatic (bool)
     self.graphNames = {}; // map group id (str) -> graph name (str)
+    self.zoomRanges = {}; // map group id (str) -> zoomed range of x ([float, float])
+    self.visible = {}; // map group id (str) -> if the panel is visible (bool)
+    self.listed = {}; // map graph id (str) -> true if it is in the listed page
 }
 self.init('');
 self.updateInterval= 5;  // Constant for update interval in second
+self.maxPoints = 2000;  // Constant for maximum number of points to fetch per graph
+self.pageSize = 30;  // Constant for number of graphs to add by showMore
+self.limit = self.pageSize;  // number of graphs to list (int)
+self.filter = '';  // regular expression to filter graph ids (str)
+self.filterError = false;  // if the filter is invalid (bool)
+self.total = 0;  // number of graphs that match the filter (int)
 self.connected = true;  // Status of connection (bool)
 self.next = 0;  // time until the next update (int)
+self.updating = false;  // if an update including its fetch is running (bool)
+self.updateQueued = false;  // if update was called while updating (bool)
 
 
 self.redraw = function (groupId) {
@@ -31,38 +44,160 @@ self.redraw = function (groupId) {
     }
     var data = [];
     $.each(self.groups[groupId], function (i, graphId) {
-        var ret = common.movingAverage(
-            self.graphData[graphId][0].x,
-            self.graphData[graphId][0].y,
-            self.movingAverageWindow[groupId]);
-        self.graphData[graphId][1].x = ret.x;
-        self.graphData[graphId][1].y = ret.y;
         data = data.concat(self.graphData[graphId]);
     });
     var layout = common.createLayout(self.isLogarithmatic[groupId]);
+    if (self.zoomRanges.hasOwnProperty(groupId)) {
+        layout.xaxis.range = self.zoomRanges[groupId];
+        layout.xaxis.autorange = false;
+    }
     // I wanted to use Plotly.update, but it looks like it's buggy
     Plotly.newPlot(
       groupId, // the ID of the div
       data, layout);
+    // newPlot removes event handlers
+    document.getElementById(groupId).on('plotly_relayout', function (ev) {
+        self.onRelayout(groupId, ev);
+    });
     return true;
 }
 
-self.getEventsData = function (graphId) {
+self.refreshList = function () {
+    return $http.get($SCRIPT_ROOT + '/events/list', {'params': {
+        'runId': common.runId,
+        'regex': self.filter || undefined,
+        'limit': self.limit
+    }}).
+    then(function (response) {
+        self.filterError = false;
+        self.listed = {};
+        $.each(response.data.graphIds, function (i, graphId) {
+            self.listed[graphId] = true;
+        });
+        self.total = response.data.total;
+    }, function (response) {
+        self.filterError = response.status == 400;
+    });
+};
+
+self.changeFilter = function () {
+    self.limit = self.pageSize;
+    self.refreshList();
+};
+
+self.showMore = function () {
+    self.limit += self.pageSize;
+    self.refreshList();
+};
+
+self.isGroupListed = function (groupId) {
+    return $.grep(self.groups[groupId], function (graphId) {
+        return self.listed[graphId] === true;
+    }).length > 0;
+};
+
+self.setVisible = function (groupId, visible) {
+    if (!self.groups.hasOwnProperty(groupId) || !!self.visible[groupId] == visible) {
+        return;
+    }
+    self.visible[groupId] = visible;
+    if (visible) {
+        self.loadGroup(groupId);
+    } else {
+        self.release(groupId);
+    }
+};
+
+self.release = function (groupId) {
+    // Hidden groups are fetched again as a whole when they are shown
+    var element = document.getElementById(groupId);
+    if (element !== null) {
+        Plotly.purge(element);
+    }
+    $.each(self.groups[groupId], function (i, graphId) {
+        $.each(self.graphData[graphId], function (j, trace) {
+            trace.x = [];
+            trace.y = [];
+        });
+        delete self.graphCursors[graphId];
+    });
+};
+
+self.loadGroup = function (groupId, graphIds) {
+    graphIds = common.argDefault(graphIds, self.groups[groupId]);
+    var fetched = self.fetchGroup(groupId, graphIds);
+    fetched.then(function () {
+        if (self.visible[groupId]) {
+            self.redraw(groupId);
+        }
+    });
+    return fetched;
+};
+
+self.onRelayout = function (groupId, ev) {
+    if (ev['xaxis.range[0]'] !== undefined && ev['xaxis.range[1]'] !== undefined) {
+        self.zoomRanges[groupId] = [ev['xaxis.range[0]'], ev['xaxis.range[1]']];
+    } else if (ev['xaxis.autorange']) {
+        delete self.zoomRanges[groupId];
+        // Points of the zoomed range were fetched, so fetch all of them again
+        $.each(self.groups[groupId], function (i, graphId) {
+            delete self.graphCursors[graphId];
+        });
+    } else {
+        return;
+    }
+    self.loadGroup(groupId);
+}
+
+self.changeSmoothing = function (groupId) {
+    // Smoothed values of every point change, so fetch all of them again
+    $.each(self.groups[groupId], function (i, graphId) {
+        delete self.graphCursors[graphId];
+    });
+    self.loadGroup(groupId);
+}
+
+self.graphQuery = function (groupId, graphId) {
+    var query = {'graphId': graphId, 'cursor': self.graphCursors[graphId]};
+    // Smoothing is done by the server
+    if (self.movingAverageWindow[groupId] > 0) {
+        query.smoothing = 'ma:' + self.movingAverageWindow[groupId];
+    }
+    // Zoomed groups get aggregated points of the range in the resolution of the plot
+    var range = self.zoomRanges[groupId];
+    if (range !== undefined) {
+        query.xmin = range[0];
+        query.xmax = range[1];
+        query.width = angular.element('#' + groupId).width() || self.maxPoints;
+    }
+    return query;
+}
+
+self.fetchGroup = function (groupId, graphIds) {
+    return self.fetchGraphs($.map(graphIds, function (graphId) {
+        return self.graphQuery(groupId, graphId);
+    }));
+}
+
+self.fetchGraphs = function (queries) {
+    // Get all the graphs in one request
     return $q(function(resolve, reject) {
-        $log.info("Getting graph data for " + graphId);
-        $http.get($SCRIPT_ROOT + '/events/data', {
-            'params': {'graphId': graphId,
-		       'sessionId': self.sessionId }
+        $log.info("Getting graph data for " + queries.length + " graphs");
+        $http.post($SCRIPT_ROOT + '/events/batch', {
+            'sessionId': self.sessionId,
+            'runId': common.runId,
+            'maxPoints': self.maxPoints,
+            'arrays': common.arrayEncoding,
+            'graphs': queries
         }).
         then(function(response) {
             self.connected = true;
             if(response.data.exists){
-                self.graphData[graphId][0].x = response.data.x;
-                self.graphData[graphId][0].y = response.data.y;
-                self.graphStates[graphId] = response.data.stateHash;
-                $log.info("Updated graph " + graphId + " with hash " + response.data.stateHash);
+                $.each(response.data.data, function (graphId, data) {
+                    self.setEventsData(graphId, common.decodeArrays(data));
+                });
             } else {
-                $log.info("Graph " + graphId + " was missing. Reloading occurred?");
+                $log.info("Graphs were missing. Reloading occurred?");
             }
             resolve("operation successful");
         }, function(response) {
@@ -72,13 +207,35 @@ self.getEventsData = function (graphId) {
     });
 };
 
+self.setEventsData = function (graphId, data) {
+    // Server returns points from offset (0 if it is a full refetch)
+    var trace = self.graphData[graphId][0];
+    var offset = data.offset;
+    trace.x = common.spliceSeries(trace.x, offset, data.x);
+    trace.y = common.spliceSeries(trace.y, offset, data.y);
+    var smoothed = self.graphData[graphId][1];
+    smoothed.x = trace.x;
+    if (data.smoothed !== undefined) {
+        smoothed.y = common.spliceSeries(
+            smoothed.y, data.smoothedOffset, data.smoothed);
+    }
+    self.graphCursors[graphId] = data.cursor;
+    $log.info("Updated graph " + graphId + " with hash " + data.stateHash);
+};
+
 self.update = function() {
+    // Overlapping updates would both be given the same new plots
+    if (self.updating) {
+        self.updateQueued = true;
+        return;
+    }
+    self.updating = true;
     $log.info("Getting plots list");
     $http.post($SCRIPT_ROOT + '/events/updates',
         {
-            'active': self.groups,
-            'states': self.graphStates,
-            'sessionId': self.sessionId
+            'version': self.version,
+            'sessionId': self.sessionId,
+            'runId': common.runId
         }
     ).
     then(function(response) {
@@ -107,17 +264,18 @@ self.update = function() {
                     "opacity": 0.9
                 }
             ];
-            self.graphStates[newPlot.graphId] = '';  // initialize with empty hash
             if (newPlot.type == 'new') {
                 // Create new group
                 self.movingAverageWindow[newPlot.groupId] = 3;
                 self.isLogarithmatic[newPlot.groupId] = false;
                 self.graphNames[newPlot.groupId] = newPlot.name;
                 self.groups[newPlot.groupId] = [newPlot.graphId];
+                self.graphGroups[newPlot.graphId] = newPlot.groupId;
             } else if (newPlot.type == 'hidden') {
                 self.hiddenGraphs.append(newPlot.graphId);
             } else if (newPlot.type == 'append') {
                 self.groups[newPlot.groupId].push(newPlot.groupId);
+                self.graphGroups[newPlot.graphId] = newPlot.groupId;
             } else {
                 self.connected = false;
                 $log.error('Invalid newPlot.type ' + newPlot.type);
@@ -125,31 +283,61 @@ self.update = function() {
             $log.debug("Added new plot " + newPlot);
         });
 
-        for (var groupId in response.data.updates) {
-            if (response.data.updates.hasOwnProperty(groupId)) {
-                var promises = [];
-                $.each(response.data.updates[groupId], function(i, graphId) {
-                    promises.push(self.getEventsData(graphId));
-                });
-                promises.push(common.pollWithTimeout(
-                    function(id) { return function () {
-                        return angular.element('#' + id).size() > 0;
-                    };}(groupId), 2000, 200));
-
-                $q.all(promises).then(function (id) { return function () {
-                    self.redraw(id);
-                };}(groupId));
+        if (response.data.newPlots.length > 0) {
+            // New graphs may be in the listed page
+            self.refreshList();
+        }
+
+        var version = response.data.version;
+        var updates = {};  // map group id (str) -> graph ids to update (list of str)
+        var queries = [];
+        $.each(response.data.updates, function (i, graphId) {
+            var groupId = self.graphGroups[graphId];
+            if (groupId === undefined || !self.visible[groupId]) {
+                return;  // hidden graph, or fetched when its panel is shown
+            }
+            if (!updates.hasOwnProperty(groupId)) {
+                updates[groupId] = [];
             }
+            updates[groupId].push(graphId);
+            queries.push(self.graphQuery(groupId, graphId));
+        });
+        if (queries.length == 0) {
+            self.version = version;
+            return;
         }
+        // The update ends when the graphs are fetched
+        return self.fetchGraphs(queries).then(function () {
+            // Changes are asked again unless the graphs are fetched
+            self.version = Math.max(self.version, version);
+            $.each(updates, function (groupId, graphIds) {
+                if (self.visible[groupId]) {
+                    self.redraw(groupId);
+                }
+            });
+        }, angular.noop);
     }, function(response) {
         $log.error("Failed to receive resposne /events/updates");
         self.connected = false;
+    }).
+    finally(function () {
+        self.updating = false;
+        if (self.updateQueued) {
+            self.updateQueued = false;
+            self.update();
+        }
     });
 }
 
 
 
+// Updates are pushed by the server; poll only while the stream is down
+self.changes = common.listenChanges(self.update);
+
 $interval(function () {
+    if (self.changes.streaming) {
+        return;
+    }
     if (self.next == 0) {
         self.update();
     } else {
@@ -118,12 +118,28 @@ self.init = function (sessionId) {
     self.graphs = {}; // map from internal hash id to a graph id (str)
     self.hiddenGraphs = []; //list of graph ids (str)
     self.graphData = {};  // map graph id (str) -> graph obj (object)
-    self.graphStates = {}; // map graph id (str) -> graph status hash (str)
+    self.graphDivs = {}; // map graph id (str) -> internal hash id (str)
+    self.version = 0; // version of the server that graphs are up to date with (int)
+    self.graphCursors = {}; // map graph id (str) -> cursor of fetched points (str)
+    self.rawData = {}; // map graph id (str) -> fetched points (object)
+    self.visible = {}; // map internal hash id (str) -> if the panel is visible (bool)
+    self.listed = {}; // map graph id (str) -> true if it is in the listed page
 }
 self.init('');
 self.updateInterval= 5;  // Constant for update interval in second
+self.maxPoints = 2000;  // Constant for maximum number of points to fetch per graph
+self.densityWidth = 200;  // Constant for number of iteration buckets of heatmaps
+self.densityBins = 64;  // Constant for number of value bins of heatmaps
+self.heatmap = false;  // Whether to draw densities as heatmaps instead of bands (bool)
+self.pageSize = 30;  // Constant for number of panels to add by showMore
+self.limit = self.pageSize;  // number of panels to list (int)
+self.filter = '';  // regular expression to filter graph ids (str)
+self.filterError = false;  // if the filter is invalid (bool)
+self.total = 0;  // number of graphs that match the filter (int)
 self.connected = true;  // Status of connection (bool)
 self.next = 0;  // time until the next update (int)
+self.updating = false;  // if an update including its fetch is running (bool)
+self.updateQueued = false;  // if update was called while updating (bool)
 self.layout = common.createLayout(false);
 
 self.redraw = function (groupId) {
@@ -137,48 +153,95 @@ self.redraw = function (groupId) {
     return true;
 }
 
-self.getPlotData = function (graphId) {
+self.refreshList = function () {
+    return $http.get($SCRIPT_ROOT + '/histograms/list', {'params': {
+        'runId': common.runId,
+        'regex': self.filter || undefined,
+        'limit': self.limit
+    }}).
+    then(function (response) {
+        self.filterError = false;
+        self.listed = {};
+        $.each(response.data.graphIds, function (i, graphId) {
+            self.listed[graphId] = true;
+        });
+        self.total = response.data.total;
+    }, function (response) {
+        self.filterError = response.status == 400;
+    });
+};
+
+self.changeFilter = function () {
+    self.limit = self.pageSize;
+    self.refreshList();
+};
+
+self.showMore = function () {
+    self.limit += self.pageSize;
+    self.refreshList();
+};
+
+self.setVisible = function (graphDiv, visible) {
+    var graphId = self.graphs[graphDiv];
+    if (graphId === undefined || !!self.visible[graphDiv] == visible) {
+        return;
+    }
+    self.visible[graphDiv] = visible;
+    if (visible) {
+        self.loadGraphs([graphId]);
+    } else {
+        self.release(graphId);
+    }
+};
+
+self.release = function (graphId) {
+    // Hidden graphs are fetched again as a whole when they are shown
+    var element = document.getElementById(self.graphDivs[graphId]);
+    if (element !== null) {
+        Plotly.purge(element);
+    }
+    self.graphData[graphId] = [];
+    delete self.graphCursors[graphId];
+    delete self.rawData[graphId];
+};
+
+self.loadGraphs = function (graphIds) {
+    var fetched = self.fetchGraphs(graphIds);
+    fetched.then(function () {
+        $.each(graphIds, function (i, graphId) {
+            var graphDiv = self.graphDivs[graphId];
+            if (self.visible[graphDiv]) {
+                self.redraw(graphDiv);
+            }
+        });
+    });
+    return fetched;
+};
+
+self.fetchGraphs = function (graphIds) {
+    // Get all the graphs in one request
     return $q(function(resolve, reject) {
-        $log.info("Getting graph data for " + graphId);
-        $http.get($SCRIPT_ROOT + '/histograms/data', {
-            'params': {'graphId': graphId,
-		       'sessionId': self.sessionId }
+        $log.info("Getting graph data for " + graphIds.length + " graphs");
+        $http.post($SCRIPT_ROOT + '/histograms/batch', {
+            'sessionId': self.sessionId,
+            'runId': common.runId,
+            'arrays': common.arrayEncoding,
+            'maxPoints': self.maxPoints,
+            'mode': self.heatmap ? 'density' : 'bands',
+            'width': self.densityWidth,
+            'bins': self.densityBins,
+            'graphs': $.map(graphIds, function (graphId) {
+                return {'graphId': graphId, 'cursor': self.graphCursors[graphId]};
+            })
         }).
         then(function(response) {
             self.connected = true;
             if(response.data.exists){
-
-                var colors = generateGradientColors('red', response.data.y.length - 1, 0.5);
-                var data = [];
-                for (var j = 0; j < response.data.y.length; j++) {
-                    var d = {
-                        "x": response.data.x,
-                        "y": response.data.y[j].data,
-                        'type': 'scatter',
-                        // 0 width line because fill does not work with mode=none
-                        'mode': "lines",
-                        'line': {'width': 0},
-                        'showlegend': false,
-                        "name": response.data.y[j].label
-                    };
-                    if (j > 0) {
-                        d.fill = 'tonexty';
-                        d.fillcolor = colors[j - 1];
-                        d.line.color = colors[j - 1];
-                    } else {
-                        d.line.color = colors[0];
-                    }
-                    if (response.data.y[j].label == '50%') {
-                        d.line.color = 'black';
-                        d.line.width = 3;
-                    }
-                    data.push(d);
-                }
-                self.graphData[graphId] = data;
-                self.graphStates[graphId] = response.data.stateHash;
-                $log.info("Updated graph " + graphId + " with hash " + response.data.stateHash);
+                $.each(response.data.data, function (graphId, data) {
+                    self.setPlotData(graphId, common.decodeArrays(data));
+                });
             } else {
-                $log.info("Graph " + graphId + " was missing. Reloading occurred?");
+                $log.info("Graphs were missing. Reloading occurred?");
             }
 
             resolve("operation successful");
@@ -189,14 +252,99 @@ self.getPlotData = function (graphId) {
     });
 };
 
+self.setDensityData = function (graphId, data) {
+    // Grid is always sent as a whole and drawn as one trace
+    self.graphData[graphId] = [{
+        'x': common.spliceSeries([], 0, data.x),
+        'y': common.spliceSeries([], 0, data.y),
+        'z': $.map(data.z, function (row) {
+            return [common.spliceSeries([], 0, row)];
+        }),
+        'type': 'heatmap',
+        'colorscale': 'Reds',
+        'reversescale': true,
+        'showscale': false,
+        'zsmooth': false
+    }];
+    $log.info("Updated heatmap " + graphId + " with hash " + data.stateHash);
+};
+
+self.setPlotData = function (graphId, data) {
+    if (data.z !== undefined) {
+        self.setDensityData(graphId, data);
+        return;
+    }
+    // Server returns points from offset (0 if it is a full refetch)
+    var offset = data.offset;
+    var raw = self.rawData[graphId];
+    if (raw === undefined || data.full) {
+        raw = {'x': [], 'y': $.map(data.y, function (p) {
+            return {'label': p.label, 'data': []};
+        })};
+    }
+    raw.x = common.spliceSeries(raw.x, offset, data.x);
+    $.each(data.y, function (j, p) {
+        raw.y[j].data = common.spliceSeries(raw.y[j].data, offset, p.data);
+    });
+    self.rawData[graphId] = raw;
+    self.graphCursors[graphId] = data.cursor;
+
+    var colors = generateGradientColors('red', raw.y.length - 1, 0.5);
+    var traces = [];
+    for (var j = 0; j < raw.y.length; j++) {
+        var d = {
+            "x": raw.x,
+            "y": raw.y[j].data,
+            'type': 'scatter',
+            // 0 width line because fill does not work with mode=none
+            'mode': "lines",
+            'line': {'width': 0},
+            'showlegend': false,
+            "name": raw.y[j].label
+        };
+        if (j > 0) {
+            d.fill = 'tonexty';
+            d.fillcolor = colors[j - 1];
+            d.line.color = colors[j - 1];
+        } else {
+            d.line.color = colors[0];
+        }
+        if (raw.y[j].label == '50%') {
+            d.line.color = 'black';
+            d.line.width = 3;
+        }
+        traces.push(d);
+    }
+    self.graphData[graphId] = traces;
+    $log.info("Updated graph " + graphId + " with hash " + data.stateHash);
+};
+
+
+self.changeMode = function () {
+    // Data of the other mode cannot be extended
+    self.graphCursors = {};
+    self.rawData = {};
+    var graphIds = $.grep(Object.keys(self.graphDivs), function (graphId) {
+        return self.visible[self.graphDivs[graphId]];
+    });
+    if (graphIds.length > 0) {
+        self.loadGraphs(graphIds);
+    }
+};
 
 self.update = function() {
+    // Overlapping updates would both be given the same new plots
+    if (self.updating) {
+        self.updateQueued = true;
+        return;
+    }
+    self.updating = true;
     $log.info("Getting plots list");
     $http.post($SCRIPT_ROOT + '/histograms/updates',
         {
-            'active': self.graphs,
-            'states': self.graphStates,
-            'sessionId': self.sessionId
+            'version': self.version,
+            'sessionId': self.sessionId,
+            'runId': common.runId
         }
     ).
     then(function(response) {
@@ -205,9 +353,11 @@ self.update = function() {
         self.sessionId = response.data.sessionId;
         $.each(response.data.newPlots, function(i, newPlot) {
             self.graphData[newPlot.graphId] = [];
-            self.graphStates[newPlot.graphId] = '';  // initialize with empty hash
+            delete self.graphCursors[newPlot.graphId];
+            delete self.rawData[newPlot.graphId];
             if (newPlot.type == 'new') {
                 self.graphs[newPlot.graphDiv] = newPlot.graphId;
+                self.graphDivs[newPlot.graphId] = newPlot.graphDiv;
             } else if (newPlot.type == 'hidden') {
                 self.hiddenGraphs.append(newPlot.graphId);
             } else {
@@ -217,25 +367,45 @@ self.update = function() {
             $log.debug("Added new plot " + newPlot);
         });
 
-        $.each(response.data.updates, function(i, graphDiv) {
-            $q.all([
-                self.getPlotData(self.graphs[graphDiv]),
-                common.pollWithTimeout(
-                function(id) { return function () {
-                    return angular.element('#' + id).size() > 0;
-                };}(graphDiv), 2000, 200)
-            ])
-            .then(function (id) { return function () {
-                self.redraw(id);
-            };}(graphDiv));
+        if (response.data.newPlots.length > 0) {
+            // New graphs may be in the listed page
+            self.refreshList();
+        }
+
+        var version = response.data.version;
+        // Other graphs are fetched when their panels are shown
+        var graphIds = $.grep(response.data.updates, function (graphId) {
+            return self.visible[self.graphDivs[graphId]] === true;
         });
+        if (graphIds.length == 0) {
+            self.version = version;
+            return;
+        }
+        // The update ends when the graphs are fetched
+        return self.loadGraphs(graphIds).then(function () {
+            // Changes are asked again unless the graphs are fetched
+            self.version = Math.max(self.version, version);
+        }, angular.noop);
     }, function(response) {
         $log.error("Failed to receive resposne /histograms/updates");
         self.connected = false;
+    }).
+    finally(function () {
+        self.updating = false;
+        if (self.updateQueued) {
+            self.updateQueued = false;
+            self.update();
+        }
     });
 };
 
+// Updates are pushed by the server; poll only while the stream is down
+self.changes = common.listenChanges(self.update);
+
 $interval(function () {
+    if (self.changes.streaming) {
+        return;
+    }
     if (self.next == 0) {
         self.update();
     } else {
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import json
+import logging
+
+from flask import Response, request
+
+from chainerboard.app import app, get_timeline_handler, runs
+
+
+logger = logging.getLogger(__name__)
+
+# Interval of keep-alive comments, which also detect closed connections
+KEEPALIVE_SECONDS = 15.
+
+
+def _format_change(handler, version):
+    return 'event: change\ndata: %s\n\n' % json.dumps({
+        'version': version,
+        'sessionId': handler.session_id
+    })
+
+
+def _stream_changes(handler):
+    # Clients catch up with changes they missed while connecting
+    version = handler.version
+    yield _format_change(handler, version)
+    while True:
+        current = handler.wait_for_change(
+            version, timeout=KEEPALIVE_SECONDS)
+        if handler.closed:
+            # The run was unloaded
+            return
+        if current == version:
+            yield ': keepalive\n\n'
+        else:
+            version = current
+            yield _format_change(handler, version)
+
+
+@app.route('/updates/stream', methods=['GET'])
+def stream_updates():
+    """
+    Stream of server-sent events notifying changes of timelines. A
+    ``change`` event is sent on connection and whenever any timeline
+    changes, on which clients should request ``/events/updates`` or
+    ``/histograms/updates``. Waiting clients cost no polling. The run is
+    kept loaded while the stream is open.
+
+    Parameters
+        runId (str): Optional run ID in the multi-run mode.
+
+    Returns:
+        Events of ``change`` type whose data has ``version`` (int) of
+        the timelines and ``sessionId`` (str).
+
+    """
+    run_id = request.args.get('runId')
+    handler = get_timeline_handler(run_id, subscribe=True)
+    logger.debug("Client connected to the update stream")
+    response = Response(_stream_changes(handler),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache',
+                                 'X-Accel-Buffering': 'no'})
+    if run_id:
+        response.call_on_close(lambda: runs.unsubscribe(handler))
+    return response
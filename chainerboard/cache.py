@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent cache of parsed timelines for fast restarts
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import hashlib
+import io
+import json
+import logging
+import os
+
+import numpy as np
+import six
+
+from chainerboard.reader import LogReader
+
+logger = logging.getLogger(__name__)
+
+# Incremented whenever the layout of the cache changes
+FORMAT_VERSION = 3
+
+# Minimum interval in seconds between saves of the cache
+CACHE_SAVE_INTERVAL = 30.
+
+_INDEX_NAME = 'index.json'
+
+# Size of a running digest of records
+_DIGEST_SIZE = hashlib.md5().digest_size
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def _default_cache_path(log_path, cache_dir):
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(log_path),
+                            '.%s.chainerboard' % os.path.basename(log_path))
+    name = hashlib.md5(log_path.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, name)
+
+
+def _layout(spec):
+    """ Part of a timeline spec that determines its arrays. """
+    return {k: v for k, v in six.iteritems(spec) if k != 'size'}
+
+
+class TimelineCache(object):
+    """
+    Timelines of a log file saved on disk so that a restarted server only
+    parses records appended since the last save.
+
+    The cache is a directory that holds each array of
+    :meth:`TimelineHandler.state()
+    <chainerboard.timeline_handler.TimelineHandler.state>` as a raw binary
+    file and ``index.json`` that describes them. Arrays are memory mapped
+    copy-on-write on :meth:`restore`, so restoring costs no parsing and
+    pages are only read when they are accessed. As long as the records
+    saved before are unchanged, :meth:`save` only appends the new part of
+    each array.
+
+    Args:
+        log_path (str): Path to the log file.
+        cache_dir (str): Directory to put caches in. The cache is put next
+            to the log file if it is ``None``.
+
+    """
+
+    def __init__(self, log_path, cache_dir=None):
+        self.log_path = os.path.abspath(log_path)
+        self.path = _default_cache_path(self.log_path, cache_dir)
+        # Index that is on disk, or None if it is not known yet
+        self._index = None
+
+    def _read_index(self):
+        try:
+            with io.open(os.path.join(self.path, _INDEX_NAME), 'r',
+                         encoding='utf-8') as fin:
+                index = json.load(fin)
+        except (IOError, OSError, ValueError):
+            return None
+        if index.get('version') != FORMAT_VERSION or \
+                index.get('logPath') != self.log_path:
+            return None
+        return index
+
+    def _write_index(self, index):
+        path = os.path.join(self.path, _INDEX_NAME)
+        with io.open(path + '.tmp', 'w', encoding='utf-8') as fout:
+            fout.write(six.text_type(json.dumps(index)))
+        # Readers never see a partially written index
+        _replace(path + '.tmp', path)
+
+    def _map(self, entry):
+        dtype = np.dtype(entry['dtype'])
+        shape = (entry['length'], ) + tuple(entry['rowShape'])
+        if entry['length'] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.asarray(np.memmap(
+            os.path.join(self.path, entry['file']), dtype=dtype, mode='c',
+            shape=shape))
+
+    def restore(self, handler):
+        """
+        Restore ``handler`` from the cache if the log file still starts
+        with the records that were saved.
+
+        Args:
+            handler (chainerboard.timeline_handler.TimelineHandler): Handler
+                to restore, whose timelines are replaced.
+
+        Returns:
+            bool: True if the handler was restored.
+
+        """
+        index = self._read_index()
+        if index is None or index['meta']['reader'] is None:
+            return False
+        reader = LogReader.restore(self.log_path, index['meta']['reader'])
+        if not reader.verify():
+            logger.info("Log file was rewritten; ignoring cache %s" %
+                        self.path)
+            return False
+        try:
+            arrays = {name: self._map(entry)
+                      for name, entry in six.iteritems(index['arrays'])}
+        except (IOError, OSError, ValueError):
+            logger.warning("Broken cache %s" % self.path)
+            return False
+        handler.restore(self.log_path, index['meta'], arrays)
+        self._index = index
+        logger.info("Restored %d records from cache %s" %
+                    (index['meta']['doneIdx'], self.path))
+        return True
+
+    def _appendable(self, meta, arrays):
+        """ True if arrays on disk are prefixes of ``arrays``. """
+        index = self._index
+        if index is None:
+            return False
+        for kind in ('events', 'tensors'):
+            saved = index['meta'][kind]
+            # Specs tell the arrays of a timeline, e.g. a timeline becomes
+            # sparse once a record lacks its key
+            current = json.loads(json.dumps(meta[kind][:len(saved)]))
+            if [(g, _layout(spec)) for g, spec in saved] != \
+                    [(g, _layout(spec)) for g, spec in current]:
+                return False
+        n = index['arrays']['digest/chain']['length']
+        if n == 0:
+            return True
+        chain = arrays['digest/chain']
+        if len(chain) < n:
+            return False
+        # Running digest covers all the records saved before
+        saved_chain = self._map(index['arrays']['digest/chain'])
+        return bool(np.array_equal(saved_chain[n - _DIGEST_SIZE:],
+                                   chain[n - _DIGEST_SIZE:n]))
+
+    def save(self, handler):
+        """
+        Save the timelines of ``handler``.
+
+        Args:
+            handler (chainerboard.timeline_handler.TimelineHandler): Handler
+                that has loaded the log file.
+
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        if self._index is None:
+            self._index = self._read_index()
+        with handler.lock:
+            meta, arrays = handler.state()
+            if meta['doneIdx'] == 0:
+                return
+            if self._appendable(meta, arrays):
+                entries = dict(self._index['arrays'])
+                next_file = self._index['nextFile']
+            else:
+                entries = {}
+                next_file = 0 if self._index is None \
+                    else self._index['nextFile']
+            for name, arr in six.iteritems(arrays):
+                entry = entries.get(name)
+                arr = np.asarray(arr)
+                if arr.dtype == object:
+                    arr = arr.astype(np.float64)
+                if entry is None or entry['length'] > len(arr) or \
+                        arr.dtype != np.dtype(entry['dtype']) or \
+                        tuple(entry['rowShape']) != arr.shape[1:]:
+                    entry = {'file': '%d.bin' % next_file,
+                             'dtype': arr.dtype.str, 'length': 0,
+                             'rowShape': list(arr.shape[1:])}
+                    next_file += 1
+                entries[name] = self._write_array(entry, arr)
+        index = {'version': FORMAT_VERSION, 'logPath': self.log_path,
+                 'meta': meta, 'arrays': entries, 'nextFile': next_file}
+        self._write_index(index)
+        self._index = index
+        self._remove_unused(index)
+
+    def _write_array(self, entry, arr):
+        path = os.path.join(self.path, entry['file'])
+        row_size = np.dtype(entry['dtype']).itemsize * int(
+            np.prod(entry['rowShape']))
+        with open(path, 'r+b' if entry['length'] > 0 else 'wb') as fout:
+            # Drop bytes written after the index was saved
+            fout.seek(entry['length'] * row_size)
+            fout.truncate()
+            fout.write(np.ascontiguousarray(arr[entry['length']:]).tobytes())
+        return dict(entry, length=len(arr))
+
+    def _remove_unused(self, index):
+        used = set(entry['file'] for entry in six.itervalues(index['arrays']))
+        for name in os.listdir(self.path):
+            if name.endswith('.bin') and name not in used:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    # May be mapped on some platforms; removed next time
+                    pass
@@ -2,12 +2,15 @@
 from __future__ import absolute_import, division, print_function
 
 import logging
+import os
 
 import click
 
 import chainerboard
-from chainerboard.app import app, timeline_handler
-from chainerboard.watcher import watch_file
+from chainerboard.app import app, runs, timeline_handler
+from chainerboard.cache import TimelineCache
+from chainerboard.runs import RunPattern
+from chainerboard.watcher import watch_file, watch_runs
 
 logging.basicConfig(level=logging.INFO)
 logging.getLogger('werkzeug').setLevel(logging.WARN)
@@ -16,15 +19,44 @@ logger = logging.getLogger(__name__)
 
 
 @click.command('chainerboard')
-@click.argument('inputfile', type=click.Path(exists=True))
+@click.argument('inputfile')
 @click.option('-p', '--port', type=int, default=6006, help="Port number to use")
+@click.option('--workers', type=int, default=4,
+              help="Number of threads to parse logs of runs")
+@click.option('--max-loaded', type=int, default=16,
+              help="Maximum number of runs to keep in memory")
+@click.option('--interval', type=float, default=1.,
+              help="Minimum interval in seconds between reloads of each "
+                   "modified log file")
+@click.option('--cache-dir', type=click.Path(file_okay=False), default=None,
+              help="Directory to cache parsed logs in (default: next to "
+                   "each log file)")
+@click.option('--no-cache', is_flag=True, default=False,
+              help="Parse logs from scratch without caching them")
 @click.version_option(chainerboard.__version__, prog_name='chainerboard')
-def cli(inputfile, port):
+def cli(inputfile, port, workers, max_loaded, interval, cache_dir,
+        no_cache):
     """
     An unofficial visualization tool for chainer, inspired by tensorboard
     chainerboard allows visualization of log from chainer.extensions.LogReport.
+
+    INPUTFILE is a log file, or a directory or a glob pattern (e.g.
+    'result/*/log') of log files of runs to compare.
     """
-    with watch_file(inputfile, timeline_handler):
+    if os.path.isfile(inputfile):
+        cache = None if no_cache else TimelineCache(inputfile, cache_dir)
+        watcher = watch_file(inputfile, timeline_handler, cache, interval)
+    elif os.path.isdir(inputfile) or any(c in inputfile for c in '*?['):
+        runs.configure(workers, max_loaded, interval,
+                       use_cache=not no_cache, cache_dir=cache_dir)
+        watcher = watch_runs(RunPattern(inputfile), runs)
+    else:
+        raise click.BadParameter(
+            "%s is neither a file, a directory nor a glob pattern" %
+            inputfile, param_hint='INPUTFILE')
+    with watcher:
         # use_reloader=False because it makes watchdog unstoppable
         logger.info('Running on http://localhost:%d' % port)
-        app.run(host='0.0.0.0', port=port, use_reloader=False)
+        # threaded because streams of updates keep their connections
+        app.run(host='0.0.0.0', port=port, use_reloader=False,
+                threaded=True)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Growable typed arrays for storing time-dependent data
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+
+
+class Column(object):
+    """
+    Growable array backed by :class:`numpy.ndarray`. Each element is a
+    scalar, or a row of ``width`` values for a two dimensional column.
+
+    Capacity is doubled whenever the array is full, so appending is amortized
+    O(1) and values are stored as packed ``dtype`` instead of boxed Python
+    objects. Values that have been appended are never modified in place, so
+    a :meth:`view` is an immutable snapshot that can be read without a lock
+    while the column keeps growing.
+
+    Args:
+        dtype: Numpy dtype of the values.
+        capacity (int): Initial capacity.
+        width (int): Number of values of a row, or ``None`` for scalars.
+
+    """
+
+    def __init__(self, dtype=np.float64, capacity=16, width=None):
+        shape = (capacity, ) if width is None else (capacity, width)
+        self._data = np.empty(shape, dtype=dtype)
+        self._size = 0
+
+    @classmethod
+    def from_array(cls, arr):
+        """
+        Wrap ``arr`` (e.g. a copy-on-write memory map) without copying it.
+        It is copied when the column grows beyond its length.
+        """
+        column = cls.__new__(cls)
+        column._data = arr
+        column._size = len(arr)
+        return column
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        return self.view()[key]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def _reserve(self, size):
+        if size <= len(self._data):
+            return
+        capacity = max(len(self._data), 1)
+        while capacity < size:
+            capacity *= 2
+        data = np.empty((capacity, ) + self._data.shape[1:],
+                        dtype=self._data.dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def append(self, value):
+        """
+        Append a value, or a row of values for a two dimensional column.
+        ``None`` is stored as NaN.
+        """
+        self._reserve(self._size + 1)
+        if self._data.ndim > 1:
+            value = np.asarray(value, dtype=self._data.dtype)
+        elif value is None:
+            value = np.nan
+        self._data[self._size] = value
+        self._size += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        self._reserve(self._size + len(values))
+        self._data[self._size:self._size + len(values)] = values
+        self._size += len(values)
+
+    def truncate(self, n):
+        """
+        Keep only the first ``n`` values. Values are moved to a new buffer
+        (copy-on-write), so views taken before are never overwritten by
+        values appended afterwards.
+        """
+        if n < self._size:
+            data = np.empty(self._data.shape, dtype=self._data.dtype)
+            data[:n] = self._data[:n]
+            self._data = data
+        self._size = min(n, self._size)
+
+    def view(self):
+        """
+        Returns:
+            numpy.ndarray: View (not copy) of the values. It must not be
+            modified.
+
+        """
+        return self._data[:self._size]
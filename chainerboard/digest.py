@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Digests for detecting rewrites of log records
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import binascii
+import hashlib
+import json
+
+import numpy as np
+import six
+
+_DIGEST_SIZE = hashlib.md5().digest_size
+
+
+def hash_record(dic):
+    """
+    Hash a single json parsable record.
+
+    Args:
+        dic (dict): Json parsable object.
+
+    Returns:
+        bytes: 16 bytes binary digest
+
+    """
+    json_dump = json.dumps(dic, sort_keys=True).encode('utf-8')
+    return hashlib.md5(json_dump).digest()
+
+
+class RecordDigest(object):
+    """
+    Chained digest over a sequence of log records.
+
+    Digest of each record is folded into a running digest
+    (``chain[i] = md5(chain[i - 1] + md5(record[i]))``). Both are stored by
+    index, so appending is O(record size) and verifying a prefix of the log
+    does not require touching all the records.
+    """
+
+    def __init__(self):
+        self._records = bytearray()
+        self._chain = bytearray()
+
+    def __len__(self):
+        return len(self._records) // _DIGEST_SIZE
+
+    def _record_at(self, i):
+        return bytes(self._records[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE])
+
+    def chain_at(self, i):
+        """ Running digest (bytes) of records up to ``i`` (inclusive). """
+        return bytes(self._chain[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE])
+
+    @property
+    def digest(self):
+        """ Running digest (str) of all the records in hex. """
+        if len(self) == 0:
+            return hashlib.md5().hexdigest()
+        return binascii.hexlify(self.chain_at(len(self) - 1)).decode('ascii')
+
+    def append(self, dic):
+        """ Fold a record into the digest. """
+        record = hash_record(dic)
+        prev = self.chain_at(len(self) - 1) if len(self) > 0 else b''
+        self._records.extend(record)
+        self._chain.extend(hashlib.md5(prev + record).digest())
+
+    def truncate(self, n):
+        """ Forget records from ``n``-th. """
+        del self._records[n * _DIGEST_SIZE:]
+        del self._chain[n * _DIGEST_SIZE:]
+
+    def state(self):
+        """
+        Returns:
+            dict: Copies of digests of records and running digests
+            (numpy.ndarray of uint8) to be given to :meth:`restore`.
+
+        """
+        return {'records': np.frombuffer(bytes(self._records), np.uint8),
+                'chain': np.frombuffer(bytes(self._chain), np.uint8)}
+
+    @classmethod
+    def restore(cls, arrays):
+        """ Create a digest from arrays given by :meth:`state`. """
+        digest = cls()
+        digest._records = bytearray(arrays['records'].tobytes())
+        digest._chain = bytearray(arrays['chain'].tobytes())
+        return digest
+
+    def is_consistent(self, logs, start=0):
+        """
+        Check in constant time that ``logs`` does not contradict the records
+        folded so far. Only the last record that overlaps with the known
+        records is compared.
+
+        Args:
+            logs (list of dict): Records, ``logs[0]`` being ``start``-th
+                record of the whole log.
+            start (int): Index of ``logs[0]``.
+
+        Returns:
+            bool
+
+        """
+        end = start + len(logs)
+        if end < len(self):
+            return False
+        if start >= len(self):
+            return True
+        i = len(self) - 1
+        return hash_record(logs[i - start]) == self._record_at(i)
+
+    def first_divergence(self, logs, start=0):
+        """
+        Find the first record that is different from the records folded so
+        far. This compares all the overlapping records.
+
+        Args:
+            logs (list of dict): Records, ``logs[0]`` being ``start``-th
+                record of the whole log.
+            start (int): Index of ``logs[0]``.
+
+        Returns:
+            int or None: Index of the first diverging record in the whole log
+            or ``None`` if ``logs`` is consistent.
+
+        """
+        for i in six.moves.xrange(start, min(len(self), start + len(logs))):
+            if hash_record(logs[i - start]) != self._record_at(i):
+                return i
+        if start + len(logs) < len(self):
+            return start + len(logs)
+        return None
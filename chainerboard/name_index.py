@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Index of metric names for prefix and regular expression search
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import itertools
+import re
+
+import six
+
+# Separator of components of names, e.g. ``main/l1/W/data/min``
+SEPARATOR = '/'
+
+
+class _Node(object):
+    """ Node of :class:`NameTrie`, which is never modified once shared. """
+    __slots__ = ('children', 'name', 'size')
+
+    def __init__(self, children, name, size):
+        # Mapping from a component (str) to the child node
+        self.children = children
+        # Name that ends at this node or None
+        self.name = name
+        # Number of names in the subtree
+        self.size = size
+
+
+_EMPTY = _Node({}, None, 0)
+
+
+def _walk(node):
+    """ Names in the subtree of ``node`` in order of components. """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.name is not None:
+            yield node.name
+        stack.extend(node.children[c]
+                     for c in sorted(node.children, reverse=True))
+
+
+class NameTrie(object):
+    """
+    Immutable trie of names over their ``/``-separated components.
+    :meth:`add` returns a new trie that shares the unchanged nodes, so a
+    trie can be read without locks while newer ones are built.
+
+    Names are iterated in order of their components, e.g. ``a``, ``a/b``,
+    ``a-c``.
+
+    Args:
+        root (_Node): Root node, or None for an empty trie.
+
+    """
+
+    def __init__(self, root=None):
+        self._root = _EMPTY if root is None else root
+
+    def __len__(self):
+        return self._root.size
+
+    def __iter__(self):
+        return _walk(self._root)
+
+    def __contains__(self, name):
+        node = self._root
+        for c in name.split(SEPARATOR):
+            node = node.children.get(c)
+            if node is None:
+                return False
+        return node.name is not None
+
+    def add(self, name):
+        """
+        Returns:
+            NameTrie: Trie that also has ``name``, which is this trie if it
+            already has the name.
+
+        """
+        if name in self:
+            return self
+        components = name.split(SEPARATOR)
+        # Copy the nodes on the path from the root
+        path = [self._root]
+        for c in components:
+            path.append(path[-1].children.get(c, _EMPTY))
+        node = _Node(path[-1].children, name, path[-1].size + 1)
+        for c, parent in zip(reversed(components), reversed(path[:-1])):
+            children = dict(parent.children)
+            children[c] = node
+            node = _Node(children, parent.name, parent.size + 1)
+        return NameTrie(node)
+
+    def _prefixed(self, prefix):
+        """ Nodes whose subtrees are the names starting with ``prefix``. """
+        components = prefix.split(SEPARATOR)
+        node = self._root
+        for c in components[:-1]:
+            node = node.children.get(c)
+            if node is None:
+                return []
+        # The last component may be partial
+        last = components[-1]
+        return [node.children[c] for c in sorted(node.children)
+                if c.startswith(last)]
+
+    def names(self, prefix=''):
+        """
+        Iterate names starting with ``prefix`` in order of components.
+        Only the nodes under the prefix are visited.
+        """
+        return itertools.chain.from_iterable(
+            _walk(node) for node in self._prefixed(prefix))
+
+    def count(self, prefix=''):
+        """ Number of names starting with ``prefix``, found in O(depth). """
+        return sum(node.size for node in self._prefixed(prefix))
+
+    def search(self, prefix=None, regex=None, offset=0, limit=None):
+        """
+        Search names by a prefix and a regular expression.
+
+        Args:
+            prefix (str): Prefix that names must start with, or None.
+            regex (str): Regular expression that must match a part of
+                names, or None. Only the names under ``prefix`` are tested.
+            offset (int): Number of matched names to skip.
+            limit (int): Maximum number of names to return, or None.
+
+        Returns:
+            tuple: Matched names from ``offset`` (list of str) and the
+            number of all the matched names (int).
+
+        Raises:
+            re.error: If ``regex`` is malformed.
+
+        """
+        names = self.names(prefix or '')
+        stop = None if limit is None else offset + limit
+        if not regex:
+            return (list(itertools.islice(names, offset, stop)),
+                    self.count(prefix or ''))
+        pattern = re.compile(regex)
+        matched = [n for n in names if pattern.search(n)]
+        return matched[offset:stop], len(matched)
+
+
+class NameIndex(object):
+    """
+    Growing index of metric names to resolve keys of records without
+    scanning all of them. Names are held by a :class:`NameTrie`, whose
+    latest version is :attr:`trie`, and by each of their components.
+    """
+
+    def __init__(self):
+        self.trie = NameTrie()
+        # Mapping from a component (str) to names that have it (set of str)
+        self._components = {}
+
+    def __len__(self):
+        return len(self.trie)
+
+    def __iter__(self):
+        return iter(self.trie)
+
+    def __contains__(self, name):
+        return name in self.trie
+
+    def add(self, name):
+        """
+        Returns:
+            bool: True if ``name`` is new.
+
+        """
+        if name in self.trie:
+            return False
+        self.trie = self.trie.add(name)
+        for c in set(name.split(SEPARATOR)):
+            self._components.setdefault(c, set()).add(name)
+        return True
+
+    def update(self, names):
+        for name in names:
+            self.add(name)
+
+    def with_component(self, component):
+        """ Names that have ``component`` (frozenset of str). """
+        return frozenset(self._components.get(component, ()))
+
+    def _matching_components(self, substring, match):
+        if SEPARATOR in substring:
+            # Spans components
+            return set(n for n in self.trie if match(n))
+        ret = set()
+        for c, names in six.iteritems(self._components):
+            if substring in c:
+                ret.update(n for n in names if match(n))
+        return ret
+
+    def containing(self, substring):
+        """
+        Names that contain ``substring`` (set of str). Unless it spans
+        components, only distinct components are scanned.
+        """
+        return self._matching_components(
+            substring, lambda n: substring in n)
+
+    def ending_with(self, suffix):
+        """ Names that end with ``suffix`` (set of str). """
+        return self._matching_components(
+            suffix, lambda n: n.endswith(suffix))
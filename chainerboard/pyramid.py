@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution aggregates of a series for zoomable range queries
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+
+from chainerboard.column import Column
+
+
+def _aggregate_pairs(mins, maxs, sums, counts):
+    """ Aggregate adjacent pairs of buckets into one bucket. """
+    if len(mins) % 2 == 1:
+        mins = np.append(mins, np.inf)
+        maxs = np.append(maxs, -np.inf)
+        sums = np.append(sums, 0.)
+        counts = np.append(counts, 0.)
+    return (mins.reshape(-1, 2).min(axis=1),
+            maxs.reshape(-1, 2).max(axis=1),
+            sums.reshape(-1, 2).sum(axis=1),
+            counts.reshape(-1, 2).sum(axis=1))
+
+
+class Pyramid(object):
+    """
+    Min, max and mean of a series aggregated at power-of-two levels. A
+    bucket of level ``l`` covers ``2 ** l`` points and is made from two
+    buckets of level ``l - 1``; level 0 is the series itself and is not
+    stored. Invalid values (NaN or inf) are ignored in aggregation.
+
+    Only complete buckets are stored, so the pyramid is append-only:
+    appending ``k`` points appends ``O(k)`` buckets and never modifies
+    existing ones. The last incomplete bucket of a level is aggregated on
+    query from at most one stored bucket of each lower level.
+    """
+
+    def __init__(self):
+        # list of (min, max, sum, count) columns of levels 1, 2, ...
+        self._levels = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def n_levels(self):
+        """
+        Number of levels including level 0 (int). The top level has a
+        single bucket that covers all the points.
+        """
+        return max(self._size - 1, 0).bit_length() + 1
+
+    @staticmethod
+    def _base(values):
+        valid = np.isfinite(values)
+        return (np.where(valid, values, np.inf),
+                np.where(valid, values, -np.inf),
+                np.where(valid, values, 0.),
+                valid.astype(np.float64))
+
+    def update(self, values):
+        """
+        Update the pyramid with points appended to the series.
+
+        Args:
+            values (numpy.ndarray): The whole series, the first
+                ``len(self)`` points of which must be unchanged.
+
+        """
+        n = len(values)
+        if n <= self._size:
+            return
+        level = 1
+        while n >> level > 0:
+            if level > len(self._levels):
+                self._levels.append(tuple(Column() for _ in range(4)))
+            columns = self._levels[level - 1]
+            have = len(columns[0])
+            need = n >> level
+            if need > have:
+                if level == 1:
+                    lower = self._base(values[2 * have:2 * need])
+                else:
+                    lower = tuple(c[2 * have:2 * need]
+                                  for c in self._levels[level - 2])
+                for column, a in zip(columns, _aggregate_pairs(*lower)):
+                    column.extend(a)
+            level += 1
+        self._size = n
+
+    def truncate(self, n, values):
+        """
+        Keep only the first ``n`` points.
+
+        Args:
+            n (int): Number of points to keep.
+            values (numpy.ndarray): The series truncated to ``n`` points.
+
+        """
+        if n >= self._size:
+            return
+        for level, columns in enumerate(self._levels, 1):
+            for column in columns:
+                column.truncate(n >> level)
+        # Levels without complete buckets
+        del self._levels[max(n, 1).bit_length() - 1:]
+        self._size = n
+
+    def snapshot(self):
+        """
+        Get a read-only copy of the pyramid that shares its buckets, which
+        can be queried without a lock while the pyramid is updated.
+        """
+        pyramid = Pyramid()
+        pyramid._levels = [tuple(c.view() for c in columns)
+                           for columns in self._levels]
+        pyramid._size = self._size
+        return pyramid
+
+    def _partial(self, level, values):
+        """
+        Aggregate the incomplete bucket of ``level`` at the end of the
+        series from complete buckets of lower levels.
+        """
+        aggregates = [[np.inf], [-np.inf], [0.], [0.]]
+        pos = (self._size >> level) << level
+        for lower in range(level - 1, 0, -1):
+            if self._size >> lower & 1:
+                for a, c in zip(aggregates, self._levels[lower - 1]):
+                    a.append(c[pos >> lower])
+                pos += 1 << lower
+        if pos < self._size:
+            for a, b in zip(aggregates, self._base(values[pos:pos + 1])):
+                a.append(b[0])
+        mins, maxs, sums, counts = aggregates
+        return min(mins), max(maxs), sum(sums), sum(counts)
+
+    def choose_level(self, n_points, width):
+        """
+        Choose the finest level that has at most ``width`` buckets for
+        ``n_points`` points.
+        """
+        level = 0
+        while level < self.n_levels - 1 and \
+                -(-n_points // (1 << level)) > width:
+            level += 1
+        return level
+
+    def query(self, start, stop, width, values):
+        """
+        Get aggregates of points from ``start`` to ``stop`` (exclusive) at a
+        level with at most about ``width`` buckets.
+
+        Args:
+            start (int): Index of the first point.
+            stop (int): Index of the last point plus one.
+            width (int): Maximum number of buckets (e.g. width in pixels).
+            values (numpy.ndarray): The series.
+
+        Returns:
+            tuple: Level (int), index of the first point of each bucket,
+            minimum, maximum and mean of each bucket (numpy.ndarray). Empty
+            buckets have NaN. Buckets are aligned to multiples of their size,
+            so the first and the last ones may also aggregate points just
+            out of the range.
+
+        """
+        level = self.choose_level(stop - start, width)
+        if stop <= start:
+            empty = np.zeros(0)
+            return level, np.zeros(0, dtype=np.int64), empty, empty, empty
+        if level == 0:
+            y = np.asarray(values[start:stop], dtype=np.float64)
+            y = np.where(np.isfinite(y), y, np.nan)
+            return level, np.arange(start, stop), y, y, y
+        lo = start >> level
+        hi = ((stop - 1) >> level) + 1
+        complete = self._size >> level
+        if complete > 0:
+            mins, maxs, sums, counts = (
+                c[lo:min(hi, complete)] for c in self._levels[level - 1])
+        else:
+            mins = maxs = sums = counts = np.zeros(0)
+        if hi > complete:
+            mins, maxs, sums, counts = (
+                np.append(c, a) for c, a in
+                zip((mins, maxs, sums, counts), self._partial(level, values)))
+        empty = counts == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(empty, np.nan, sums / counts)
+        idx = np.maximum(np.arange(lo, hi) << level, start)
+        return (level, idx, np.where(empty, np.nan, mins),
+                np.where(empty, np.nan, maxs), means)
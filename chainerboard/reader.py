@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental reader for log files written by LogReport
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import base64
+import codecs
+import json
+import logging
+import os
+
+from chainerboard.exceptions import ParseError
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACES = ' \t\n\r'
+
+
+def _skip_whitespaces(text, pos):
+    while pos < len(text) and text[pos] in _WHITESPACES:
+        pos += 1
+    return pos
+
+
+class LogReader(object):
+    """
+    Incrementally read a json array of records written by
+    ``chainer.training.extensions.LogReport``.
+
+    The reader remembers the byte offset right after the last record that was
+    fully parsed. On the next :meth:`read`, it checks that the bytes at the
+    head of the file and just before that offset are unchanged and decodes
+    only the records after it. A truncated tail (i.e. a file that is being
+    written) is left as is and retried on the next call.
+
+    .. warning:: Only fixed size windows of the already parsed bytes are
+                 compared, so a rewrite that touches neither of them is not
+                 detected.
+
+    Args:
+        path (str): Path to the log file.
+
+    """
+
+    _FINGERPRINT_SIZE = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self._decoder = json.JSONDecoder()
+        self.reset()
+
+    def reset(self):
+        """ Forget everything that was read so far. """
+        self._offset = 0
+        self._n_records = 0
+        self._head = b''
+        self._tail = b''
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def n_records(self):
+        return self._n_records
+
+    def state(self):
+        """
+        Returns:
+            dict: Json serializable state to be given to :meth:`restore`.
+
+        """
+        return {
+            'offset': self._offset,
+            'nRecords': self._n_records,
+            'head': base64.b64encode(self._head).decode('ascii'),
+            'tail': base64.b64encode(self._tail).decode('ascii')
+        }
+
+    @classmethod
+    def restore(cls, path, state):
+        """
+        Create a reader that resumes from a state given by :meth:`state`.
+        """
+        reader = cls(path)
+        reader._offset = state['offset']
+        reader._n_records = state['nRecords']
+        reader._head = base64.b64decode(state['head'].encode('ascii'))
+        reader._tail = base64.b64decode(state['tail'].encode('ascii'))
+        return reader
+
+    def verify(self):
+        """
+        Check that the bytes read so far are unchanged in the file.
+
+        Returns:
+            bool: False if the file was rewritten or does not exist.
+
+        """
+        try:
+            with open(self.path, 'rb') as fin:
+                return self._verify(fin)
+        except (IOError, OSError):
+            return False
+
+    def _verify(self, fin):
+        if self._offset == 0:
+            return True
+        fin.seek(0, os.SEEK_END)
+        if fin.tell() < self._offset:
+            return False
+        fin.seek(0)
+        if fin.read(len(self._head)) != self._head:
+            return False
+        fin.seek(self._offset - len(self._tail))
+        return fin.read(len(self._tail)) == self._tail
+
+    def _decode(self, text):
+        """
+        Decode records from ``text``, which starts at ``self._offset``.
+
+        Returns:
+            tuple: List of decoded records (list of dict) and the position
+            (int) in ``text`` right after the last decoded record.
+
+        """
+        records = []
+        pos = 0
+        end = 0
+        if self._n_records == 0:
+            pos = _skip_whitespaces(text, pos)
+            if pos >= len(text):
+                return records, end
+            if text[pos] != '[':
+                raise ParseError(
+                    'Log file %s is not a json array.' % self.path)
+            pos += 1
+        while True:
+            pos = _skip_whitespaces(text, pos)
+            if pos >= len(text) or text[pos] == ']':
+                break
+            if self._n_records + len(records) > 0:
+                if text[pos] != ',':
+                    raise ParseError(
+                        "Expected ',' at byte %d of %s." %
+                        (self._offset + len(text[:pos].encode('utf-8')),
+                         self.path))
+                pos = _skip_whitespaces(text, pos + 1)
+            try:
+                obj, pos = self._decoder.raw_decode(text, pos)
+            except ValueError:
+                # Most likely the file is in the middle of being written
+                logger.debug('Incomplete record in %s; retrying later' %
+                             self.path)
+                break
+            if not isinstance(obj, dict):
+                raise ParseError(
+                    'Log file %s contains a non-dict record.' % self.path)
+            records.append(obj)
+            end = pos
+        return records, end
+
+    def read(self):
+        """
+        Read records that were appended since the last call.
+
+        Returns:
+            tuple: ``(start, records)`` where ``records`` (list of dict) are
+            the newly decoded records and ``start`` (int) is the index of
+            ``records[0]`` in the whole log. ``start`` is ``0`` if the file
+            was rewritten and hence was read from the beginning.
+
+        """
+        with open(self.path, 'rb') as fin:
+            if not self._verify(fin):
+                logger.debug(
+                    'Parsed part of %s has changed; reading from the '
+                    'beginning' % self.path)
+                self.reset()
+            fin.seek(self._offset)
+            buf = fin.read()
+
+        # Incremental decoder keeps a truncated multibyte character undecoded
+        text = codecs.getincrementaldecoder('utf-8')().decode(buf)
+        start = self._n_records
+        records, end = self._decode(text)
+        if len(records) > 0:
+            consumed = buf[:len(text[:end].encode('utf-8'))]
+            if len(self._head) < self._FINGERPRINT_SIZE:
+                self._head += \
+                    consumed[:self._FINGERPRINT_SIZE - len(self._head)]
+            self._tail = (self._tail + consumed)[-self._FINGERPRINT_SIZE:]
+            self._offset += len(consumed)
+            self._n_records += len(records)
+        return start, records
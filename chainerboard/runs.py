@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of runs for watching many log files with one server
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import fnmatch
+import glob
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from chainerboard.cache import CACHE_SAVE_INTERVAL, TimelineCache
+from chainerboard.timeline_handler import TimelineHandler
+
+
+logger = logging.getLogger(__name__)
+
+# Default file name of chainer.training.extensions.LogReport
+LOG_NAME = 'log'
+
+
+def _has_magic(s):
+    return any(c in s for c in '*?[')
+
+
+class RunPattern(object):
+    """
+    Log files of runs given by a directory or a glob pattern. A directory
+    matches files named ``log`` in it and its subdirectories.
+
+    Args:
+        pattern (str): Directory or glob pattern.
+
+    """
+
+    def __init__(self, pattern):
+        if os.path.isdir(pattern):
+            self.root = os.path.abspath(pattern)
+            self._glob = None
+        else:
+            self._glob = os.path.abspath(pattern)
+            # Longest directory without glob characters
+            root = os.path.dirname(self._glob)
+            while _has_magic(root):
+                root = os.path.dirname(root)
+            self.root = root
+
+    def match(self, path):
+        """ True if ``path`` is a log file of a run. """
+        path = os.path.abspath(path)
+        if self._glob is not None:
+            # Like glob, wildcards do not match across directories
+            parts = path.split(os.sep)
+            patterns = self._glob.split(os.sep)
+            return len(parts) == len(patterns) and all(
+                fnmatch.fnmatch(p, pat) for p, pat in zip(parts, patterns))
+        return (os.path.basename(path) == LOG_NAME and
+                path.startswith(os.path.join(self.root, '')))
+
+    def find(self):
+        """
+        Returns:
+            list of str: Paths of log files that exist now.
+
+        """
+        if self._glob is not None:
+            paths = glob.glob(self._glob)
+        else:
+            paths = [os.path.join(d, LOG_NAME)
+                     for d, _, files in os.walk(self.root)
+                     if LOG_NAME in files]
+        return sorted(p for p in paths if os.path.isfile(p))
+
+    def run_id(self, path):
+        """
+        Run ID of a log file, which is its path relative to the root
+        without the trailing ``/log``.
+        """
+        run_id = os.path.relpath(os.path.abspath(path), self.root)
+        run_id = run_id.replace(os.sep, '/')
+        if run_id.endswith('/' + LOG_NAME):
+            run_id = run_id[:-len(LOG_NAME) - 1]
+        return run_id
+
+
+class RunRegistry(object):
+    """
+    Registry of runs, each of which is a log file parsed by its own
+    :class:`~chainerboard.timeline_handler.TimelineHandler`.
+
+    Runs are only registered until they are viewed; a handler is created
+    and the log is parsed on the first :meth:`get`. Only the
+    ``max_loaded`` most recently viewed runs are kept loaded, and only the
+    loaded runs are parsed again on modification. Runs that are subscribed
+    to or being parsed are never unloaded, so that their clients do not
+    load them again and unload others in turn; the limit may be exceeded
+    until they are unsubscribed. Parsing happens in a
+    pool of ``n_workers`` threads. Like
+    :class:`~chainerboard.watcher.BackgroundLoader`, each run is parsed at
+    most once per ``interval`` seconds, and modifications notified while
+    it is being parsed or waiting for the interval are collapsed into one
+    parse that runs after them. With ``use_cache``, a run is
+    restored from its :class:`~chainerboard.cache.TimelineCache` on the
+    first load. The cache is saved after the first load, then at most once
+    per :data:`~chainerboard.cache.CACHE_SAVE_INTERVAL` seconds, and when
+    the run is unloaded or the registry is closed.
+
+    Args:
+        n_workers (int): Number of threads to parse logs.
+        max_loaded (int): Maximum number of runs to keep loaded.
+        interval (float): Minimum interval in seconds between the starts of
+            two parses of a run.
+        use_cache (bool): Whether to cache parsed logs on disk.
+        cache_dir (str): Directory of caches, or ``None`` to put them next
+            to the log files.
+
+    """
+
+    def __init__(self, n_workers=4, max_loaded=16, interval=1.,
+                 use_cache=False, cache_dir=None):
+        self._n_workers = n_workers
+        self._max_loaded = max_loaded
+        self._interval = interval
+        self._use_cache = use_cache
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._pool = None
+        self._paths = OrderedDict()  # run id -> path
+        self._run_ids = {}  # path -> run id
+        self._handlers = OrderedDict()  # run id -> handler in LRU order
+        self._subscribers = {}  # handler -> number of subscriptions
+        # run id -> (handler, AsyncResult of the running load, or None while
+        # waiting for the interval)
+        self._loading = {}
+        self._stale = set()  # run ids modified while loading
+        self._last_load = {}  # run id -> time when the last load started
+        self._n_pending = {}  # run id -> number of notifications not loaded
+        self._caches = {}  # run id -> (TimelineCache, lock to access it)
+        self._last_save = {}  # run id -> time of the last save of its cache
+        self._unsaved = {}  # handler -> run id, of loads not saved yet
+        self._closing = False
+        # Statistics to tune the interval
+        self.n_requests = 0
+        self.n_loads = 0
+
+    def configure(self, n_workers, max_loaded, interval=1., use_cache=False,
+                  cache_dir=None):
+        """
+        Change the settings. It must be called before any run is loaded.
+        """
+        assert self._pool is None
+        self._n_workers = n_workers
+        self._max_loaded = max_loaded
+        self._interval = interval
+        self._use_cache = use_cache
+        self._cache_dir = cache_dir
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, run_id):
+        return run_id in self._paths
+
+    def add(self, run_id, path):
+        """ Register a run if it is not registered yet. """
+        path = os.path.abspath(path)
+        with self._lock:
+            if run_id in self._paths:
+                return
+            logger.info("Found run %s at %s" % (run_id, path))
+            self._paths[run_id] = path
+            self._run_ids[path] = run_id
+
+    def discover(self, pattern):
+        """
+        Register all the runs that match ``pattern``.
+
+        Args:
+            pattern (RunPattern): Pattern of runs.
+
+        """
+        for path in pattern.find():
+            self.add(pattern.run_id(path), path)
+
+    def run_ids(self):
+        with self._lock:
+            return list(self._paths)
+
+    def path(self, run_id):
+        return self._paths[run_id]
+
+    def is_loaded(self, run_id):
+        return run_id in self._handlers
+
+    @property
+    def n_collapsed(self):
+        """ Number of notifications that did not cause their own load (int) """
+        with self._lock:
+            return self.n_requests - self.n_loads - sum(
+                six.itervalues(self._n_pending))
+
+    def get(self, run_id, subscribe=False):
+        """
+        Get the handler of a run, loading the run if it is not loaded.
+
+        Args:
+            run_id (str): Run ID.
+            subscribe (bool): Whether to keep the run loaded until
+                :meth:`unsubscribe` is called with the handler, e.g. while
+                a client streams its changes.
+
+        Raises:
+            KeyError: If the run is not registered.
+
+        """
+        with self._lock:
+            if run_id not in self._paths:
+                raise KeyError(run_id)
+            handler = self._handlers.pop(run_id, None)
+            if handler is None:
+                handler = TimelineHandler()
+                self._n_pending.pop(run_id, None)
+                self._stale.discard(run_id)
+                result = self._submit(run_id, handler)
+            elif handler.version == 0 and run_id in self._loading:
+                # Requested by another client and not loaded yet
+                result = self._loading[run_id][1]
+            else:
+                result = None
+            self._handlers[run_id] = handler
+            if subscribe:
+                self._subscribers[handler] = \
+                    self._subscribers.get(handler, 0) + 1
+            self._evict()
+        if result is not None:
+            # Wait for the first load so that the run is not seen empty
+            result.wait()
+        return handler
+
+    def unsubscribe(self, handler):
+        """ Release a subscription made by :meth:`get`. """
+        with self._lock:
+            n = self._subscribers.pop(handler) - 1
+            if n > 0:
+                self._subscribers[handler] = n
+            self._evict()
+
+    def _is_pinned(self, run_id, handler):
+        if self._subscribers.get(handler):
+            return True
+        current = self._loading.get(run_id)
+        # Loads waiting for the interval are cancelled on unloading
+        return current is not None and current[0] is handler and \
+            current[1] is not None
+
+    def _evict(self):
+        """
+        Unload the least recently viewed runs that are not pinned while
+        more than ``max_loaded`` runs are loaded. Must be called with the
+        lock.
+        """
+        excess = len(self._handlers) - self._max_loaded
+        for run_id, handler in list(six.iteritems(self._handlers)):
+            if excess <= 0:
+                return
+            if self._is_pinned(run_id, handler):
+                continue
+            del self._handlers[run_id]
+            excess -= 1
+            # Waiters of the run are woken up
+            handler.close()
+            logger.info("Unloaded run %s" % run_id)
+            if self._unsaved.pop(handler, None) is not None:
+                self._pool.apply_async(self._save, (run_id, handler))
+
+    def notify(self, path):
+        """
+        Parse the log at ``path`` again if its run is loaded.
+
+        Returns:
+            bool: True if ``path`` is a log file of a registered run.
+
+        """
+        run_id = self._run_ids.get(os.path.abspath(path))
+        if run_id is None:
+            return False
+        with self._lock:
+            handler = self._handlers.get(run_id)
+            if handler is None:
+                # Loaded on the next access
+                return True
+            self.n_requests += 1
+            self._n_pending[run_id] = self._n_pending.get(run_id, 0) + 1
+            if run_id in self._loading:
+                self._stale.add(run_id)
+            else:
+                self._schedule(run_id, handler)
+        return True
+
+    def _schedule(self, run_id, handler):
+        """
+        Load a run now or after the interval since its last load. Must be
+        called with the lock.
+        """
+        remaining = self._last_load.get(run_id, -self._interval) + \
+            self._interval - time.time()
+        if remaining <= 0:
+            self._submit(run_id, handler)
+            return
+        self._loading[run_id] = (handler, None)
+        timer = threading.Timer(remaining, self._submit_waiting,
+                                (run_id, handler))
+        timer.daemon = True
+        timer.start()
+
+    def _submit_waiting(self, run_id, handler):
+        with self._lock:
+            current = self._loading.get(run_id)
+            if current is None or current[0] is not handler:
+                # Unloaded and loaded again by another handler
+                return
+            if self._closing or handler.closed:
+                del self._loading[run_id]
+                return
+            # Notifications while waiting are collapsed into this load
+            self._stale.discard(run_id)
+            self._submit(run_id, handler)
+
+    def _submit(self, run_id, handler):
+        """ Must be called with the lock. """
+        if self._pool is None:
+            self._pool = ThreadPool(self._n_workers)
+        n_pending = self._n_pending.pop(run_id, 0)
+        if n_pending > 0:
+            self.n_loads += 1
+            logger.info("modification detected! Updating %s (%d events "
+                        "collapsed)" % (run_id, n_pending - 1))
+        self._last_load[run_id] = time.time()
+        result = self._pool.apply_async(self._load, (run_id, handler))
+        self._loading[run_id] = (handler, result)
+        return result
+
+    def _cache(self, run_id):
+        """ Must be called with the lock. """
+        if run_id not in self._caches:
+            cache = TimelineCache(self._paths[run_id], self._cache_dir)
+            self._caches[run_id] = (cache, threading.Lock())
+        return self._caches[run_id]
+
+    def _save(self, run_id, handler):
+        with self._lock:
+            self._last_save[run_id] = time.time()
+            cache, cache_lock = self._cache(run_id)
+        with cache_lock:
+            try:
+                cache.save(handler)
+            except (IOError, OSError):
+                logger.warning("Failed to save cache %s" % cache.path)
+
+    def _save_later(self, run_id, handler):
+        """
+        Save the cache of a run unless it was saved within the interval, in
+        which case it is saved by a later load, on unloading or on closing.
+        """
+        with self._lock:
+            last_save = self._last_save.get(run_id)
+            if not handler.closed and last_save is not None and \
+                    time.time() - last_save < CACHE_SAVE_INTERVAL:
+                self._unsaved[handler] = run_id
+                return
+            self._unsaved.pop(handler, None)
+        self._save(run_id, handler)
+
+    def _load(self, run_id, handler):
+        path = self._paths[run_id]
+        try:
+            if self._use_cache and handler.version == 0:
+                with self._lock:
+                    cache, cache_lock = self._cache(run_id)
+                with cache_lock:
+                    cache.restore(handler)
+            handler.load(path)
+            if self._use_cache:
+                self._save_later(run_id, handler)
+        except Exception:
+            logger.exception("Failed to load run %s" % run_id)
+        with self._lock:
+            current = self._loading.get(run_id)
+            if current is None or current[0] is not handler:
+                # Unloaded and loaded again by another handler
+                return
+            del self._loading[run_id]
+            if run_id in self._stale and not self._closing:
+                self._stale.discard(run_id)
+                self._schedule(run_id, handler)
+            else:
+                # Unload runs that were kept loaded during the load
+                self._evict()
+
+    def close(self):
+        with self._lock:
+            self._closing = True
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+        for handler, run_id in list(six.iteritems(self._unsaved)):
+            self._save(run_id, handler)
+        self._unsaved.clear()
@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized operations on columns of timelines
+"""
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+
+from chainerboard.column import Column
+
+
+def _bucketize(y, n_buckets):
+    """
+    Reshape ``y`` into ``n_buckets`` rows of equal size, padding with NaN.
+
+    Returns:
+        tuple: Reshaped values (numpy.ndarray), mask of padded elements
+        (numpy.ndarray) and bucket size (int).
+
+    """
+    size = -(-len(y) // n_buckets)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[:len(y)] = y
+    pad = np.zeros(n_buckets * size, dtype=bool)
+    pad[len(y):] = True
+    return padded.reshape(n_buckets, size), pad.reshape(n_buckets, size), size
+
+
+def minmax_indices(y, max_points):
+    """
+    Choose at most ``max_points`` points of a series while keeping its
+    shape. Points are split into buckets of equal size and the minimum
+    and maximum of each bucket are kept in their original order. A bucket
+    that contains invalid values (NaN or inf) also keeps its first invalid
+    point so that gaps are still drawn. With fewer than 3 points, each
+    bucket keeps only one point, alternately its minimum and maximum.
+
+    Args:
+        y (numpy.ndarray): Values of the series.
+        max_points (int): Maximum number of points to return, which must be
+            positive.
+
+    Returns:
+        numpy.ndarray: Sorted indices of the chosen points, or None if
+        there is nothing to downsample.
+
+    """
+    if max_points < 1:
+        raise ValueError("max_points must be positive: %d" % max_points)
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= max_points:
+        return None
+    if max_points < 3:
+        return _extreme_indices(y, max_points)
+    n_buckets = max_points // 3
+    values, pad, size = _bucketize(y, n_buckets)
+    valid = np.isfinite(values)
+    invalid = ~(valid | pad)
+    offsets = np.arange(n_buckets)[:, None] * size
+
+    candidates = np.stack([
+        np.where(valid, values, np.inf).argmin(axis=1),
+        np.where(valid, values, -np.inf).argmax(axis=1),
+        invalid.argmax(axis=1),
+    ], axis=1)
+    present = np.stack([
+        valid.any(axis=1),
+        valid.any(axis=1),
+        invalid.any(axis=1),
+    ], axis=1)
+    # min and max are the same point when a bucket is constant
+    present[:, 1] &= candidates[:, 1] != candidates[:, 0]
+    candidates = np.where(present, candidates, size) + offsets
+    candidates.sort(axis=1)
+    return candidates[candidates < offsets + size]
+
+
+def _extreme_indices(y, n_buckets):
+    """
+    Choose one point of each of ``n_buckets`` buckets, which is the minimum
+    of even buckets and the maximum of odd ones, or the first point of a
+    bucket without valid values.
+    """
+    values, pad, size = _bucketize(y, n_buckets)
+    valid = np.isfinite(values)
+    minimum = np.where(valid, values, np.inf).argmin(axis=1)
+    maximum = np.where(valid, values, -np.inf).argmax(axis=1)
+    idx = np.where(np.arange(n_buckets) % 2 == 0, minimum, maximum)
+    idx = np.where(valid.any(axis=1), idx, 0)
+    return idx + np.arange(n_buckets) * size
+
+
+def minmax_downsample(x, y, max_points):
+    """
+    Downsample a series to at most ``max_points`` points with
+    :func:`minmax_indices`.
+
+    Args:
+        x (numpy.ndarray): Index values of the series.
+        y (numpy.ndarray): Values of the series.
+        max_points (int): Maximum number of points to return.
+
+    Returns:
+        tuple: Downsampled ``x`` and ``y`` (numpy.ndarray). They are the
+        given arrays if there is nothing to downsample.
+
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    idx = minmax_indices(y, max_points)
+    if idx is None:
+        return x, y
+    return x[idx], y[idx]
+
+
+def band_downsample(x, bands, max_points):
+    """
+    Downsample bands of percentiles to at most ``max_points`` points while
+    keeping their envelope. Points are split into buckets of equal size.
+    In each bucket, bands below the middle take their minimum, bands above
+    it take their maximum, and the middle band (of an odd number of bands)
+    takes its mean. Invalid values (NaN or inf) are ignored and a bucket
+    without valid values is NaN.
+
+    Args:
+        x (numpy.ndarray): Index values of the points.
+        bands (numpy.ndarray): Values of shape (points, bands) ordered from
+            the lowest band to the highest.
+        max_points (int): Maximum number of points to return.
+
+    Returns:
+        tuple: ``x`` of the first point of each bucket and bands of each
+        bucket (numpy.ndarray). They are the given arrays if there is
+        nothing to downsample.
+
+    """
+    x = np.asarray(x)
+    bands = np.asarray(bands, dtype=np.float64)
+    n, n_bands = bands.shape
+    if n <= max_points or max_points < 1:
+        return x, bands
+    size = -(-n // max_points)
+    n_buckets = -(-n // size)
+    padded = np.full((n_buckets * size, n_bands), np.nan)
+    padded[:n] = bands
+    padded = padded.reshape(n_buckets, size, n_bands)
+    valid = np.isfinite(padded)
+    lower = n_bands // 2
+    upper = n_bands - lower
+    ret = np.empty((n_buckets, n_bands))
+    ret[:, :lower] = np.where(
+        valid[:, :, :lower], padded[:, :, :lower], np.inf).min(axis=1)
+    ret[:, upper:] = np.where(
+        valid[:, :, upper:], padded[:, :, upper:], -np.inf).max(axis=1)
+    if lower < upper:
+        middle = np.where(valid[:, :, lower], padded[:, :, lower], 0.)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret[:, lower] = middle.sum(axis=1) / valid[:, :, lower].sum(axis=1)
+    ret[~valid.any(axis=1)] = np.nan
+    return x[::size], ret
+
+
+def band_density(x, bands, levels, width, bins, chunk_size=4096):
+    """
+    Density of values given by bands of percentiles on a grid of
+    iteration buckets and value bins. The mass between two adjacent bands,
+    which is the difference of their levels, is spread uniformly between
+    them (or put in the bin of their value if they are equal). Each
+    bucket of the grid is the mean density of its points, whose bands are
+    split into buckets of equal size. Points that have an invalid value
+    (NaN or inf) are ignored and a bucket without valid points is NaN.
+
+    Args:
+        x (numpy.ndarray): Index values of the points.
+        bands (numpy.ndarray): Values of shape (points, bands) ordered from
+            the lowest band to the highest.
+        levels (numpy.ndarray): Increasing levels of the bands in [0, 1].
+        width (int): Maximum number of iteration buckets.
+        bins (int): Number of value bins, which evenly divide the range of
+            the values.
+        chunk_size (int): Approximate number of points processed at once,
+            which bounds the memory used.
+
+    Returns:
+        tuple: ``x`` of the first point of each bucket, centers of the
+        bins and the grid of shape (bins, buckets) that sums up to 1 for
+        each bucket (numpy.ndarray).
+
+    """
+    x = np.asarray(x)
+    bands = np.asarray(bands, dtype=np.float64)
+    masses = np.diff(np.asarray(levels, dtype=np.float64))
+    n = len(bands)
+    valid = np.isfinite(bands).all(axis=1)
+    if not valid.any():
+        return x[:0], np.zeros(0), np.zeros((bins, 0))
+    lo, hi = bands[valid].min(), bands[valid].max()
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    edges = np.linspace(lo, hi, bins + 1)
+    size = -(-n // width)
+    n_buckets = -(-n // size)
+    grid = np.zeros((n_buckets, bins))
+    # Chunks are made of whole buckets
+    chunk = size * max(chunk_size // size, 1)
+    for start in range(0, n, chunk):
+        b = bands[start:start + chunk]
+        cdf = np.zeros((len(b), bins + 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for j, mass in enumerate(masses):
+                low, high = b[:, j, None], b[:, j + 1, None]
+                frac = np.where(high > low, (edges - low) / (high - low),
+                                edges >= low)
+                cdf += mass * np.clip(frac, 0., 1.)
+        # Values at the ends of the range belong to the outermost bins
+        cdf[:, 0] = 0.
+        cdf[:, -1] = masses.sum()
+        density = np.diff(cdf, axis=1) / masses.sum()
+        density[~valid[start:start + chunk]] = 0.
+        n_rows = -(-len(b) // size) * size
+        padded = np.zeros((n_rows, bins))
+        padded[:len(b)] = density
+        grid[start // size:(start + n_rows) // size] = padded.reshape(
+            -1, size, bins).sum(axis=1)
+    counts = np.zeros(n_buckets * size)
+    counts[:n] = valid
+    counts = counts.reshape(n_buckets, size).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid /= counts[:, None]
+    return x[::size], (edges[:-1] + edges[1:]) / 2., grid.T
+
+
+def moving_average(y, window):
+    """
+    Centered moving average. A point is the mean of ``window`` points
+    around it (``window // 2`` points before it). Points whose window
+    reaches out of the series or contains an invalid value (NaN or inf)
+    are NaN, so smoothing restarts after every gap.
+
+    Args:
+        y (numpy.ndarray): Values of the series.
+        window (int): Window size.
+
+    Returns:
+        numpy.ndarray: Smoothed values of the same length as ``y``.
+
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    ret = np.full(n, np.nan)
+    if n < window:
+        return ret
+    valid = np.isfinite(y)
+    sums = np.concatenate([[0.], np.cumsum(np.where(valid, y, 0.))])
+    n_invalid = np.concatenate([[0], np.cumsum(~valid)])
+    complete = (n_invalid[window:] - n_invalid[:-window]) == 0
+    ret[window // 2:window // 2 + n - window + 1] = np.where(
+        complete, (sums[window:] - sums[:-window]) / window, np.nan)
+    return ret
+
+
+def _ema_run(y, alpha, initial):
+    """ Exponential moving average of valid values, computed by blocks. """
+    decay = 1. - alpha
+    if decay == 0.:
+        return y.copy()
+    # Powers of decay within a block must not underflow
+    block = int(min(max(150. / -np.log10(decay), 1), 4096))
+    ret = np.empty(len(y))
+    last = initial
+    for i in range(0, len(y), block):
+        chunk = y[i:i + block]
+        if np.isnan(last):
+            last = chunk[0]
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        ret[i:i + block] = powers * (
+            last + alpha * np.cumsum(chunk / powers))
+        last = ret[i + len(chunk) - 1]
+    return ret
+
+
+def exponential_moving_average(y, alpha, initial=np.nan):
+    """
+    Exponential moving average ``s[i] = alpha * y[i] + (1 - alpha) *
+    s[i - 1]``. Invalid values (NaN or inf) are NaN and smoothing restarts
+    from the next valid value.
+
+    Args:
+        y (numpy.ndarray): Values of the series.
+        alpha (float): Smoothing factor in (0, 1].
+        initial (float): Smoothed value preceding ``y`` to continue from.
+            NaN to start from ``y[0]``.
+
+    Returns:
+        numpy.ndarray: Smoothed values of the same length as ``y``.
+
+    """
+    y = np.asarray(y, dtype=np.float64)
+    ret = np.full(len(y), np.nan)
+    valid = np.isfinite(y)
+    # Boundaries of runs of valid values
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], valid, [0]])))
+    for start, stop in zip(edges[::2], edges[1::2]):
+        ret[start:stop] = _ema_run(
+            y[start:stop], alpha, initial if start == 0 else np.nan)
+    return ret
+
+
+class Smoother(object):
+    """
+    Smoothed values of a growing series, which are extended incrementally
+    as points are appended.
+
+    Args:
+        method (str): ``'ma'`` for :func:`moving_average` or ``'ema'`` for
+            :func:`exponential_moving_average`.
+        param: Window size (int) of ``'ma'`` or smoothing factor (float)
+            of ``'ema'``.
+
+    """
+
+    def __init__(self, method, param):
+        if method == 'ma':
+            param = int(param)
+            if param < 1:
+                raise ValueError("Window must be positive: %d" % param)
+        elif method == 'ema':
+            param = float(param)
+            if not 0. < param <= 1.:
+                raise ValueError("Alpha must be in (0, 1]: %f" % param)
+        else:
+            raise ValueError("Unknown smoothing method %s" % method)
+        self._method = method
+        self._param = param
+        self._smoothed = Column()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Create from a spec such as ``'ma:5'`` or ``'ema:0.1'``.
+
+        Raises:
+            ValueError: If ``spec`` is malformed.
+
+        """
+        method, sep, param = spec.partition(':')
+        if not sep:
+            raise ValueError("Malformed smoothing spec %s" % spec)
+        return cls(method, param)
+
+    def __len__(self):
+        return len(self._smoothed)
+
+    @property
+    def lookback(self):
+        """
+        Number of the last smoothed values that may change when points are
+        appended (int).
+        """
+        if self._method == 'ma':
+            return self._param - 1 - self._param // 2
+        return 0
+
+    def reset(self):
+        self._smoothed.truncate(0)
+
+    def update(self, values):
+        """
+        Extend smoothed values with points appended to the series.
+
+        Args:
+            values (numpy.ndarray): The whole series, the points smoothed
+                so far being unchanged. Everything is smoothed again if it
+                is shorter than before.
+
+        Returns:
+            numpy.ndarray: Smoothed values of the whole series. It is a view
+            that must not be modified.
+
+        """
+        if len(values) < len(self._smoothed):
+            self.reset()
+        n = len(self._smoothed)
+        if len(values) == n:
+            return self._smoothed.view()
+        # First point that was not complete
+        start = max(n - self.lookback, 0)
+        if self._method == 'ma':
+            # Include points preceding it in its window
+            begin = max(start - self._param // 2, 0)
+            new = moving_average(values[begin:], self._param)[start - begin:]
+        else:
+            initial = self._smoothed[n - 1] if n > 0 else np.nan
+            new = exponential_moving_average(
+                values[n:], self._param, initial)
+        self._smoothed.truncate(start)
+        self._smoothed.extend(new)
+        return self._smoothed.view()
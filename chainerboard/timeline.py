@@ -5,13 +5,16 @@ Deals with time-dependent data
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
+import copy
 import logging
-from collections import OrderedDict
 
+import numpy as np
 import six
 
 from chainerboard import util
+from chainerboard.column import Column
 from chainerboard.exceptions import KeyDisappearedException
+from chainerboard.pyramid import Pyramid
 
 logger = logging.getLogger(__name__)
 
@@ -22,117 +25,498 @@ class KeyValuePair(object):
         self.value = value
 
 
+class TimeAxis(object):
+    """
+    Times of the records shared among all timelines of a handler.
+    ``i``-th row of the axis holds the time of ``i``-th record, so every
+    timeline, regardless of how often it is reported, refers to rows of the
+    same axis.
+
+    Args:
+        has_epoch (bool): Whether records have epoch.
+        has_iteration (bool): Whether records have iteration.
+        has_elapsed_time (bool): Whether records have elapsed time.
+
+    """
+
+    def __init__(self, has_epoch, has_iteration, has_elapsed_time):
+        self._epoch = Column() if has_epoch else None
+        self._iteration = Column() if has_iteration else None
+        self._elapsed_time = Column() if has_elapsed_time else None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _columns(self):
+        return [c for c in (self._epoch, self._iteration, self._elapsed_time)
+                if c is not None]
+
+    def append(self, epoch, iteration, elapsed_time):
+        """
+        Returns:
+            int: Index of the appended row.
+
+        """
+        for column, value in ((self._epoch, epoch),
+                              (self._iteration, iteration),
+                              (self._elapsed_time, elapsed_time)):
+            if column is not None:
+                column.append(value)
+        self._size += 1
+        return self._size - 1
+
+    def truncate(self, n):
+        for column in self._columns():
+            column.truncate(n)
+        self._size = min(n, self._size)
+
+    def state(self):
+        """
+        Returns:
+            dict: Arrays (:class:`numpy.ndarray`) of the axis keyed by
+            names to be saved and given to :meth:`restore`.
+
+        """
+        return {name: column.view()
+                for name, column in (('epoch', self._epoch),
+                                     ('iteration', self._iteration),
+                                     ('elapsed_time', self._elapsed_time))
+                if column is not None}
+
+    def snapshot(self):
+        """
+        Get a read-only copy of the axis that shares the times appended so
+        far, which can be read without a lock while the axis grows.
+        """
+        axis = copy.copy(self)
+        for name in ('_epoch', '_iteration', '_elapsed_time'):
+            column = getattr(self, name)
+            if column is not None:
+                setattr(axis, name, column.view())
+        return axis
+
+    @classmethod
+    def restore(cls, arrays):
+        """ Create an axis from arrays given by :meth:`state`. """
+        axis = cls(False, False, False)
+        for name in ('epoch', 'iteration', 'elapsed_time'):
+            if name in arrays:
+                setattr(axis, '_' + name, Column.from_array(arrays[name]))
+                axis._size = len(arrays[name])
+        return axis
+
+    @property
+    def elapsed_time(self):
+        return None if self._elapsed_time is None else self._elapsed_time.view()
+
+    @property
+    def epoch(self):
+        return None if self._epoch is None else self._epoch.view()
+
+    @property
+    def iteration(self):
+        return None if self._iteration is None else self._iteration.view()
+
+
 class TimelineBase(object):
-    def __init__(self):
-        self._uninitialized = True
+    """
+    Base class of timelines. A timeline does not hold its own times but
+    refers to rows of the shared :class:`TimeAxis`. As long as the timeline
+    has a value for every row from its first one, only the first row is
+    stored and times are views of the axis. Otherwise the row indices are
+    stored.
+
+    Args:
+        axis (TimeAxis): Axis shared among timelines.
+
+    """
+    def __init__(self, axis):
+        self._axis = axis
+        self._row_start = 0
+        self._rows = None
+        self._size = 0
+        self._truncated = None
+        self._dirty = False
+        self._generation = 0
+        self._version = 0
         self._update_state_hash()
 
     def _update_state_hash(self):
         self._state_hash = util.random_hash(12)
 
-    def _initialize_times(self, epoch, iteration, time_elapsed):
-        self._epoch = None if epoch is None else []
-        self._iteration = None if iteration is None else []
-        self._elapsed_time = None if time_elapsed is None else []
-        self._uninitialized = False
+    def _append_row(self, row):
+        if self._rows is not None:
+            self._rows.append(row)
+        elif self._size == 0:
+            self._row_start = row
+        elif row != self._row_start + self._size:
+            # Not dense anymore; fall back to storing row indices
+            rows = Column(np.int64)
+            rows.extend(self.rows)
+            rows.append(row)
+            self._rows = rows
+        self._size += 1
+        self._dirty = True
+
+    def _plan_impl(self, keys):
+        """
+        Implementation for deciding which keys to extract from records that
+        consist of ``keys``.
+
+        Returns:
+            tuple or None: ``None`` if the timeline is absent in such
+            records. Otherwise keys consumed by the timeline (tuple of str)
+            and keys whose values are passed to :meth:`_append_impl` (tuple
+            of str or ``None`` if nothing should be appended).
+
+        """
+        raise NotImplementedError()
+
+    def _append_impl(self, values):
+        """
+        Implementation for appending values of the keys decided by
+        :meth:`_plan_impl`.
+        """
+        raise NotImplementedError()
+
+    def plan(self, keys):
+        """
+        Decide keys to extract from records that consist of ``keys``.
+        This is expected to be called once for each set of keys and the
+        result to be reused for all the records with the same keys.
+
+        Args:
+            keys (set of str): Keys of a record that were not consumed by
+                other timelines.
+
+        Returns:
+            tuple or None: Keys consumed by the timeline (tuple of str) and
+            keys to be passed to :meth:`append` (tuple of str or ``None``) or
+            ``None`` if the timeline is absent in such records.
+
+        """
+        return self._plan_impl(keys)
+
+    def append(self, row, values):
+        """
+        Append a point. The state hash is updated on :meth:`settle`.
+
+        Args:
+            row (int): Row of the record in the time axis, which is also the
+                index of the record in the whole log.
+            values (list): Values of the keys decided by :meth:`plan`.
+
+        """
+        self._append_impl(values)
+        self._append_row(row)
+
+    def _values_from(self, n):
+        """
+        Implementation for getting copies of values (list of
+        :class:`numpy.ndarray`) from ``n``-th point.
+        """
+        raise NotImplementedError()
+
+    def _truncate_impl(self, n):
+        """
+        Implementation for truncating values to the first ``n`` points.
+        """
+        raise NotImplementedError()
+
+    def _settle_impl(self):
+        """
+        Implementation for updating derived data after points were
+        appended or truncated. Does nothing by default.
+        """
+        pass
 
-    def _append_time(self, epoch, iteration, elapsed_time):
-        if self._epoch is not None:
-            self._epoch.append(epoch)
+    def _spec_args(self):
+        """
+        Implementation for getting json serializable arguments of the
+        constructor except for ``axis``.
+        """
+        raise NotImplementedError()
 
-        if self._iteration is not None:
-            self._iteration.append(iteration)
+    def _value_arrays(self):
+        """
+        Implementation for getting all the values as a list of sequences
+        (e.g. views of columns), which are given to :meth:`_restore_values`.
+        """
+        raise NotImplementedError()
 
-        if self._elapsed_time is not None:
-            self._elapsed_time.append(elapsed_time)
+    def _restore_values(self, arrays):
+        """ Implementation for restoring values from arrays. """
+        raise NotImplementedError()
 
-    def _extract_value_impl(self, dic, epoch, iteration, elapsed_time):
+    def _snapshot_impl(self, timeline):
         """
-        Implementation for extracting of values.
-        This function should return ``True`` if there were any updates otherwise
-        ``False``.
+        Implementation for replacing values of ``timeline``, a shallow copy
+        of this timeline, with ones that are not modified by this timeline.
         """
         raise NotImplementedError()
 
-    def extract_value(self, dic, epoch, iteration, elapsed_time):
-        if self._uninitialized:
-            self._initialize_times(epoch, iteration, elapsed_time)
+    def snapshot(self, axis):
+        """
+        Get a read-only copy of the timeline, which can be read without the
+        lock of the handler while this timeline keeps being updated.
+
+        Args:
+            axis (TimeAxis): Snapshot of the axis taken at the same time.
+
+        Returns:
+            TimelineBase: Snapshot of the timeline.
+
+        """
+        timeline = copy.copy(self)
+        timeline._axis = axis
+        timeline._truncated = None
+        if self._rows is not None:
+            timeline._rows = self._rows.view()
+        self._snapshot_impl(timeline)
+        return timeline
+
+    def state(self):
+        """
+        Get the state of the timeline to save.
+
+        Returns:
+            tuple: Json serializable spec (dict) and arrays (list of
+            sequences) to be given to :func:`restore_timeline`.
+
+        """
+        spec = {'type': type(self).__name__, 'args': self._spec_args(),
+                'rowStart': self._row_start, 'size': self._size,
+                'sparse': self._rows is not None}
+        arrays = self._value_arrays()
+        if self._rows is not None:
+            arrays = [self._rows.view()] + arrays
+        return spec, arrays
+
+    def _points_from(self, n):
+        times = [t[n:].copy() for t in (self.epoch, self.iteration,
+                                        self.elapsed_time) if t is not None]
+        return [self.rows[n:].copy()] + times + self._values_from(n)
+
+    def truncate(self, idx):
+        """
+        Remove the points that were extracted from records from ``idx``-th.
+        Removed points are kept until :meth:`settle` is called so that the
+        state hash can be kept if the same points are extracted again.
+        This must be called before truncating the axis.
+
+        Args:
+            idx (int): Index of the first record to forget.
+
+        Returns:
+            bool: ``True`` if any points were removed.
+
+        """
+        n = int(np.searchsorted(self.rows, idx))
+        if n == self._size:
+            return False
+        self._truncated = (n, self._points_from(n))
+        if self._rows is not None:
+            self._rows.truncate(n)
+        self._size = n
+        self._truncate_impl(n)
+        return True
+
+    def settle(self, version=None):
+        """
+        Update the state hash if points were appended or truncated since the
+        last call. The state hash is kept if truncated points were extracted
+        again without any change.
 
-        ret = self._extract_value_impl(dic, epoch, iteration, elapsed_time)
-        assert isinstance(ret, bool)
-        if ret:
+        Args:
+            version (int): Version of the handler to record as the version
+                of the last change if the timeline has changed.
+
+        Returns:
+            bool: ``True`` if the timeline has changed since the last call.
+
+        """
+        self._settle_impl()
+        changed = self._dirty
+        if self._truncated is not None:
+            n, old_points = self._truncated
+            points = self._points_from(n)
+            rewritten = not (
+                len(points) == len(old_points) and
+                all(np.array_equal(p, o) for p, o in zip(points, old_points)))
+            if rewritten:
+                self._generation += 1
+            changed = rewritten
+            self._truncated = None
+        self._dirty = False
+        if changed:
             self._update_state_hash()
-        return ret
+            if version is not None:
+                self._version = version
+        return changed
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def version(self):
+        """ Version of the handler when the timeline last changed (int) """
+        return self._version
+
+    @property
+    def generation(self):
+        """
+        Number of times points were rewritten (int). Points are only
+        appended while it stays the same.
+        """
+        return self._generation
+
+    @property
+    def cursor(self):
+        """
+        Opaque cursor (str) for the current points. Clients give it back to
+        :meth:`offset_of` to fetch only the points appended since then.
+        """
+        return '%d:%d' % (self._generation, self._size)
+
+    def offset_of(self, cursor):
+        """
+        Find the first point that a client holding ``cursor`` does not have.
+
+        Args:
+            cursor (str): Cursor previously given by :attr:`cursor`.
+
+        Returns:
+            int: Index of the first new point. ``0`` if the cursor is
+            invalid or the points have been rewritten since then.
+
+        """
+        try:
+            generation, size = (int(c) for c in cursor.split(':'))
+        except (AttributeError, ValueError):
+            return 0
+        if generation != self._generation or size > self._size:
+            return 0
+        return size
+
+    def _take(self, times):
+        if times is None:
+            return None
+        if self._rows is None:
+            return times[self._row_start:self._row_start + self._size]
+        return times[self._rows.view()]
+
+    @property
+    def rows(self):
+        """ Rows (numpy.ndarray) of the time axis that the points refer to """
+        if self._rows is None:
+            return np.arange(self._row_start, self._row_start + self._size)
+        return self._rows.view()
 
     @property
     def elapsed_time(self):
-        return self._elapsed_time
+        return self._take(self._axis.elapsed_time)
 
     @property
     def epoch(self):
-        return self._epoch
+        return self._take(self._axis.epoch)
 
     @property
     def iteration(self):
-        return self._iteration
+        return self._take(self._axis.iteration)
 
     @property
     def state_hash(self):
         return self._state_hash
 
 
-class Timeline(TimelineBase):
-    def __init__(self, key):
-        super(Timeline, self).__init__()
-        self._key = key
-        self._key_std = key + '.std'
-        self._value = []
-
-    def _extract_value_impl(self, dic, epoch, iteration, elapsed_time):
-        updated = False
-        if self._key_std in dic:
-            std = dic.pop(self._key_std)
-            updated = True
-        if self._key in dic:
-            val = dic.pop(self._key)
-            self._value.append(val)
-            self._append_time(epoch, iteration, elapsed_time)
-            updated = True
-        return updated
+class ScalarTimeline(TimelineBase):
+    """
+    Base class of timelines with a single value per point. Values are kept
+    with a :class:`~chainerboard.pyramid.Pyramid` of their aggregates for
+    range queries.
+
+    Args:
+        axis (TimeAxis): Axis shared among timelines.
+
+    """
+    def __init__(self, axis):
+        super(ScalarTimeline, self).__init__(axis)
+        self._value = Column()
+        self._pyramid = Pyramid()
+
+    def _values_from(self, n):
+        return [self._value[n:].copy()]
+
+    def _truncate_impl(self, n):
+        self._value.truncate(n)
+        self._pyramid.truncate(n, self._value.view())
+
+    def _settle_impl(self):
+        self._pyramid.update(self._value.view())
+
+    def _snapshot_impl(self, timeline):
+        timeline._value = self._value.view()
+        timeline._pyramid = self._pyramid.snapshot()
+
+    def _value_arrays(self):
+        return [self._value.view()]
+
+    def _restore_values(self, arrays):
+        self._value = Column.from_array(arrays[0])
 
     @property
     def value(self):
-        return self._value
+        return self._value.view()
+
+    @property
+    def pyramid(self):
+        return self._pyramid
+
+
+class Timeline(ScalarTimeline):
+    def __init__(self, axis, key):
+        super(Timeline, self).__init__(axis)
+        self._key = key
+        self._key_std = key + '.std'
+
+    def _spec_args(self):
+        return [self._key]
+
+    def _plan_impl(self, keys):
+        consumed = tuple(k for k in (self._key, self._key_std) if k in keys)
+        if len(consumed) == 0:
+            return None
+        return consumed, (self._key, ) if self._key in keys else None
+
+    def _append_impl(self, values):
+        self._value.append(values[0])
 
 
-class MicroAverageTimeline(TimelineBase):
-    def __init__(self, total_key, correct_key):
-        super(MicroAverageTimeline, self).__init__()
+class MicroAverageTimeline(ScalarTimeline):
+    def __init__(self, axis, total_key, correct_key):
+        super(MicroAverageTimeline, self).__init__(axis)
         self._total_key = total_key
         self._correct_key = correct_key
-        self._value = []
-
-    def _extract_value_impl(self, dic, epoch, iteration, elapsed_time):
-        updated = False
-        if self._correct_key in dic:
-            # Assume that both keys are in dic
-            correct = dic.pop(self._correct_key)
-            try:
-                total = dic.pop(self._total_key)
-            except KeyError:
+
+    def _spec_args(self):
+        return [self._total_key, self._correct_key]
+
+    def _plan_impl(self, keys):
+        if self._correct_key in keys:
+            # Assume that both keys are in keys
+            if self._total_key not in keys:
                 raise KeyDisappearedException(self._total_key)
-            micro_average = correct / float(total)
-            self._value.append(micro_average)
-            self._append_time(epoch, iteration, elapsed_time)
-            updated = False
-        elif self._total_key in dic:
-            # Only total_key exists in dic -> raise Error
+            consumed = (self._correct_key, self._total_key)
+            return consumed, consumed
+        elif self._total_key in keys:
+            # Only total_key exists in keys -> raise Error
             raise KeyDisappearedException(self._correct_key)
-        return updated
+        return None
 
-    @property
-    def value(self):
-        return self._value
+    def _append_impl(self, values):
+        correct, total = values
+        self._value.append(correct / float(total))
 
 
 class TensorTimeline(TimelineBase):
@@ -144,6 +528,7 @@ class TensorTimeline(TimelineBase):
                  ``grad_keys``
 
     Args:
+        axis (TimeAxis): Axis shared among timelines.
         data_keys (dict): Mapping from metric name (str) to key string (str).
         grad_keys (dict): Mapping from metric name (str) to key string (str).
 
@@ -158,8 +543,8 @@ class TensorTimeline(TimelineBase):
         'percentile/5': r'97.72%',
         'percentile/6': r'99.87%',
     }
-    def __init__(self, data_keys, grad_keys):
-        super(TensorTimeline, self).__init__()
+    def __init__(self, axis, data_keys, grad_keys):
+        super(TensorTimeline, self).__init__(axis)
         self._data_percentiles_keys = {
             k: data_keys.pop(k) for k in list(six.iterkeys(data_keys))
             if k.startswith('percentile/')
@@ -173,10 +558,6 @@ class TensorTimeline(TimelineBase):
             self._data_percentiles_names = {
                 k: k for k in six.iterkeys(self._data_percentiles_keys)
             }
-        self._data_percentiles = OrderedDict(
-            ((k, []) for k in sorted(self._data_percentiles_keys.keys()))
-        )
-        self._data = {k: [] for k in six.iterkeys(data_keys)}
         self._data_keys = data_keys
 
         self._grad_percentiles_keys = {
@@ -184,39 +565,113 @@ class TensorTimeline(TimelineBase):
             for k in list(six.iterkeys(grad_keys))
             if k.startswith('percentile/')
         }
-        self._grad_percentiles = OrderedDict(
-            ((k, []) for k in sorted(self._grad_percentiles_keys.keys()))
-        )
-        self._grad = {k: [] for k in six.iterkeys(grad_keys)}
         self._grad_keys = grad_keys
 
-    def _extract_value_impl(self, dic, epoch, iteration, elapsed_time):
-        if next(iter(self._data_percentiles_keys.values())) not in dic:
-            # Assume tensor is absent in dic
-            return False
-        self._append_time(epoch, iteration, elapsed_time)
-        try:
-            for k, dic_key in six.iteritems(self._data_percentiles_keys):
-                self._data_percentiles[k].append(dic.pop(dic_key))
-            for k, dic_key in six.iteritems(self._data_keys):
-                self._data[k].append(dic.pop(dic_key))
-            for k, dic_key in six.iteritems(self._grad_percentiles_keys):
-                self._grad_percentiles[k].append(dic.pop(dic_key))
-            for k, dic_key in six.iteritems(self._grad_keys):
-                self._grad[k].append(dic.pop(dic_key))
-        except KeyError:
-            raise KeyDisappearedException(dic_key)
-        return True
+        # Statistics are columns of a (points x statistics) array, whose
+        # indices are keyed by (kind, metric name)
+        self._value_keys = ()
+        self._stat_index = {}
+        for kind, keys in (('data_percentiles', self._data_percentiles_keys),
+                           ('data', self._data_keys),
+                           ('grad_percentiles', self._grad_percentiles_keys),
+                           ('grad', self._grad_keys)):
+            for k in sorted(keys):
+                self._stat_index[kind, k] = len(self._value_keys)
+                self._value_keys += (keys[k], )
+        self._stats = Column(width=len(self._value_keys))
+
+    def _plan_impl(self, keys):
+        if next(iter(self._data_percentiles_keys.values())) not in keys:
+            # Assume tensor is absent in keys
+            return None
+        for dic_key in self._value_keys:
+            if dic_key not in keys:
+                raise KeyDisappearedException(dic_key)
+        return self._value_keys, self._value_keys
+
+    def _append_impl(self, values):
+        self._stats.append(values)
+
+    def _values_from(self, n):
+        return [self._stats[n:].copy()]
+
+    def _truncate_impl(self, n):
+        self._stats.truncate(n)
+
+    def _snapshot_impl(self, timeline):
+        timeline._stats = self._stats.view()
+
+    def _spec_args(self):
+        # Keys before the constructor took percentiles out of them
+        data_keys = dict(self._data_keys)
+        data_keys.update(self._data_percentiles_keys)
+        grad_keys = dict(self._grad_keys)
+        grad_keys.update(self._grad_percentiles_keys)
+        return [data_keys, grad_keys]
+
+    def _value_arrays(self):
+        return [self._stats.view()]
+
+    def _restore_values(self, arrays):
+        self._stats = Column.from_array(arrays[0])
+
+    @property
+    def stats(self):
+        """
+        Statistics of the points (numpy.ndarray of shape (points,
+        statistics)). It is a view that must not be modified.
+        """
+        return self._stats.view()
 
     def get_percentiles(self):
+        """
+        Returns:
+            list of dict: Percentiles of data from the lowest to the
+            highest, each of which has ``label`` (str) and ``data``
+            (:class:`numpy.ndarray`, a view of a column of :attr:`stats`).
+
+        """
+        stats = self._stats.view()
         percentiles = [
-            {'label': self._data_percentiles_names[k], 'data': v}
-            for k, v in six.iteritems(self._data_percentiles)
+            {'label': self._data_percentiles_names[k],
+             'data': stats[:, self._stat_index['data_percentiles', k]]}
+            for k in sorted(self._data_percentiles_keys)
         ]
-        if 'min' in self._data and 'max' in self._data:
+        if 'min' in self._data_keys and 'max' in self._data_keys:
             percentiles = (
-                [{'label': 'min', 'data': self._data['min']}, ] +
+                [{'label': 'min',
+                  'data': stats[:, self._stat_index['data', 'min']]}] +
                 percentiles +
-                [{'label': 'max', 'data': self._data['max']}, ]
+                [{'label': 'max',
+                  'data': stats[:, self._stat_index['data', 'max']]}]
             )
         return percentiles
+
+
+_TIMELINE_TYPES = {cls.__name__: cls for cls in (
+    Timeline, MicroAverageTimeline, TensorTimeline)}
+
+
+def restore_timeline(axis, spec, arrays):
+    """
+    Restore a timeline from its state given by :meth:`TimelineBase.state`.
+
+    Args:
+        axis (TimeAxis): Axis shared among timelines.
+        spec (dict): Spec of the timeline.
+        arrays (list of numpy.ndarray): Arrays of the timeline.
+
+    Returns:
+        TimelineBase: Restored timeline, which is changed since the last
+        :meth:`~TimelineBase.settle`.
+
+    """
+    timeline = _TIMELINE_TYPES[spec['type']](axis, *spec['args'])
+    timeline._row_start = spec['rowStart']
+    timeline._size = spec['size']
+    if spec['sparse']:
+        timeline._rows = Column.from_array(arrays[0])
+        arrays = arrays[1:]
+    timeline._restore_values(arrays)
+    timeline._dirty = True
+    return timeline
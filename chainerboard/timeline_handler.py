@@ -1,101 +1,63 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function
 
-import hashlib
-import json
 import logging
-import re
+import numbers
 import threading
 
 import six
 
 from chainerboard import util
+from chainerboard.digest import RecordDigest
 from chainerboard.exceptions import KeyDisappearedException, ParseError
-from chainerboard.timeline import Timeline, TensorTimeline, MicroAverageTimeline
+from chainerboard.name_index import NameIndex
+from chainerboard.reader import LogReader
+from chainerboard.timeline import Timeline, TensorTimeline, \
+    MicroAverageTimeline, TimeAxis, restore_timeline
 
 logger = logging.getLogger(__name__)
 
 
-def _find_partial_match(dic, key):
-    ret = []
-    for k in six.iterkeys(dic):
-        if key in k:
-            ret.append(k)
-    return ret
+def _is_value(value):
+    """ True if ``value`` can be a point of a timeline. """
+    return value is None or isinstance(value, numbers.Number)
 
 
-def _find_get_patten_match_single(dic, match_func):
+def _try_find_fallback(index, keys, key, warn=True):
     """
-    Find a matching key from dict. This function returns value when the
-    found match is the only match in the dict.
+    Try to find a key in keys. It will try to find a exact match first. If
+    it fails, it will fall back to find a partial match.
 
     Args:
-        dic (dict): Mapping from a key (str) to corresponding metric (numeric)
-            from one output of LogReporter.
-        match_func (func): A function that takes a variable (str) as input and
-            returns a bool if it is a valid match.
-
-    Returns:
-        str or None
-
-    """
-    # match_func(str) -> bool
-    found_key = None
-    for k in six.iterkeys(dic):
-        if match_func(k):
-            if found_key is None:
-                found_key = k
-            else:
-                # The second match is found
-                return None
-    return found_key
-
-
-def _find_partial_match_single(dic, key):
-    return _find_get_patten_match_single(dic, lambda k, key=key: key in k)
-
-
-def _find_regex_match_single(dic, pat):
-    pat = re.compile(pat)
-    return _find_get_patten_match_single(
-        dic, lambda k, pat=pat: pat.search(k) is not None)
-
-
-def _try_find_fallback(dic, key, warn=True):
-    """
-    Try to find a key in dic. It will try to find a exact match first. If it
-    fails, it will fall back to find a partial match.
-
-    Args:
-        dic (dict): Mapping from a key (str) to corresponding metric (numeric)
-            from one output of LogReporter.
+        index (chainerboard.name_index.NameIndex): Index that has all the
+            keys.
+        keys (set of str): Keys of a record to find from.
         key (str): Key to find
 
     Returns:
         str or None
 
     """
-    if key in dic:
+    if key in keys:
         return key
 
-    partial_matches = _find_partial_match(dic, key)
+    partial_matches = sorted(index.containing(key) & keys)
     if warn and len(partial_matches) > 1:
         logger.warn("Multiple match for key %s: %s" % (key, str(partial_matches)))
     return partial_matches[0] if len(partial_matches) > 0 else None
 
 
-def _try_find_conservative(dic, key):
+def _try_find_conservative(index, keys, key):
     """
-    Try to find a key in dic. These keys are less important, so extract only if
-    confident.
+    Try to find a key in keys. These keys are less important, so extract
+    only if confident, that is, if only one key ends with ``key``.
 
     These are currently dedicated to ``loss`` and ``accuracy``
 
-    .. warning:: This function have side effects to dic
-
     Args:
-        dic (dict): Mapping from a key (str) to corresponding metric (numeric)
-            from one output of LogReporter.
+        index (chainerboard.name_index.NameIndex): Index that has all the
+            keys.
+        keys (set of str): Keys of a record to find from.
         key (str): Key to find
 
     Returns:
@@ -103,20 +65,23 @@ def _try_find_conservative(dic, key):
     """
     # These keys are less important, so extract only if confident
     key_default = 'main/%s' % key
-    if key_default in dic:
+    if key_default in keys:
         return key_default
-    found = _find_regex_match_single(dic, r'%s$' % re.escape(key))
+    found = index.ending_with(key) & keys
+    return next(iter(found)) if len(found) == 1 else None
 
-    return found
 
-
-def match_data_grad(dic):
+def match_data_grad(dic, index=None):
     """
     Search data and grad properties, which are created by ParameterStatistics.
+    Only the keys that have ``data`` or ``grad`` component in ``index`` are
+    examined.
 
     Args:
-        dic (dict): Mapping from a key (str) to corresponding metric (numeric)
-            from one output of LogReporter.
+        dic (dict or set): Mapping from a key (str) to corresponding metric
+            (numeric) from one output of LogReporter, or set of its keys.
+        index (chainerboard.name_index.NameIndex): Index that has all the
+            keys of ``dic``. It is made from ``dic`` if it is None.
 
     Returns:
         dict: ret[obj_name][`data` or `grad`][metric_name] -> key
@@ -138,8 +103,13 @@ def match_data_grad(dic):
                 }
 
     """
+    if index is None:
+        index = NameIndex()
+        index.update(dic)
+    candidates = (index.with_component('data') |
+                  index.with_component('grad')).intersection(dic)
     matched = {}
-    for k in six.iterkeys(dic):
+    for k in candidates:
         if k.endswith('.std'):
             continue
         idx = k.find('/data/')
@@ -165,21 +135,6 @@ def match_data_grad(dic):
     return matched
 
 
-def _hash_json(dic):
-    """
-    Hash json parsable object.
-
-    Args:
-        dic (list of dict): Json parsable object.
-
-    Returns:
-        bytes: 32 characters hash
-
-    """
-    json_dump = json.dumps(dic, sort_keys=True).encode('utf-8')
-    return hashlib.md5(json_dump).hexdigest()
-
-
 def _lock(f):
     """ decorator which locks class method
     You need property _lock defined as in the following.
@@ -191,120 +146,254 @@ def _lock(f):
     return body
 
 
+class Snapshot(object):
+    """
+    Immutable state of the timelines of :class:`TimelineHandler`, which is
+    published whenever they change. Readers take the latest one with
+    :attr:`TimelineHandler.snapshot` and read it without the lock of the
+    handler, so requests never wait for parsing and parsing never waits for
+    requests.
+
+    Attributes:
+        session_id (str): Session ID of the handler.
+        version (int): Version of the handler.
+        events (dict): Snapshots of timelines of events keyed by graph IDs.
+        tensors (dict): Snapshots of timelines of tensors keyed by graph
+            IDs.
+        names (chainerboard.name_index.NameTrie): Keys of the records.
+
+    """
+
+    def __init__(self, session_id, version, events, tensors, change_log,
+                 created, names):
+        self.session_id = session_id
+        self.version = version
+        self.events = events
+        self.tensors = tensors
+        self.names = names
+        self._change_log = change_log
+        self._created = created
+
+    def changes_since(self, version, kind):
+        """
+        Find graphs that changed after ``version``.
+
+        Args:
+            version (int): Version that the caller knows. 0 to get all the
+                graphs.
+            kind (str): ``'events'`` or ``'tensors'``.
+
+        Returns:
+            tuple: IDs of the changed graphs (list of str) and IDs of the
+            graphs among them that were created after ``version`` (list of
+            str), both in order of creation.
+
+        """
+        found = set()
+        for v, k, g in reversed(self._change_log):
+            if v <= version:
+                break
+            if k == kind:
+                found.add(g)
+        changed = sorted(found, key=lambda g: (self._created[kind, g], g))
+        created = [g for g in changed if self._created[kind, g] > version]
+        return changed, created
+
+    def graph_ids(self, kind):
+        """
+        Args:
+            kind (str): ``'events'`` or ``'tensors'``.
+
+        Returns:
+            list of str: IDs of all the graphs in order of creation.
+
+        """
+        timelines = self.events if kind == 'events' else self.tensors
+        return sorted(timelines, key=lambda g: (self._created[kind, g], g))
+
+
 class TimelineHandler(object):
     """
     This class aggregates Timelines to handle a series of training metrics.
 
-    TimelineHandler is controlled with ``session_id`` if read data
-    contradict with previously read data, it will assign new
-    ``session_id``
+    TimelineHandler is controlled with ``session_id``. If read data
+    contradict with previously read data, timelines are truncated to the
+    first contradicting record and re-extracted from there within the same
+    ``session_id``.
     """
     def __init__(self):
         self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._reader = None
+        self._closed = False
         self._clear()
 
     def _clear(self):
         self.tensors = {}
         self._events = {}
         self._time_uninitialized = True
+        self._axis = None
         self._done_idx = 0
-        self._digest = None
+        self._digest = RecordDigest()
+        self._plans = {}
+        # Keys of the records, by which keys of metrics are resolved
+        self._names = NameIndex()
+        # (version, kind, graph id) of changes in order of version
+        self._change_log = []
+        # Version when graphs keyed by (kind, graph id) were created
+        self._created = {}
         self._session_id = util.random_hash(12)
+        # Last snapshots of timelines keyed by (kind, graph id)
+        self._snapshots = {}
+        self._publish()
 
     @property
     def session_id(self):
         return self._session_id
 
-    def _initialize_time_keys(self, dic):
-        self._epoch_key = _try_find_fallback(dic, 'epoch')
-        self._iteration_key = _try_find_fallback(dic, 'iteration')
-        self._elapsed_time_key = _try_find_fallback(dic, 'elapsed_time')
+    def _initialize_time_keys(self, keys):
+        self._epoch_key = _try_find_fallback(self._names, keys, 'epoch')
+        self._iteration_key = _try_find_fallback(
+            self._names, keys, 'iteration')
+        self._elapsed_time_key = _try_find_fallback(
+            self._names, keys, 'elapsed_time')
         if (self._epoch_key is None and self._iteration_key is None
                 and self._elapsed_time_key is None):
             raise ParseError(
                 'None of epoch, iteration and elapsed_time was found in json file.')
+        self._axis = TimeAxis(self._epoch_key is not None,
+                              self._iteration_key is not None,
+                              self._elapsed_time_key is not None)
         self._time_uninitialized = False
 
-    def _extract_time(self, dic):
-        epoch = dic.pop(self._epoch_key, None)
-        iteration = dic.pop(self._iteration_key, None)
-        elapsed_time = dic.pop(self._elapsed_time_key, None)
-        # Do sanity check first. Abort if something is wrong.
-        if self._epoch_key is not None and epoch is None:
-            raise KeyDisappearedException(self._epoch_key)
-        if self._iteration_key is not None and iteration is None:
-            raise KeyDisappearedException(self._iteration_key)
-        if self._elapsed_time_key is not None and elapsed_time is None:
-            raise KeyDisappearedException(self._elapsed_time_key)
-        return epoch, iteration, elapsed_time
-
-    def _identify_predefined_metrics(self, dic, epoch, iteration, elapsed_time):
+    def _identify_predefined_metrics(self, keys):
         """
         Key name for the important metrics can change by the training configuration.
         This function determines the key names of such variables and groups
         them according its guess.
 
         Args:
-            dic:
+            keys (set of str): Keys of a record that were not consumed by
+                existing timelines.
+
+        Returns:
+            dict: Mapping from graph id (str) to new timeline
         """
         events = {}
-        loss_key = _try_find_conservative(dic, 'loss')
+        loss_key = _try_find_conservative(self._names, keys, 'loss')
         if loss_key is not None:
-            events[loss_key] = Timeline(loss_key)
-        accuracy_key = _try_find_conservative(dic, 'accuracy')
+            events[loss_key] = Timeline(self._axis, loss_key)
+        accuracy_key = _try_find_conservative(self._names, keys, 'accuracy')
         if accuracy_key is not None:
-            events[accuracy_key] = Timeline(accuracy_key)
+            events[accuracy_key] = Timeline(self._axis, accuracy_key)
         # From chainer.extensions.MicroAverage
         # These were not written in the code but is written in example
         total_key = 'main/total'
         correct_key = 'main/correct'
-        if total_key in dic and correct_key in dic:
-            events[correct_key] = MicroAverageTimeline(total_key, correct_key)
-
-        for k in six.iterkeys(events):
-            events[k].extract_value(dic, epoch, iteration, elapsed_time)
-        self._events.update(events)
+        if total_key in keys and correct_key in keys:
+            events[correct_key] = MicroAverageTimeline(
+                self._axis, total_key, correct_key)
+        return events
 
-    def _identify_tensors(self, dic, epoch, iteration, elapsed_time):
-        # For now just throw them away
-        matched = match_data_grad(dic)
+    def _identify_tensors(self, keys):
+        matched = match_data_grad(keys, self._names)
         tensors = {}
         for name, key_info in six.iteritems(matched):
             data = key_info['data']
             grad = key_info['grad']
-            tensors[name] = TensorTimeline(data, grad)
-
-        for k in six.iterkeys(tensors):
-            tensors[k].extract_value(dic, epoch, iteration, elapsed_time)
-        self.tensors.update(tensors)
+            tensors[name] = TensorTimeline(self._axis, data, grad)
+        return tensors
 
-    def _identify_misc(self, dic, epoch, iteration, elapsed_time):
-        # For now just throw them away
+    def _identify_misc(self, keys):
         events = {}
-        for k in six.iterkeys(dic):
+        for k in keys:
             if k.endswith('.std'):
                 continue
-            events[k] = Timeline(k)
-        for k in six.iterkeys(events):
-            events[k].extract_value(dic, epoch, iteration, elapsed_time)
-        self._events.update(events)
+            events[k] = Timeline(self._axis, k)
+        return events
 
-    def _extract(self, dic):
+    def _compile_plan(self, schema, record):
+        """
+        Compile an extraction plan for records with keys ``schema``.
+        New timelines are identified from keys that are not consumed by
+        existing timelines. Keys whose values in ``record`` are not numbers
+        (e.g. notes in strings) are ignored.
+
+        Args:
+            schema (frozenset of str): Keys of a record.
+            record (dict): First record with the keys.
+
+        Returns:
+            list of tuple: Timeline and keys to pass to its ``append``.
+
+        """
+        self._names.update(schema)
         if self._time_uninitialized:
-            self._initialize_time_keys(dic)
-        epoch, iteration, elapsed_time = self._extract_time(dic)
-        for k in six.iterkeys(self._events):
-            self._events[k].extract_value(dic, epoch, iteration, elapsed_time)
-        for k in six.iterkeys(self.tensors):
-            self.tensors[k].extract_value(dic, epoch, iteration, elapsed_time)
-        self._identify_predefined_metrics(dic, epoch, iteration, elapsed_time)
-        self._identify_tensors(dic, epoch, iteration, elapsed_time)
-        self._identify_misc(dic, epoch, iteration, elapsed_time)
-        if len(dic) > 0:
-            logger.debug("Ignored keys: %s" % ', '.join(map(str, six.iterkeys(dic))))
+            self._initialize_time_keys(schema)
+        for key in (self._epoch_key, self._iteration_key,
+                    self._elapsed_time_key):
+            if key is not None and key not in schema:
+                raise KeyDisappearedException(key)
+        remaining = set(schema) - set(
+            (self._epoch_key, self._iteration_key, self._elapsed_time_key))
+        non_numeric = [k for k in remaining if not _is_value(record[k])]
+        if len(non_numeric) > 0:
+            logger.debug("Ignored non-numeric keys: %s" %
+                         ', '.join(map(str, non_numeric)))
+            remaining.difference_update(non_numeric)
+
+        plan = []
+
+        def add(timelines):
+            for t in six.itervalues(timelines):
+                ret = t.plan(remaining)
+                if ret is None:
+                    continue
+                consumed, value_keys = ret
+                remaining.difference_update(consumed)
+                if value_keys is not None:
+                    plan.append((t, value_keys))
+
+        add(self._events)
+        add(self.tensors)
+        new_timelines = False
+        for identify, timelines in (
+                (self._identify_predefined_metrics, self._events),
+                (self._identify_tensors, self.tensors),
+                (self._identify_misc, self._events)):
+            new = identify(remaining)
+            add(new)
+            timelines.update(new)
+            new_timelines = new_timelines or len(new) > 0
+        if new_timelines:
+            # Plans of other schemas do not know the new timelines
+            self._plans.clear()
+        if len(remaining) > 0:
+            logger.debug("Ignored keys: %s" % ', '.join(map(str, remaining)))
+        return plan
+
+    def _extract(self, dic, idx):
+        schema = frozenset(dic)
+        plan = self._plans.get(schema)
+        if plan is None:
+            plan = self._compile_plan(schema, dic)
+            self._plans[schema] = plan
+        row = self._axis.append(dic.get(self._epoch_key),
+                                dic.get(self._iteration_key),
+                                dic.get(self._elapsed_time_key))
+        assert row == idx
+        for timeline, keys in plan:
+            try:
+                timeline.append(row, [dic[k] for k in keys])
+            except (TypeError, ValueError) as e:
+                # The point is missing as if the keys were absent, so that
+                # one bad value does not stop parsing the whole log
+                logger.debug("Ignored values of %s at record %d: %s" %
+                             (', '.join(map(str, keys)), idx, str(e)))
 
     @_lock
-    def update(self, logs):
+    def update(self, logs, start=0):
         """
         Update the handler from log dictionaries.
         This function is idempotent.
@@ -314,23 +403,254 @@ class TimelineHandler(object):
         Args:
             logs (list of dict): Parsed log file, each dict representing a
                 report from the single output of Reporter.
+            start (int): Index of ``logs[0]`` in the whole log. Records
+                before ``start`` are assumed to be unchanged from the ones
+                given previously. Only the new records and the last known
+                record in ``logs`` are hashed to verify the prefix, unless
+                ``start`` is 0 (e.g. the log was rewritten and read again),
+                in which case all the known records are compared.
 
         """
-        digest = _hash_json(logs[:self._done_idx])
-        if self._digest != digest:
-            old_session = self._session_id
-            self._clear()
+        if start > self._done_idx:
+            raise ValueError(
+                'Records %d to %d are missing' % (self._done_idx, start))
+        if start == 0 and self._done_idx > 0:
+            # Any record may differ in a log read from the beginning
+            divergence = self._digest.first_divergence(logs, start)
+        elif not self._digest.is_consistent(logs, start):
+            divergence = self._digest.first_divergence(logs, start)
+        else:
+            divergence = None
+        if divergence is not None:
             logger.debug(
-                "Digest unmatch; setting new session (%s -> %s)" %
-                (old_session, self._session_id)
-            )
-
-        if self._done_idx < len(logs):
-            self._digest = _hash_json(logs)
-            while self._done_idx < len(logs):
-                self._extract(logs[self._done_idx])
+                "Digest unmatch at record %d; re-extracting from there" %
+                divergence)
+            self._truncate(divergence)
+
+        if self._done_idx < start + len(logs):
+            while self._done_idx < start + len(logs):
+                record = logs[self._done_idx - start]
+                self._digest.append(record)
+                self._extract(record, self._done_idx)
                 self._done_idx += 1
             logger.debug('Parsed up to line:%d' % (self._done_idx))
+        self._settle()
+
+    def _settle(self):
+        """ Settle timelines and log the changed ones. """
+        version = self._version + 1
+        changed = set()
+        for kind, timelines in (('events', self._events),
+                                ('tensors', self.tensors)):
+            for g, t in six.iteritems(timelines):
+                if t.settle(version):
+                    changed.add((kind, g))
+                    self._change_log.append((version, kind, g))
+                    self._created.setdefault((kind, g), version)
+        if changed:
+            self._version = version
+            self._compact_change_log()
+            self._publish(changed)
+            self._changed.notify_all()
+
+    def _publish(self, changed=()):
+        """
+        Publish a snapshot of the timelines. Timelines that are not in
+        ``changed`` (set of (kind, graph id)) share their last snapshots.
+        """
+        axis = None if self._axis is None else self._axis.snapshot()
+        snapshots = {}
+        for kind, timelines in (('events', self._events),
+                                ('tensors', self.tensors)):
+            snapshots[kind] = {}
+            for g, t in six.iteritems(timelines):
+                snapshot = self._snapshots.get((kind, g))
+                if snapshot is None or (kind, g) in changed:
+                    snapshot = t.snapshot(axis)
+                    self._snapshots[kind, g] = snapshot
+                snapshots[kind][g] = snapshot
+        # Replacing the reference is atomic, so readers need no lock
+        self._snapshot = Snapshot(
+            self._session_id, self._version, snapshots['events'],
+            snapshots['tensors'], tuple(self._change_log),
+            dict(self._created), self._names.trie)
+
+    def _compact_change_log(self):
+        """
+        Keep only the last change of each graph once the log grows long,
+        which is enough to answer :meth:`changes_since`.
+        """
+        n_graphs = len(self._events) + len(self.tensors)
+        if len(self._change_log) <= 2 * n_graphs + 64:
+            return
+        self._change_log = sorted(
+            (t.version, kind, g)
+            for kind, timelines in (('events', self._events),
+                                    ('tensors', self.tensors))
+            for g, t in six.iteritems(timelines))
+
+    def _truncate(self, idx):
+        """
+        Forget records from ``idx``-th while keeping the session. Timelines
+        that become empty are kept so that clients can keep referring to
+        them.
+        """
+        for timelines in (self._events, self.tensors):
+            for t in six.itervalues(timelines):
+                t.truncate(idx)
+        if self._axis is not None:
+            self._axis.truncate(idx)
+        self._digest.truncate(idx)
+        self._done_idx = idx
+
+    def state(self):
+        """
+        Get the state of the handler to save, e.g. by
+        :class:`~chainerboard.cache.TimelineCache`. It must be called with
+        :attr:`lock` held, until when the returned arrays are consumed.
+
+        Returns:
+            tuple: Json serializable metadata (dict) and arrays keyed by
+            names (dict). Arrays are views of the columns.
+
+        """
+        arrays = {}
+        for name, arr in six.iteritems(self._digest.state()):
+            arrays['digest/' + name] = arr
+        if self._axis is not None:
+            for name, arr in six.iteritems(self._axis.state()):
+                arrays['axis/' + name] = arr
+        meta = {
+            'doneIdx': self._done_idx,
+            'reader': None if self._reader is None else self._reader.state(),
+            'keys': None if self._time_uninitialized else [
+                self._epoch_key, self._iteration_key, self._elapsed_time_key],
+            'names': list(self._names)
+        }
+        for kind, timelines in (('events', self._events),
+                                ('tensors', self.tensors)):
+            meta[kind] = []
+            for i, (g, t) in enumerate(six.iteritems(timelines)):
+                spec, values = t.state()
+                meta[kind].append([g, spec])
+                for j, arr in enumerate(values):
+                    arrays['%s/%d/%d' % (kind, i, j)] = arr
+        return meta, arrays
+
+    @_lock
+    def restore(self, path, meta, arrays):
+        """
+        Restore the state given by :meth:`state` and resume reading the log
+        at ``path`` from there. Records appended since then are parsed on
+        the next :meth:`load`.
+
+        Args:
+            path (str): Path to the log file.
+            meta (dict): Metadata given by :meth:`state`.
+            arrays (dict): Arrays given by :meth:`state`, which may be
+                memory maps.
+
+        """
+        self._clear()
+        self._digest = RecordDigest.restore(
+            {'records': arrays['digest/records'],
+             'chain': arrays['digest/chain']})
+        self._done_idx = meta['doneIdx']
+        self._names.update(meta['names'])
+        if meta['keys'] is not None:
+            self._epoch_key, self._iteration_key, self._elapsed_time_key = \
+                meta['keys']
+            self._axis = TimeAxis.restore(
+                {name[len('axis/'):]: arr for name, arr in six.iteritems(arrays)
+                 if name.startswith('axis/')})
+            self._time_uninitialized = False
+        for kind, timelines in (('events', self._events),
+                                ('tensors', self.tensors)):
+            for i, (g, spec) in enumerate(meta[kind]):
+                values = []
+                while '%s/%d/%d' % (kind, i, len(values)) in arrays:
+                    values.append(arrays['%s/%d/%d' % (kind, i, len(values))])
+                timelines[g] = restore_timeline(self._axis, spec, values)
+        self._reader = LogReader.restore(path, meta['reader'])
+        self._settle()
+
+    def find_divergence(self, logs, start=0):
+        """
+        Find the first record in ``logs`` that differs from the records that
+        were already parsed.
+
+        Args:
+            logs (list of dict): Parsed log records.
+            start (int): Index of ``logs[0]`` in the whole log.
+
+        Returns:
+            int or None: Index of the first diverging record or ``None`` if
+            ``logs`` is consistent with the parsed records.
+
+        """
+        with self._lock:
+            return self._digest.first_divergence(logs, start)
+
+    @property
+    def version(self):
+        """
+        Version of the timelines (int), which is incremented whenever any
+        of the timelines changes.
+        """
+        return self._version
+
+    @property
+    def snapshot(self):
+        """
+        Latest snapshot of the timelines (:class:`Snapshot`), which is read
+        without the lock.
+        """
+        return self._snapshot
+
+    def changes_since(self, version, kind):
+        """
+        Find graphs that changed after ``version`` in the latest snapshot.
+        See :meth:`Snapshot.changes_since`.
+        """
+        return self._snapshot.changes_since(version, kind)
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the version differs from ``version`` or ``timeout``
+        passes.
+
+        Args:
+            version (int): Version that the caller knows.
+            timeout (float): Timeout in seconds or None to wait forever.
+
+        Returns:
+            int: Current version, which may still be ``version`` on timeout
+            or when the handler is closed.
+
+        """
+        with self._changed:
+            if self._version == version and not self._closed:
+                self._changed.wait(timeout)
+            return self._version
+
+    def close(self):
+        """
+        Mark the handler as no longer updated, e.g. because its run was
+        unloaded, and wake up the callers of :meth:`wait_for_change`.
+        """
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    @property
+    def closed(self):
+        """ True if the handler is no longer updated (bool). """
+        return self._closed
+
+    @property
+    def digest(self):
+        """ Chained digest (str) of all the records parsed so far. """
+        return self._digest.digest
 
     def get_events_ids(self):
         return list(six.iterkeys(self._events))
@@ -350,7 +670,17 @@ class TimelineHandler(object):
         """
         Aggregate records and crete timeline data that is suitable for drawing
         plots.
+
+        Only records appended since the last call are parsed as long as the
+        same ``path`` is given.
         """
-        with open(path) as fin:
-            data = json.load(fin)
-        self.update(data)
+        if self._reader is None or self._reader.path != path:
+            self._reader = LogReader(path)
+        start, logs = self._reader.read()
+        if start != 0 and start != self._done_idx:
+            # Handler and reader went out of sync; read everything again.
+            # Records read from the beginning (e.g. of a rewritten log) are
+            # all there and are used as they are.
+            self._reader.reset()
+            start, logs = self._reader.read()
+        self.update(logs, start=start)
@@ -4,6 +4,8 @@ from __future__ import absolute_import, division, print_function, \
 
 import random
 import string
+import threading
+from collections import OrderedDict
 
 import six
 
@@ -13,3 +15,66 @@ _LETTERS = six.u(string.ascii_letters + string.digits)
 def random_hash(n, seed=None):
     random.seed(seed)
     return ''.join((random.choice(_LETTERS) for _ in six.moves.xrange(n)))
+
+
+class LRUCache(object):
+    """
+    Thread-safe dict-like cache that discards the least recently used item
+    when it has more than ``maxsize`` items or, if ``maxbytes`` is given,
+    when the items take more than ``maxbytes`` bytes. An item that alone
+    takes more than ``maxbytes`` is not kept.
+
+    Args:
+        maxsize (int): Maximum number of items.
+        maxbytes (int): Maximum total size of items in bytes, or None.
+        sizeof (func): Function that returns the size of a value in bytes.
+            Required with ``maxbytes``.
+
+    """
+
+    def __init__(self, maxsize, maxbytes=None, sizeof=None):
+        assert maxbytes is None or sizeof is not None
+        self._maxsize = maxsize
+        self._maxbytes = maxbytes
+        self._sizeof = sizeof
+        self._data = OrderedDict()  # key -> (value, size)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def nbytes(self):
+        """ Total size of the items in bytes (int), 0 without ``maxbytes``. """
+        return self._nbytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                item = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = item
+            return item[0]
+
+    def put(self, key, value):
+        size = 0 if self._maxbytes is None else self._sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            if self._maxbytes is not None and size > self._maxbytes:
+                return
+            self._data[key] = (value, size)
+            self._nbytes += size
+            while len(self._data) > self._maxsize or (
+                    self._maxbytes is not None and
+                    self._nbytes > self._maxbytes):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._nbytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
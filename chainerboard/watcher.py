@@ -5,26 +5,107 @@ from __future__ import absolute_import, division, print_function, \
 import contextlib
 import logging
 import os
+import threading
+import time
 
 from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
 
+from chainerboard.cache import CACHE_SAVE_INTERVAL
+
 
 logger = logging.getLogger(__name__)
 
 
+class BackgroundLoader(object):
+    """
+    Thread that runs ``load`` on request, turning bursts of requests into
+    at most one call per ``interval`` seconds.
+
+    Requests made while ``load`` is running or while waiting for the
+    interval are collapsed into one call that runs after them, so the last
+    modification is always loaded.
+
+    Args:
+        load (callable): Function without arguments to call.
+        interval (float): Minimum interval in seconds between the starts of
+            two calls.
+
+    """
+
+    def __init__(self, load, interval=1.):
+        self._load = load
+        self._interval = interval
+        self._requested = threading.Condition(threading.Lock())
+        self._n_pending = 0
+        self._stopping = False
+        self._last_load = None
+        # Statistics to tune the interval
+        self.n_requests = 0
+        self.n_loads = 0
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    @property
+    def n_collapsed(self):
+        """ Number of requests that did not cause their own call (int) """
+        with self._requested:
+            return self.n_requests - self._n_pending - self.n_loads
+
+    def start(self):
+        self._thread.start()
+
+    def request(self):
+        """ Request to call ``load``. It returns immediately. """
+        with self._requested:
+            self._n_pending += 1
+            self.n_requests += 1
+            self._requested.notify()
+
+    def stop(self):
+        """ Stop the thread after the running call finishes. """
+        with self._requested:
+            self._stopping = True
+            self._requested.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._requested:
+                while self._n_pending == 0 and not self._stopping:
+                    self._requested.wait()
+                # Requests keep coming in while waiting, to be collapsed
+                while not self._stopping and self._last_load is not None:
+                    remaining = self._last_load + self._interval - time.time()
+                    if remaining <= 0:
+                        break
+                    self._requested.wait(remaining)
+                if self._stopping:
+                    return
+                n_collapsed = self._n_pending - 1
+                self._n_pending = 0
+                self.n_loads += 1
+            logger.info("modification detected! Updating (%d events "
+                        "collapsed)" % n_collapsed)
+            self._last_load = time.time()
+            try:
+                self._load()
+            except Exception:
+                logger.exception("Failed to load")
+
+
 class LogHandler(FileSystemEventHandler):
-    def __init__(self, inputfile, timeline_handler):
+    def __init__(self, inputfile, loader):
         self._watch_path = inputfile
-        self._timeline_handler = timeline_handler
+        self._loader = loader
         super(LogHandler, self).__init__()
 
     def _on_change(self, target_path):
         target_path = os.path.realpath(target_path)
         watch_path = os.path.realpath(self._watch_path)
         if target_path == watch_path:
-            logger.info("modification detected! Updating %s" % target_path)
-            self._timeline_handler.load(target_path)
+            logger.debug("modification detected at %s" % target_path)
+            self._loader.request()
 
     def on_modified(self, event):
         self._on_change(event.src_path)
@@ -39,11 +120,69 @@ class LogHandler(FileSystemEventHandler):
         self._on_change(event.dest_path)
 
 
+class RunsHandler(FileSystemEventHandler):
+    def __init__(self, pattern, registry):
+        self._pattern = pattern
+        self._registry = registry
+        super(RunsHandler, self).__init__()
+
+    def _on_change(self, target_path):
+        if not self._pattern.match(target_path):
+            return
+        if self._registry.notify(target_path):
+            logger.debug("modification detected! Updating %s" % target_path)
+        elif os.path.isfile(target_path):
+            self._registry.add(self._pattern.run_id(target_path), target_path)
+
+    def on_modified(self, event):
+        self._on_change(event.src_path)
+
+    def on_created(self, event):
+        self._on_change(event.src_path)
+
+    def on_moved(self, event):
+        self._on_change(event.dest_path)
+
+
+def _save_cache(cache, timeline_handler):
+    try:
+        cache.save(timeline_handler)
+    except (IOError, OSError):
+        logger.warning("Failed to save cache %s" % cache.path)
+
+
 @contextlib.contextmanager
-def watch_file(inputfile, timeline_handler):
+def watch_file(inputfile, timeline_handler, cache=None, interval=1.):
+    """
+    Load ``inputfile`` and keep ``timeline_handler`` up to date.
+
+    Args:
+        inputfile (str): Path to the log file.
+        timeline_handler (chainerboard.timeline_handler.TimelineHandler):
+            Handler to load the log file.
+        cache (chainerboard.cache.TimelineCache): Cache to restore the
+            handler from and to save it to, or ``None``.
+        interval (float): Minimum interval in seconds between reloads.
+
+    """
+    if cache is not None:
+        cache.restore(timeline_handler)
     # log handler does not load on detecting the initial file
     timeline_handler.load(inputfile)
-    event_handler = LogHandler(inputfile, timeline_handler)
+    if cache is not None:
+        _save_cache(cache, timeline_handler)
+    last_save = [time.time()]
+
+    def load():
+        timeline_handler.load(inputfile)
+        if cache is not None and \
+                time.time() - last_save[0] >= CACHE_SAVE_INTERVAL:
+            _save_cache(cache, timeline_handler)
+            last_save[0] = time.time()
+
+    loader = BackgroundLoader(load, interval)
+    loader.start()
+    event_handler = LogHandler(inputfile, loader)
     observer = Observer()
     observer.schedule(event_handler,
                       os.path.dirname(os.path.abspath(inputfile)))
@@ -51,3 +190,32 @@ def watch_file(inputfile, timeline_handler):
     yield
     observer.stop()
     observer.join()
+    loader.stop()
+    logger.info("Loaded %d times on %d modifications" %
+                (loader.n_loads, loader.n_requests))
+    if cache is not None:
+        _save_cache(cache, timeline_handler)
+
+
+@contextlib.contextmanager
+def watch_runs(pattern, registry):
+    """
+    Register runs matching ``pattern`` to ``registry`` and keep them up to
+    date. Only runs that have been loaded are parsed on modification.
+
+    Args:
+        pattern (chainerboard.runs.RunPattern): Pattern of log files.
+        registry (chainerboard.runs.RunRegistry): Registry of runs.
+
+    """
+    registry.discover(pattern)
+    event_handler = RunsHandler(pattern, registry)
+    observer = Observer()
+    observer.schedule(event_handler, pattern.root, recursive=True)
+    observer.start()
+    yield
+    observer.stop()
+    observer.join()
+    registry.close()
+    logger.info("Loaded %d times on %d modifications" %
+                (registry.n_loads, registry.n_requests))
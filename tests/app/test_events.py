@@ -2,38 +2,292 @@
 from __future__ import absolute_import, division, print_function, \
     unicode_literals
 
+import base64
+import gzip
+import io
+import json
 
-from chainerboard.app import events
+import numpy as np
+
+from chainerboard.app import app, events, serialize, timeline_handler
+from chainerboard.app.stream import _stream_changes
+from chainerboard.runs import RunPattern, RunRegistry
+from chainerboard.timeline_handler import TimelineHandler
+
+
+def _assert_cleansed(expected, y):
+    # None stands for NaN
+    assert isinstance(y, np.ndarray)
+    assert [e is None for e in expected] == list(np.isnan(y))
+    assert [e for e in expected if e is not None] == list(y[~np.isnan(y)])
 
 
 def test_clease_plots():
     y_input = [0.1125, -0.1, float('inf'), 2.091]
     x_input = [0, 1, 2, 3]
     y = events._cleanse_plots(x_input, y_input)
-    assert [0.1125, -0.1, 'nan', 2.091] == y
+    _assert_cleansed([0.1125, -0.1, None, 2.091], y)
 
     # it should accept empty list
     y = events._cleanse_plots([], [])
-    assert [] == y
+    _assert_cleansed([], y)
 
     y_input = [float('inf')]
     x_input = [0]
     y = events._cleanse_plots(x_input, y_input)
-    assert ['nan'] == y
+    _assert_cleansed([None], y)
 
     y_input = [0.1125, -0.1, float('nan'), 2.091]
     x_input = [0, 1, 2, 3]
     y = events._cleanse_plots(x_input, y_input)
-    assert [0.1125, -0.1, 'nan', 2.091] == y
+    _assert_cleansed([0.1125, -0.1, None, 2.091], y)
 
     # should not change (slightly) large value
     y_input = [1.2e5, -0.1]
     x_input = [0, 1]
     y = events._cleanse_plots(x_input, y_input)
-    assert [1.2e5, -0.1] == y
+    _assert_cleansed([1.2e5, -0.1], y)
 
     # should replace really large value
     y_input = [1.0e309, -0.1]
     x_input = [0, 1]
     y = events._cleanse_plots(x_input, y_input)
-    assert ['nan', -0.1] == y
+    _assert_cleansed([None, -0.1], y)
+
+
+def test_dumps():
+    y = np.array([0.5, float('nan'), float('inf'), -float('inf')])
+    assert '[[0.5,null,null,null],{"label":"a"}]' == serialize.dumps(
+        [y, {'label': 'a'}])
+    assert '[[1,-2],[]]' == serialize.dumps(
+        [np.array([1, -2]), np.array([], dtype=np.float64)])
+    assert '[[1.5,null],[1e+20,-0.1]]' == serialize.dumps(
+        np.array([[1.5, np.nan], [1e20, -0.1]]))
+
+
+def test_dumps_base64():
+    y = np.array([0.5, float('nan')])
+    ret = json.loads(serialize.dumps({'y': y}, arrays='f32'))
+    assert 'f32' == ret['y']['dtype']
+    decoded = np.frombuffer(base64.b64decode(ret['y']['base64']), '<f4')
+    assert 0.5 == decoded[0] and np.isnan(decoded[1])
+
+
+def test_encoded_cache():
+    cache = serialize.encoded_cache(10, 100)
+    cache.put('a', serialize.Encoded('x' * 30))
+    cache.put('b', serialize.Encoded('x' * 30))
+    # a body and its compressed copy are counted
+    assert cache.get('a') is None and cache.get('b') is not None
+    assert 60 == cache.nbytes
+    cache.put('c', serialize.Encoded('x' * 60))
+    assert cache.get('c') is None and cache.get('b') is not None
+
+
+def test_get_events_data_compressed():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(1000)])
+    client = app.test_client()
+    params = {'graphId': 'main/loss', 'sessionId': handler.session_id,
+              'arrays': 'f64'}
+    response = client.get('/events/data', query_string=params,
+                          headers={'Accept-Encoding': 'gzip'})
+    assert 'gzip' == response.headers['Content-Encoding']
+    ret = json.loads(gzip.GzipFile(
+        fileobj=io.BytesIO(response.get_data())).read().decode('utf-8'))
+    y = np.frombuffer(base64.b64decode(ret['y']['base64']), '<f8')
+    assert list(range(1000)) == list(y)
+
+    params['arrays'] = 'f16'
+    assert 400 == client.get('/events/data', query_string=params).status_code
+
+
+def test_get_events_data_range():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(100)])
+    client = app.test_client()
+    params = {'graphId': 'main/loss', 'sessionId': handler.session_id}
+    ret = json.loads(client.get(
+        '/events/data', query_string=params).get_data(as_text=True))
+    assert 100 == len(ret['y'])
+    assert not ret['range']
+
+    params.update({'xmin': 20, 'xmax': 29.5, 'width': 4})
+    ret = json.loads(client.get(
+        '/events/data', query_string=params).get_data(as_text=True))
+    assert ret['range']
+    assert 2 == ret['level']
+    assert [19, 20, 24, 28] == ret['x']
+    # buckets at both ends are aligned and cover points out of the range
+    assert [16., 20., 24., 28.] == ret['yMin']
+    assert [19., 23., 27., 31.] == ret['yMax']
+
+    params = {'graphId': 'main/loss', 'sessionId': handler.session_id,
+              'smoothing': 'ma:3'}
+    ret = json.loads(client.get(
+        '/events/data', query_string=params).get_data(as_text=True))
+    assert 0 == ret['smoothedOffset']
+    assert [None, 1., 2.] == ret['smoothed'][:3]
+    assert None is ret['smoothed'][-1]
+    params['smoothing'] = 'ma:x'
+    assert 400 == client.get('/events/data', query_string=params).status_code
+
+
+def test_get_events_batch():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i), 'main/accuracy': 0.1 * i,
+                     'iteration': i, 'epoch': 0} for i in range(10)])
+    client = app.test_client()
+    payload = {
+        'sessionId': handler.session_id,
+        'smoothing': 'ma:3',
+        'graphs': [
+            {'graphId': 'main/loss',
+             'cursor': handler.events['main/loss'].cursor},
+            {'graphId': 'main/accuracy', 'smoothing': None}
+        ]
+    }
+    ret = json.loads(client.post(
+        '/events/batch', data=json.dumps(payload),
+        content_type='application/json').get_data(as_text=True))
+    assert ret['exists']
+    loss = ret['data']['main/loss']
+    assert 10 == loss['offset'] and [] == loss['y']
+    assert [None] == loss['smoothed']
+    accuracy = ret['data']['main/accuracy']
+    assert 10 == len(accuracy['y']) and 'smoothed' not in accuracy
+
+    payload['sessionId'] = 'invalid'
+    ret = json.loads(client.post(
+        '/events/batch', data=json.dumps(payload),
+        content_type='application/json').get_data(as_text=True))
+    assert not ret['exists']
+
+
+def test_get_events_data_not_modified():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(5)])
+    client = app.test_client()
+    params = {'graphId': 'main/loss', 'sessionId': handler.session_id}
+    response = client.get('/events/data', query_string=params)
+    etag = response.headers['ETag']
+    response = client.get('/events/data', query_string=params,
+                          headers={'If-None-Match': etag})
+    assert 304 == response.status_code
+
+    # same graph with another query
+    response = client.get('/events/data', query_string=dict(
+        params, maxPoints=3), headers={'If-None-Match': etag})
+    assert 200 == response.status_code
+
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(6)])
+    response = client.get('/events/data', query_string=params,
+                          headers={'If-None-Match': etag})
+    assert 200 == response.status_code
+    assert etag != response.headers['ETag']
+    assert 6 == len(json.loads(response.get_data(as_text=True))['y'])
+
+
+def test_get_events_data_max_points():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i % 4), 'iteration': i, 'epoch': 0}
+                    for i in range(10)])
+    client = app.test_client()
+    params = {'graphId': 'main/loss', 'sessionId': handler.session_id}
+    for max_points in (1, 2):
+        ret = json.loads(client.get('/events/data', query_string=dict(
+            params, maxPoints=max_points)).get_data(as_text=True))
+        assert ret['downsampled']
+        assert max_points == len(ret['x']) == len(ret['y'])
+
+    response = client.get('/events/data',
+                          query_string=dict(params, maxPoints=0))
+    assert 400 == response.status_code
+
+
+def test_stream_updates():
+    client = app.test_client()
+    response = client.get('/updates/stream')
+    assert 'text/event-stream' == response.mimetype
+    chunk = next(response.response)
+    if isinstance(chunk, bytes):
+        chunk = chunk.decode('utf-8')
+    assert chunk.startswith('event: change\n')
+    version = timeline_handler.version
+    assert version == json.loads(chunk.split('data: ')[1])['version']
+    response.close()
+
+
+def test_stream_ends_when_closed():
+    handler = TimelineHandler()
+    stream = _stream_changes(handler)
+    assert next(stream).startswith('event: change\n')
+    handler.close()
+    assert [] == list(stream)
+
+
+def test_streams_keep_runs_loaded(tmpdir, monkeypatch):
+    for name in ('a', 'b'):
+        tmpdir.join(name).ensure(dir=True)
+        tmpdir.join(name, 'log').write(json.dumps(
+            [{'main/loss': 0.5, 'iteration': 1, 'epoch': 0}]))
+    registry = RunRegistry(n_workers=2, max_loaded=1)
+    registry.discover(RunPattern(str(tmpdir)))
+    monkeypatch.setattr('chainerboard.app.runs', registry)
+    monkeypatch.setattr('chainerboard.app.stream.runs', registry)
+    client = app.test_client()
+    responses = []
+    for name in ('a', 'b'):
+        response = client.get('/updates/stream',
+                              query_string={'runId': name})
+        assert next(response.response)
+        responses.append(response)
+
+    # streaming runs are not unloaded by each other's clients
+    handlers = [registry.get('a'), registry.get('b')]
+    assert registry.is_loaded('a') and registry.is_loaded('b')
+    assert not any(h.closed for h in handlers)
+
+    for response in responses:
+        response.close()
+    assert not registry.is_loaded('a') and registry.is_loaded('b')
+    assert handlers[0].closed and not handlers[1].closed
+    registry.close()
+
+
+def test_get_events_updates():
+    handler = timeline_handler
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(3)])
+    client = app.test_client()
+
+    def post(payload):
+        return json.loads(client.post(
+            '/events/updates', data=json.dumps(payload),
+            content_type='application/json').get_data(as_text=True))
+
+    ret = post({'sessionId': '', 'version': 0})
+    assert 'new' == ret['updateType']
+    assert sorted(handler.get_events_ids()) == sorted(ret['updates'])
+    assert set(ret['updates']) == set(p['graphId'] for p in ret['newPlots'])
+
+    version = ret['version']
+    ret = post({'sessionId': handler.session_id, 'version': version})
+    assert 'update' == ret['updateType']
+    assert [] == ret['updates'] and [] == ret['newPlots']
+
+    handler.update([{'main/loss': float(i), 'iteration': i, 'epoch': 0}
+                    for i in range(4)])
+    ret = post({'sessionId': handler.session_id, 'version': version})
+    assert ['main/loss'] == ret['updates'] and [] == ret['newPlots']
+    assert version < ret['version']
+
+
+def test_unknown_run():
+    client = app.test_client()
+    params = {'graphId': 'main/loss', 'sessionId': '', 'runId': 'unknown'}
+    assert 404 == client.get('/events/data', query_string=params).status_code
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import json
+
+from chainerboard.app import app, timeline_handler
+
+
+def _records(n):
+    logs = []
+    for i in range(n):
+        log = {'iteration': i, 'epoch': 0}
+        for j, k in enumerate(('min', 'percentile/0', 'percentile/1',
+                               'percentile/2', 'max')):
+            log['main/l1/W/data/' + k] = float(i + j)
+            log['main/l1/W/grad/' + k] = float(i + j)
+        logs.append(log)
+    return logs
+
+
+def test_get_histograms_data_downsampled():
+    handler = timeline_handler
+    handler.update(_records(10))
+    client = app.test_client()
+    params = {'graphId': 'main/l1/W', 'sessionId': handler.session_id}
+    ret = json.loads(client.get(
+        '/histograms/data', query_string=params).get_data(as_text=True))
+    assert 10 == len(ret['x']) and not ret['downsampled']
+
+    params['maxPoints'] = 5
+    ret = json.loads(client.get(
+        '/histograms/data', query_string=params).get_data(as_text=True))
+    assert ret['downsampled'] and ret['full'] and ret['cursor'] is None
+    assert [0, 2, 4, 6, 8] == ret['x']
+    # envelope is kept while the median is averaged
+    assert [0., 2., 4., 6., 8.] == ret['y'][0]['data']
+    assert [2.5, 4.5, 6.5, 8.5, 10.5] == ret['y'][2]['data']
+    assert [5., 7., 9., 11., 13.] == ret['y'][-1]['data']
+
+    params['maxPoints'] = 'x'
+    assert 400 == client.get(
+        '/histograms/data', query_string=params).status_code
+
+
+def test_get_histograms_density():
+    handler = timeline_handler
+    handler.update(_records(10))
+    client = app.test_client()
+    params = {'graphId': 'main/l1/W', 'sessionId': handler.session_id,
+              'width': 5, 'bins': 13}
+    ret = json.loads(client.get(
+        '/histograms/density', query_string=params).get_data(as_text=True))
+    assert [0, 2, 4, 6, 8] == ret['x']
+    assert 13 == len(ret['y']) and 13 == len(ret['z'])
+    for j in range(5):
+        assert abs(1. - sum(row[j] for row in ret['z'])) < 1e-9
+
+    payload = {'sessionId': handler.session_id, 'mode': 'density',
+               'width': 5, 'graphs': [{'graphId': 'main/l1/W'}]}
+    ret = json.loads(client.post(
+        '/histograms/batch', data=json.dumps(payload),
+        content_type='application/json').get_data(as_text=True))
+    assert 64 == len(ret['data']['main/l1/W']['z'])
+
+    params['bins'] = 0
+    assert 400 == client.get(
+        '/histograms/density', query_string=params).status_code
+
+
+def test_get_histograms_list():
+    handler = timeline_handler
+    records = _records(3)
+    for log in records:
+        for name in ('main/l2/W', 'main/l2/b'):
+            for k, v in list(log.items()):
+                if k.startswith('main/l1/W/'):
+                    log[name + k[len('main/l1/W'):]] = v
+    handler.update(records)
+    client = app.test_client()
+    ret = json.loads(client.get('/histograms/list', query_string={
+        'offset': 1, 'limit': 1}).get_data(as_text=True))
+    assert 3 == ret['total'] and 1 == ret['offset']
+    assert handler.session_id == ret['sessionId']
+    assert ['main/l2/W'] == ret['graphIds']
+
+    ret = json.loads(client.get('/histograms/list', query_string={
+        'prefix': 'main/l2', 'regex': 'b$'}).get_data(as_text=True))
+    assert ['main/l2/b'] == ret['graphIds']
+
+    assert 400 == client.get('/histograms/list', query_string={
+        'regex': '('}).status_code
+    assert 400 == client.get('/histograms/list', query_string={
+        'limit': -1}).status_code
+
+
+def test_search_metrics():
+    handler = timeline_handler
+    handler.update(_records(1))
+    client = app.test_client()
+    ret = json.loads(client.get('/metrics/search', query_string={
+        'prefix': 'main/l1/W/data/', 'regex': 'percentile',
+        'limit': 2}).get_data(as_text=True))
+    assert 3 == ret['total']
+    assert ['main/l1/W/data/percentile/0',
+            'main/l1/W/data/percentile/1'] == ret['names']
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+import json
+import os
+
+import numpy as np
+
+from chainerboard.cache import TimelineCache
+from chainerboard.timeline_handler import TimelineHandler
+
+
+def _records(n, offset=0):
+    logs = []
+    for i in range(offset, offset + n):
+        log = {'main/loss': 0.1 * i, 'iteration': i, 'epoch': i // 10}
+        if i % 2 == 0:
+            log['validation/main/loss'] = 0.2 * i
+        for k in ('percentile/0', 'percentile/1', 'min', 'max'):
+            log['main/l1/W/data/' + k] = float(i)
+            log['main/l1/W/grad/' + k] = -float(i)
+        logs.append(log)
+    return logs
+
+
+def _write(path, records):
+    with io.open(str(path), 'w', encoding='utf-8') as fout:
+        fout.write(json.dumps(records, indent=4))
+
+
+def _assert_same(expected, actual):
+    assert set(expected.get_events_ids()) == set(actual.get_events_ids())
+    assert list(expected.snapshot.names) == list(actual.snapshot.names)
+    for g, t in expected.events.items():
+        assert list(t.iteration) == list(actual.events[g].iteration)
+        assert list(t.value) == list(actual.events[g].value)
+    for g, t in expected.tensors.items():
+        np.testing.assert_array_equal(t.stats, actual.tensors[g].stats)
+
+
+def _saved_files(cache):
+    return sorted(n for n in os.listdir(cache.path) if n.endswith('.bin'))
+
+
+def test_save_and_restore(tmpdir):
+    path = tmpdir.join('log')
+    _write(path, _records(5))
+    handler = TimelineHandler()
+    handler.load(str(path))
+    cache = TimelineCache(str(path))
+    cache.save(handler)
+    assert os.path.isdir(str(tmpdir.join('.log.chainerboard')))
+
+    restored = TimelineHandler()
+    assert TimelineCache(str(path)).restore(restored)
+    _assert_same(handler, restored)
+    assert 0 < restored.version
+
+    # records appended while not running
+    _write(path, _records(8))
+    handler.load(str(path))
+    restored.load(str(path))
+    _assert_same(handler, restored)
+
+
+def test_save_incrementally(tmpdir):
+    path = tmpdir.join('log')
+    _write(path, _records(3))
+    handler = TimelineHandler()
+    handler.load(str(path))
+    cache = TimelineCache(str(path), str(tmpdir.join('caches')))
+    cache.save(handler)
+    files = _saved_files(cache)
+
+    _write(path, _records(6))
+    handler.load(str(path))
+    cache.save(handler)
+    assert files == _saved_files(cache)
+    restored = TimelineHandler()
+    assert TimelineCache(str(path), str(tmpdir.join('caches'))).restore(
+        restored)
+    _assert_same(handler, restored)
+
+
+def test_invalidated_by_rewrite(tmpdir):
+    path = tmpdir.join('log')
+    _write(path, _records(4))
+    handler = TimelineHandler()
+    handler.load(str(path))
+    cache = TimelineCache(str(path))
+    cache.save(handler)
+    files = _saved_files(cache)
+
+    logs = _records(4)
+    for log in logs:
+        log['main/loss'] += 10.
+    _write(path, logs)
+    assert not TimelineCache(str(path)).restore(TimelineHandler())
+
+    handler.load(str(path))
+    cache.save(handler)
+    assert not set(files) & set(_saved_files(cache))
+    restored = TimelineHandler()
+    assert TimelineCache(str(path)).restore(restored)
+    assert 10. == restored.events['main/loss'].value[0]
+
+
+def test_timeline_becomes_sparse(tmpdir):
+    path = tmpdir.join('log')
+    logs = [{'main/loss': 1., 'validation/main/loss': 2., 'iteration': 1},
+            {'main/loss': 3., 'iteration': 2}]
+    _write(path, logs[:1])
+    handler = TimelineHandler()
+    handler.load(str(path))
+    cache = TimelineCache(str(path))
+    cache.save(handler)
+
+    # a validation metric that was reported every time is now missing
+    logs.append({'main/loss': 4., 'validation/main/loss': 5.,
+                 'iteration': 3})
+    _write(path, logs)
+    handler.load(str(path))
+    cache.save(handler)
+
+    restored = TimelineHandler()
+    assert TimelineCache(str(path)).restore(restored)
+    _assert_same(handler, restored)
+    assert [1, 3] == list(restored.events['validation/main/loss'].iteration)
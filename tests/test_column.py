@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+
+from chainerboard.column import Column
+
+
+def test_column():
+    column = Column(capacity=1)
+    for i in range(5):
+        column.append(i)
+    column.append(None)
+    assert 6 == len(column)
+    assert [0., 1., 2., 3., 4.] == list(column[:5])
+    assert np.isnan(column[5])
+
+    column.truncate(2)
+    column.extend([5, 6])
+    assert [0., 1., 5., 6.] == list(column.view())
+    assert np.float64 == column.view().dtype
+
+
+def test_column_2d():
+    column = Column(capacity=1, width=3)
+    column.append([0., 1., 2.])
+    column.append([3., None, 5.])
+    view = column.view()
+    column.truncate(1)
+    column.extend([[6., 7., 8.], [9., 10., 11.]])
+    assert (3, 3) == column.view().shape
+    assert [1., 7., 10.] == list(column[:, 1])
+    # views taken before truncation are not overwritten
+    assert 3. == view[1, 0] and np.isnan(view[1, 1])
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+from chainerboard.name_index import NameIndex, NameTrie
+
+
+def test_trie():
+    names = ['main/loss', 'main/l1/W/data/min', 'main/l10/W/data/min',
+             'main/l1/b/data/min', 'validation/main/loss', 'main']
+    trie = NameTrie()
+    for name in names:
+        old = trie
+        trie = trie.add(name)
+        # older tries are not modified
+        assert name not in old
+    assert trie is trie.add('main/loss')
+    assert len(names) == len(trie)
+    assert sorted(names) == sorted(trie)
+    assert 'main/l1' not in trie
+
+    assert ['main/l1/W/data/min', 'main/l1/b/data/min',
+            'main/l10/W/data/min'] == list(trie.names('main/l1'))
+    assert ['main/l1/W/data/min', 'main/l1/b/data/min'] == list(
+        trie.names('main/l1/'))
+    assert 3 == trie.count('main/l1')
+    assert 0 == trie.count('foo')
+
+    assert (['main/l1/b/data/min'], 3) == trie.search(
+        prefix='main/l1', offset=1, limit=1)
+    assert (['main/loss', 'validation/main/loss'], 2) == trie.search(
+        regex='loss$')
+
+
+def test_index():
+    index = NameIndex()
+    assert index.add('main/l1/W/data/min')
+    assert not index.add('main/l1/W/data/min')
+    index.update(['main/loss', 'main/myloss', 'main/lossy', 'epoch'])
+    assert {'main/l1/W/data/min'} == index.with_component('data')
+    assert {'main/loss', 'main/myloss'} == index.ending_with('loss')
+    assert {'main/loss', 'main/myloss', 'main/lossy'} == \
+        index.containing('loss')
+    assert {'main/loss'} == index.ending_with('main/loss')
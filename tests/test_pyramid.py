@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+
+from chainerboard.pyramid import Pyramid
+
+
+def _brute_force(values, start, stop, level):
+    size = 1 << level
+    mins, maxs, means = [], [], []
+    for lo in range(start - start % size, stop, size):
+        bucket = values[max(lo, start):min(lo + size, stop)]
+        bucket = bucket[np.isfinite(bucket)]
+        if len(bucket) == 0:
+            mins.append(np.nan)
+            maxs.append(np.nan)
+            means.append(np.nan)
+        else:
+            mins.append(bucket.min())
+            maxs.append(bucket.max())
+            means.append(bucket.mean())
+    return mins, maxs, means
+
+
+def _assert_query(pyramid, values, start, stop, width):
+    level, idx, mins, maxs, means = pyramid.query(start, stop, width, values)
+    assert len(idx) <= max(width, 1) or level == pyramid.n_levels - 1
+    assert start == idx[0]
+    if level == 0:
+        return
+    expected = _brute_force(values, start, stop, level)
+    # buckets of the pyramid are aligned and may cover points out of range
+    n = len(expected[0])
+    assert n == len(idx)
+    for actual, e in zip((mins, maxs, means), expected):
+        inner = slice(1, n - 1)
+        np.testing.assert_allclose(actual[inner], e[inner])
+
+
+def test_incremental_update():
+    rng = np.random.RandomState(0)
+    values = rng.randn(1000)
+    values[[10, 500, 501]] = np.nan
+    values[777] = np.inf
+    pyramid = Pyramid()
+    for n in (1, 2, 3, 64, 65, 700, 1000):
+        pyramid.update(values[:n])
+        assert n == len(pyramid)
+    assert 11 == pyramid.n_levels
+
+    level, idx, mins, maxs, means = pyramid.query(0, 1000, 1, values)
+    assert 10 == level
+    assert [0] == list(idx)
+    assert np.nanmin(values[np.isfinite(values)]) == mins[0]
+    assert np.nanmax(values[np.isfinite(values)]) == maxs[0]
+    np.testing.assert_allclose(
+        values[np.isfinite(values)].mean(), means[0])
+
+    for start, stop, width in ((0, 1000, 100), (123, 456, 10), (5, 9, 100)):
+        _assert_query(pyramid, values, start, stop, width)
+
+
+def test_truncate():
+    values = np.arange(100, dtype=np.float64)
+    pyramid = Pyramid()
+    pyramid.update(values)
+    pyramid.truncate(37, values[:37])
+    assert 37 == len(pyramid)
+    assert 7 == pyramid.n_levels
+    values = np.concatenate([values[:37], -np.arange(10.)])
+    pyramid.update(values)
+    level, idx, mins, maxs, means = pyramid.query(0, 47, 1, values)
+    assert [-9.] == list(mins)
+    assert [36.] == list(maxs)
+
+    pyramid.truncate(0, values[:0])
+    assert 0 == len(pyramid)
+    assert 1 == pyramid.n_levels
+
+
+def test_snapshot():
+    values = np.arange(50, dtype=np.float64)
+    pyramid = Pyramid()
+    pyramid.update(values)
+    snapshot = pyramid.snapshot()
+    expected = snapshot.query(0, 50, 2, values)
+
+    # rewritten and extended after the snapshot was taken
+    pyramid.truncate(10, values[:10])
+    rewritten = np.concatenate([values[:10], -np.arange(100.)])
+    pyramid.update(rewritten)
+    for e, actual in zip(expected, snapshot.query(0, 50, 2, values)):
+        np.testing.assert_array_equal(e, actual)
+    # the last bucket is incomplete and aggregated on query
+    assert [0., 32.] == list(expected[2])
+    assert [31., 49.] == list(expected[3])
+    assert 5 == expected[0]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+import json
+
+import pytest
+
+from chainerboard.exceptions import ParseError
+from chainerboard.reader import LogReader
+
+
+def _records(n, offset=0):
+    return [{'main/loss': 0.1 * i, 'iteration': i, 'epoch': i // 10}
+            for i in range(offset, offset + n)]
+
+
+def _write(path, data):
+    with io.open(str(path), 'w', encoding='utf-8') as fout:
+        fout.write(data)
+
+
+def test_read_incrementally(tmpdir):
+    path = tmpdir.join('log')
+    records = _records(3)
+    _write(path, json.dumps(records, indent=4))
+    reader = LogReader(str(path))
+    assert (0, records) == reader.read()
+    assert (3, []) == reader.read()
+
+    records += _records(2, offset=3)
+    _write(path, json.dumps(records, indent=4))
+    assert (3, records[3:]) == reader.read()
+    assert 5 == reader.n_records
+
+
+def test_read_truncated_tail(tmpdir):
+    path = tmpdir.join('log')
+    records = _records(3)
+    text = json.dumps(records, indent=4)
+    # cut in the middle of the last record
+    _write(path, text[:text.rfind('"main/loss"')])
+    reader = LogReader(str(path))
+    assert (0, records[:2]) == reader.read()
+
+    _write(path, text)
+    assert (2, records[2:]) == reader.read()
+
+    # empty file while being created
+    _write(path.dirpath().join('empty'), '')
+    assert (0, []) == LogReader(str(path.dirpath().join('empty'))).read()
+
+
+def test_read_rewritten(tmpdir):
+    path = tmpdir.join('log')
+    records = _records(3)
+    _write(path, json.dumps(records, indent=4))
+    reader = LogReader(str(path))
+    reader.read()
+
+    records = _records(4)
+    records[2]['main/loss'] = 100.
+    _write(path, json.dumps(records, indent=4))
+    assert (0, records) == reader.read()
+
+
+def test_read_invalid(tmpdir):
+    path = tmpdir.join('log')
+    _write(path, '{"main/loss": 0.1}')
+    with pytest.raises(ParseError):
+        LogReader(str(path)).read()
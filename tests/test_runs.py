@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import io
+import json
+import os
+
+import pytest
+
+from chainerboard.cache import TimelineCache
+from chainerboard.runs import RunPattern, RunRegistry
+from chainerboard.timeline_handler import TimelineHandler
+
+
+def _write_log(path, n):
+    records = [{'main/loss': 0.1 * i, 'iteration': i, 'epoch': 0}
+               for i in range(n)]
+    with io.open(str(path), 'w', encoding='utf-8') as fout:
+        fout.write(json.dumps(records))
+
+
+@pytest.fixture
+def result(tmpdir):
+    for name, n in (('a', 2), ('b', 3), ('c/d', 4)):
+        d = tmpdir.join('result', *name.split('/'))
+        d.ensure(dir=True)
+        _write_log(d.join('log'), n)
+    tmpdir.join('result', 'a', 'other').write('')
+    return tmpdir.join('result')
+
+
+def test_run_pattern(result):
+    pattern = RunPattern(str(result))
+    assert ['a', 'b', 'c/d'] == [pattern.run_id(p) for p in pattern.find()]
+    assert pattern.match(str(result.join('e', 'log')))
+    assert not pattern.match(str(result.join('a', 'other')))
+
+    pattern = RunPattern(os.path.join(str(result), '*', 'log'))
+    assert str(result) == pattern.root
+    assert ['a', 'b'] == [pattern.run_id(p) for p in pattern.find()]
+    assert not pattern.match(str(result.join('c', 'd', 'log')))
+
+
+def test_run_registry(result):
+    registry = RunRegistry(n_workers=2, max_loaded=2, interval=0.1)
+    registry.discover(RunPattern(str(result)))
+    assert 3 == len(registry)
+    assert not registry.is_loaded('a')
+    with pytest.raises(KeyError):
+        registry.get('x')
+
+    handler = registry.get('b')
+    assert [0, 1, 2] == list(handler.events['main/loss'].iteration)
+    assert handler is registry.get('b')
+
+    # modification of loaded runs is parsed
+    version = handler.version
+    _write_log(result.join('b', 'log'), 5)
+    assert registry.notify(str(result.join('b', 'log')))
+    assert version != handler.wait_for_change(version, timeout=10.)
+    assert 5 == len(handler.events['main/loss'])
+    assert not registry.notify(str(result.join('a', 'other')))
+
+    # least recently viewed runs are unloaded
+    registry.get('a')
+    registry.get('c/d')
+    assert not registry.is_loaded('b')
+    # waiters of unloaded runs are woken up instead of waiting forever
+    assert handler.closed
+    assert handler.version == handler.wait_for_change(handler.version)
+    assert registry.is_loaded('a') and registry.is_loaded('c/d')
+    assert handler is not registry.get('b')
+    registry.close()
+
+
+def test_run_registry_interval(result):
+    registry = RunRegistry(n_workers=2, interval=0.5)
+    registry.discover(RunPattern(str(result)))
+    handler = registry.get('a')
+    version = handler.version
+
+    # bursts of modifications are loaded once after the interval
+    _write_log(result.join('a', 'log'), 5)
+    for _ in range(3):
+        assert registry.notify(str(result.join('a', 'log')))
+    assert version == handler.wait_for_change(version, timeout=0.2)
+    assert version != handler.wait_for_change(version, timeout=10.)
+    assert 5 == len(handler.events['main/loss'])
+    assert 3 == registry.n_requests
+    assert 1 == registry.n_loads
+    assert 2 == registry.n_collapsed
+    registry.close()
+
+
+def _cached_length(path, cache_dir):
+    handler = TimelineHandler()
+    TimelineCache(str(path), cache_dir).restore(handler)
+    return len(handler.events['main/loss'])
+
+
+def test_run_registry_cache(result, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    registry = RunRegistry(n_workers=2, max_loaded=1, interval=0.,
+                           use_cache=True, cache_dir=cache_dir)
+    registry.discover(RunPattern(str(result)))
+    for name, n in (('a', 5), ('b', 6)):
+        handler = registry.get(name)
+        path = result.join(name, 'log')
+        assert 2 <= _cached_length(path, cache_dir)
+
+        # saves within the interval are deferred
+        version = handler.version
+        _write_log(path, n)
+        registry.notify(str(path))
+        assert version != handler.wait_for_change(version, timeout=10.)
+        assert n != _cached_length(path, cache_dir)
+
+    # and made on unloading and on closing
+    registry.close()
+    assert 5 == _cached_length(result.join('a', 'log'), cache_dir)
+    assert 6 == _cached_length(result.join('b', 'log'), cache_dir)
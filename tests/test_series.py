@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import numpy as np
+import pytest
+
+from chainerboard import series
+
+
+def test_minmax_downsample():
+    x = np.arange(20.)
+    y = np.sin(x)
+    y[7] = np.nan
+    y[8] = np.inf
+    xs, ys = series.minmax_downsample(x, y, 9)
+    assert [2., 5., 7., 11., 13., 14., 17.] == list(xs)
+    assert np.isnan(ys[2])
+    assert y[2] == ys[0]
+
+    # constant bucket results in a single point
+    xs, ys = series.minmax_downsample(np.arange(10.), np.ones(10), 6)
+    assert [0., 5.] == list(xs)
+
+    # nothing to do for short series
+    xs, ys = series.minmax_downsample(x, y, 20)
+    assert x is xs
+
+    xs, ys = series.minmax_downsample(
+        np.arange(1e5), np.random.randn(100000), 1000)
+    assert len(xs) <= 1000
+    assert np.all(np.diff(xs) > 0)
+
+
+def test_minmax_indices_few_points():
+    y = np.array([3., 1., 2., 5., 4.])
+    assert [1, 3] == list(series.minmax_indices(y, 2))
+    assert [1] == list(series.minmax_indices(y, 1))
+    y[:3] = np.nan
+    assert [0, 3] == list(series.minmax_indices(y, 2))
+    with pytest.raises(ValueError):
+        series.minmax_indices(y, 0)
+
+
+def test_moving_average():
+    y = np.array([1., 2., 3., 4., np.nan, 5., 6., 7., 8.])
+    ret = series.moving_average(y, 3)
+    np.testing.assert_equal(
+        [np.nan, 2., 3., np.nan, np.nan, np.nan, 6., 7., np.nan], ret)
+    np.testing.assert_equal(y[np.isfinite(y)],
+                            series.moving_average(y, 1)[np.isfinite(y)])
+    assert np.isnan(series.moving_average(y[:2], 3)).all()
+
+
+def test_exponential_moving_average():
+    y = np.array([1., 3., np.inf, 2., 4.])
+    ret = series.exponential_moving_average(y, 0.5)
+    np.testing.assert_equal([1., 2., np.nan, 2., 3.], ret)
+    ret = series.exponential_moving_average(y[3:], 0.5, initial=0.)
+    np.testing.assert_equal([1., 2.5], ret)
+
+    # long series are computed by blocks
+    y = np.random.RandomState(0).randn(10000)
+    ret = series.exponential_moving_average(y, 0.01)
+    expected = y[0]
+    for v in y[1:]:
+        expected = 0.01 * v + 0.99 * expected
+    np.testing.assert_allclose(expected, ret[-1])
+
+
+def test_smoother():
+    y = np.random.RandomState(0).randn(100)
+    y[[10, 50]] = np.nan
+    for spec, expected in (('ma:5', series.moving_average(y, 5)),
+                           ('ema:0.3',
+                            series.exponential_moving_average(y, 0.3))):
+        smoother = series.Smoother.from_spec(spec)
+        for n in (1, 3, 10, 11, 12, 60, 100):
+            ret = smoother.update(y[:n])
+        np.testing.assert_allclose(expected, ret)
+
+    for spec in ('ma', 'ma:0', 'ema:2', 'median:3'):
+        with pytest.raises(ValueError):
+            series.Smoother.from_spec(spec)
+
+
+def test_band_downsample():
+    x = np.arange(10.)
+    bands = np.stack([-x, x / 2., x], axis=1)
+    bands[4, 0] = np.nan
+    xs, ret = series.band_downsample(x, bands, 3)
+    assert [0., 4., 8.] == list(xs)
+    np.testing.assert_equal([[-3., 0.75, 3.], [-7., 2.75, 7.],
+                             [-9., 4.25, 9.]], ret)
+
+    # nothing to do for short series
+    xs, ret = series.band_downsample(x, bands, 10)
+    assert x is xs
+
+
+def test_band_density():
+    x = np.arange(6.)
+    bands = np.stack([x, x + 1, x + 2], axis=1)
+    bands[5] = np.nan
+    xs, ys, grid = series.band_density(x, bands, [0., 0.5, 1.], 3, 4)
+    assert [0., 2., 4.] == list(xs)
+    np.testing.assert_allclose([0.75, 2.25, 3.75, 5.25], ys)
+    np.testing.assert_allclose([[0.5, 0., 0.], [0.5, 0.25, 0.],
+                                [0., 0.625, 0.25], [0., 0.125, 0.75]], grid)
+
+    # computed in chunks of whole buckets
+    _, _, chunked = series.band_density(x, bands, [0., 0.5, 1.], 3, 4,
+                                        chunk_size=1)
+    np.testing.assert_allclose(grid, chunked)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import copy
+import io
+import json
+import threading
+
+import numpy as np
+
+from chainerboard.reader import LogReader
+from chainerboard.timeline_handler import TimelineHandler
+
+
+def _records(n, offset=0):
+    return [{'main/loss': 0.1 * i, 'main/accuracy': 0.01 * i,
+             'iteration': i, 'epoch': i // 10, 'elapsed_time': 1.5 * i}
+            for i in range(offset, offset + n)]
+
+
+def test_update_idempotent():
+    logs = _records(5)
+    handler = TimelineHandler()
+    handler.update(copy.deepcopy(logs))
+    session_id = handler.session_id
+    digest = handler.digest
+    handler.update(copy.deepcopy(logs))
+    assert session_id == handler.session_id
+    assert digest == handler.digest
+    assert [0, 1, 2, 3, 4] == list(handler.events['main/loss'].iteration)
+
+    # appending only the tail
+    handler.update(_records(2, offset=5), start=5)
+    assert session_id == handler.session_id
+    assert 7 == len(handler.events['main/loss'].value)
+
+
+def test_find_divergence():
+    logs = _records(5)
+    handler = TimelineHandler()
+    handler.update(logs)
+    assert handler.find_divergence(_records(6)) is None
+    assert 3 == handler.find_divergence(_records(3))
+    rewritten = _records(5)
+    rewritten[2]['main/loss'] = 10.
+    assert 2 == handler.find_divergence(rewritten)
+    assert 2 == handler.find_divergence(rewritten[2:], start=2)
+
+
+def test_update_rewritten():
+    handler = TimelineHandler()
+    handler.update(_records(5))
+    session_id = handler.session_id
+    loss_hash = handler.events['main/loss'].state_hash
+
+    # resumed trainer rewrote the last records
+    logs = _records(4)
+    logs[3]['main/accuracy'] = 1.
+    del logs[3]['main/loss']
+    handler.update(logs)
+    assert session_id == handler.session_id
+    assert [0, 1, 2] == list(handler.events['main/loss'].iteration)
+    assert loss_hash != handler.events['main/loss'].state_hash
+    assert 1. == handler.events['main/accuracy'].value[-1]
+
+    # timelines without affected points keep their state
+    handler.update(_records(2, offset=4), start=4)
+    loss_hash = handler.events['main/loss'].state_hash
+    accuracy_hash = handler.events['main/accuracy'].state_hash
+    logs = _records(6)
+    logs[3]['main/accuracy'] = 1.
+    del logs[3]['main/loss']
+    logs[5]['main/accuracy'] = 0.
+    handler.update(logs)
+    assert loss_hash == handler.events['main/loss'].state_hash
+    assert accuracy_hash != handler.events['main/accuracy'].state_hash
+
+
+def test_shared_time_axis():
+    logs = _records(4)
+    del logs[2]['main/accuracy']
+    handler = TimelineHandler()
+    handler.update(logs)
+    loss = handler.events['main/loss']
+    accuracy = handler.events['main/accuracy']
+    assert [0, 1, 2, 3] == list(loss.rows)
+    assert [0, 1, 3] == list(accuracy.rows)
+    assert [0, 1, 3] == list(accuracy.iteration)
+    assert [0., 1.5, 4.5] == list(accuracy.elapsed_time)
+    # timelines with values for every record take views of the axis
+    assert np.shares_memory(loss.iteration, handler._axis.iteration)
+    assert np.shares_memory(loss.epoch, handler._axis.epoch)
+    # sparse timelines gather their rows instead
+    assert not np.shares_memory(accuracy.iteration, handler._axis.iteration)
+
+
+def test_update_tensors():
+    logs = _records(3)
+    for i, log in enumerate(logs):
+        log['main/correct'] = i
+        log['main/total'] = 4
+        for k in ('percentile/0', 'percentile/1', 'min', 'max'):
+            log['main/l1/W/data/' + k] = float(i)
+            log['main/l1/W/grad/' + k] = -float(i)
+    # records with another set of keys
+    logs += _records(2, offset=3)
+    handler = TimelineHandler()
+    handler.update(logs)
+    assert {'main/l1/W'} == set(handler.get_tensors_ids())
+    assert [0., 0.25, 0.5] == list(handler.events['main/correct'].value)
+    tensor = handler.tensors['main/l1/W']
+    assert [0, 1, 2] == list(tensor.iteration)
+    assert ['min', '0.13%', '2.28%', 'max'] == [
+        p['label'] for p in tensor.get_percentiles()]
+    assert (3, 8) == tensor.stats.shape
+    assert [0., 1., 2.] == list(tensor.get_percentiles()[0]['data'])
+    assert [0, 1, 2, 3, 4] == list(handler.events['main/loss'].iteration)
+
+
+def test_cursor():
+    handler = TimelineHandler()
+    handler.update(_records(3))
+    cursor = handler.events['main/loss'].cursor
+    handler.update(_records(2, offset=3), start=3)
+    loss = handler.events['main/loss']
+    assert 3 == loss.offset_of(cursor)
+    assert 0 == loss.offset_of(None)
+    assert 0 == loss.offset_of('invalid')
+
+    # rewritten after the cursor was given
+    logs = _records(5)
+    logs[4]['main/loss'] = 10.
+    handler.update(logs)
+    assert 0 == loss.offset_of(cursor)
+    assert 5 == loss.offset_of(loss.cursor)
+
+
+def test_wait_for_change():
+    handler = TimelineHandler()
+    version = handler.version
+    assert version == handler.wait_for_change(version, timeout=0.01)
+
+    thread = threading.Thread(target=handler.update, args=(_records(3), ))
+    thread.start()
+    assert version != handler.wait_for_change(version, timeout=10.)
+    thread.join()
+
+    # no change is notified if records are the same
+    version = handler.version
+    handler.update(_records(3))
+    assert version == handler.version
+
+
+def test_changes_since():
+    handler = TimelineHandler()
+    handler.update(_records(3))
+    v1 = handler.version
+    assert (['main/accuracy', 'main/loss'], ['main/accuracy', 'main/loss']) \
+        == handler.changes_since(0, 'events')
+    assert ([], []) == handler.changes_since(v1, 'events')
+    assert ([], []) == handler.changes_since(0, 'tensors')
+
+    logs = _records(5)
+    logs[3]['main/lr'] = 0.1
+    del logs[4]['main/accuracy']
+    handler.update(logs)
+    assert (['main/accuracy', 'main/loss', 'main/lr'], ['main/lr']) == \
+        handler.changes_since(v1, 'events')
+    v2 = handler.version
+    handler.update(_records(1, offset=5), start=5)
+    assert (['main/accuracy', 'main/loss'], []) == \
+        handler.changes_since(v2, 'events')
+    assert 1 == handler.events['main/lr'].version - v1
+
+    # the log is compacted into the last changes of graphs
+    for i in range(6, 100):
+        handler.update(_records(1, offset=i), start=i)
+    assert len(handler._change_log) < 100
+    assert ['main/accuracy', 'main/loss', 'main/lr'] == \
+        handler.changes_since(v1, 'events')[0]
+    assert ['main/lr'] == handler.changes_since(v1, 'events')[1]
+
+
+def test_snapshot():
+    handler = TimelineHandler()
+    handler.update(_records(5))
+    snapshot = handler.snapshot
+    assert handler.version == snapshot.version
+    loss = snapshot.events['main/loss']
+    expected = (list(loss.iteration), list(loss.value))
+
+    # rewritten and extended after the snapshot was taken
+    logs = _records(20)
+    for log in logs[2:]:
+        log['main/loss'] += 1.
+    handler.update(logs)
+    assert expected == (list(loss.iteration), list(loss.value))
+    level, idx, mins, maxs, means = loss.pyramid.query(0, 5, 1, loss.value)
+    assert [0.4] == list(maxs)
+    assert 20 == len(handler.snapshot.events['main/loss'])
+    assert handler.snapshot.version > snapshot.version
+
+
+def test_update_non_numeric_values():
+    logs = _records(4)
+    for log in logs:
+        log['lr_note'] = 'warmup'
+    logs[2]['main/accuracy'] = 'n/a'
+    handler = TimelineHandler()
+    handler.update(logs)
+    assert 'lr_note' not in handler.events
+    assert [0, 1, 2, 3] == list(handler.events['main/loss'].iteration)
+    # the bad value is missing like an absent key
+    assert [0, 1, 3] == list(handler.events['main/accuracy'].iteration)
+
+
+def test_update_rewritten_in_the_middle():
+    handler = TimelineHandler()
+    handler.update(_records(5))
+    logs = _records(5)
+    # only a record before the last one differs
+    logs[2]['main/loss'] = 3.
+    handler.update(logs, start=0)
+    assert 3. == handler.events['main/loss'].value[2]
+
+
+def test_load_rewritten_once(tmpdir, monkeypatch):
+    path = tmpdir.join('log')
+
+    def write(logs):
+        with io.open(str(path), 'w', encoding='utf-8') as fout:
+            fout.write(json.dumps(logs, indent=4))
+
+    write(_records(5))
+    handler = TimelineHandler()
+    handler.load(str(path))
+    reads = []
+    read = LogReader.read
+    monkeypatch.setattr(
+        LogReader, 'read', lambda self: reads.append(1) or read(self))
+    logs = _records(5)
+    logs[0]['main/loss'] = 3.
+    write(logs)
+    handler.load(str(path))
+    assert 1 == len(reads)
+    assert 3. == handler.events['main/loss'].value[0]
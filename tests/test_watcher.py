@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, \
+    unicode_literals
+
+import threading
+import time
+
+from chainerboard.watcher import BackgroundLoader
+
+
+def test_background_loader_collapses_requests():
+    calls = []
+    started = threading.Event()
+
+    def load():
+        calls.append(time.time())
+        started.set()
+        time.sleep(0.05)
+
+    loader = BackgroundLoader(load, interval=0.1)
+    loader.start()
+    loader.request()
+    assert started.wait(1.)
+    # burst of events while loading and within the interval
+    for _ in range(10):
+        loader.request()
+    time.sleep(0.4)
+    loader.stop()
+
+    assert 2 == len(calls)
+    assert 0.1 <= calls[1] - calls[0]
+    assert 11 == loader.n_requests
+    assert 9 == loader.n_collapsed